@@ -1,16 +1,23 @@
 import argparse
 
 from lib.hybrid_search import rrf_search_command
+from lib.models import get_genai_client
+from lib.search_client import request_search
+from lib.search_utils import SEARCH_SERVER_URL
 
 from dotenv import load_dotenv
-from google import genai
 import os
 
 load_dotenv()
 api_key = os.environ.get("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
 model = "gemini-2.0-flash-001"
 
+def rrf_search(query, server=None):
+    # with --server the search runs in the warm search server process
+    if server:
+        return request_search("rrf_search", {"query": query}, server)
+    return rrf_search_command(query)
+
 def main():
     parser = argparse.ArgumentParser(description="Retrieval Augmented Generation CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
@@ -28,12 +35,15 @@ def main():
     question_parser = subparsers.add_parser("question", help="Perform Citations RAG (search + generate answer)")
     question_parser.add_argument("query", type=str, help="Search query for RAG")
 
+    for search_parser in (rag_parser, summarize_parser, citations_parser, question_parser):
+        search_parser.add_argument("--server", nargs="?", const=SEARCH_SERVER_URL, default=None, metavar="URL", help=f"Forward the search to a running search server (default URL: {SEARCH_SERVER_URL})")
+
     args = parser.parse_args()
 
     match args.command:
         case "rag":
             query = args.query
-            result = rrf_search_command(args.query)
+            result = rrf_search(args.query, args.server)
             for i, res in enumerate(result["results"], 1):
                 print(f"{i}. {res['title']}")
                 if "individual_score" in res:
@@ -65,12 +75,12 @@ def main():
 
             Provide a comprehensive answer that addresses the query:"""
 
-            response = client.models.generate_content(model=model, contents=prompt)
+            response = get_genai_client(api_key).models.generate_content(model=model, contents=prompt)
             print(response.text)
 
         case "summarize":
             query = args.query
-            result = rrf_search_command(args.query)
+            result = rrf_search(args.query, args.server)
             for i, res in enumerate(result["results"], 1):
                 print(f"{i}. {res['title']}")
                 if "individual_score" in res:
@@ -105,12 +115,12 @@ def main():
             """
 
 
-            response = client.models.generate_content(model=model, contents=prompt)
+            response = get_genai_client(api_key).models.generate_content(model=model, contents=prompt)
             print(response.text)
 
         case "citations":
             query = args.query
-            result = rrf_search_command(args.query)
+            result = rrf_search(args.query, args.server)
             for i, res in enumerate(result["results"], 1):
                 print(f"{i}. {res['title']}")
                 if "individual_score" in res:
@@ -154,12 +164,12 @@ def main():
                 Answer:"""
 
 
-            response = client.models.generate_content(model=model, contents=prompt)
+            response = get_genai_client(api_key).models.generate_content(model=model, contents=prompt)
             print(response.text)
         
         case "question":
             query = args.query
-            result = rrf_search_command(args.query)
+            result = rrf_search(args.query, args.server)
             for i, res in enumerate(result["results"], 1):
                 print(f"{i}. {res['title']}")
                 if "individual_score" in res:
@@ -200,7 +210,7 @@ def main():
                     Answer:"""
 
 
-            response = client.models.generate_content(model=model, contents=prompt)
+            response = get_genai_client(api_key).models.generate_content(model=model, contents=prompt)
             print(response.text)
         
         case _:
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+import argparse
+import math
+import os
+import subprocess
+import sys
+import time
+
+from lib.doc_store import load_doc_store
+from lib.search_utils import (
+    CHUNK_AGGREGATIONS,
+    DEFAULT_CHUNK_AGGREGATION,
+    DEFAULT_SEARCH_LIMIT,
+    IMPORT_TIME_BUDGET_MS,
+    QUANTIZATION_METHODS,
+    load_golden_dataset,
+)
+from lib.semantic_search import ChunkedSemanticSearch, normalize_embeddings
+
+CLI_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_MODULES = ("torch", "sentence_transformers", "google.genai")
+
+# commands that must start without loading a model or the Gemini SDK
+STARTUP_COMMANDS = [
+    ["keyword_search_cli.py", "bm25search", "startup check"],
+    ["hybrid_search_cli.py", "--help"],
+    ["semantic_search_cli.py", "--help"],
+    ["augmented_generation_cli.py", "--help"],
+]
+
+
+def load_benchmark_queries(queries: list[str]) -> list[str]:
+    if queries:
+        return queries
+    return [test_case["query"] for test_case in load_golden_dataset()["test_cases"]]
+
+
+def ann_benchmark(
+    queries: list[str],
+    limit: int,
+    nprobes: list[int],
+    chunks: bool,
+    n_lists: int | None,
+) -> None:
+    searcher = ChunkedSemanticSearch()
+    movies = load_doc_store()
+    if chunks:
+        searcher.load_or_create_chunk_embeddings(movies)
+        ann_index = searcher.load_or_create_chunk_ann_index(n_lists)
+
+        def top_rows(query_embedding, nprobe):
+            return searcher.top_movie_rows(query_embedding, limit, nprobe=nprobe)[0]
+
+    else:
+        searcher.load_or_create_embeddings(movies)
+        ann_index = searcher.load_or_create_ann_index(n_lists)
+
+        def top_rows(query_embedding, nprobe):
+            return searcher.top_rows(query_embedding, limit, nprobe)[0]
+
+    query_embeddings = [
+        normalize_embeddings(searcher.generate_embedding(query)) for query in queries
+    ]
+
+    start = time.perf_counter()
+    exact = [set(top_rows(q, None).tolist()) for q in query_embeddings]
+    exact_time = time.perf_counter() - start
+
+    print(
+        f"{'chunks' if chunks else 'movies'}: {ann_index.n_rows} rows in "
+        f"{ann_index.n_lists} lists, {len(queries)} queries, recall@{limit}"
+    )
+    print(f"exact:      {exact_time / len(queries) * 1000:.3f} ms/query")
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [set(top_rows(q, nprobe).tolist()) for q in query_embeddings]
+        ann_time = time.perf_counter() - start
+        scanned = sum(len(ann_index.candidates(q, nprobe)) for q in query_embeddings)
+        recall = sum(len(e & f) for e, f in zip(exact, found)) / max(
+            1, sum(len(e) for e in exact)
+        )
+        print(
+            f"nprobe={nprobe:<4} {ann_time / len(queries) * 1000:.3f} ms/query, "
+            f"recall {recall:.3f}, "
+            f"scanned {scanned / (len(queries) * ann_index.n_rows):.1%} of rows"
+        )
+
+
+def quantization_benchmark(
+    queries: list[str],
+    limit: int,
+    methods: list[str],
+    chunks: bool,
+    aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+) -> None:
+    searcher = ChunkedSemanticSearch()
+    movies = load_doc_store()
+    if chunks:
+        embeddings = searcher.load_or_create_chunk_embeddings(movies)
+
+        def top_rows(query_embedding):
+            rows, scores, _ = searcher.top_movie_rows(
+                query_embedding, limit, aggregation
+            )
+            return dict(zip(rows.tolist(), scores.tolist()))
+
+    else:
+        embeddings = searcher.load_or_create_embeddings(movies)
+
+        def top_rows(query_embedding):
+            rows, scores = searcher.top_rows(query_embedding, limit)
+            return dict(zip(rows.tolist(), scores.tolist()))
+
+    query_embeddings = [
+        normalize_embeddings(searcher.generate_embedding(query)) for query in queries
+    ]
+
+    start = time.perf_counter()
+    exact = [top_rows(q) for q in query_embeddings]
+    exact_time = time.perf_counter() - start
+
+    print(
+        f"{'chunks' if chunks else 'movies'}: {len(embeddings)} rows, "
+        f"{len(queries)} queries, recall@{limit}"
+    )
+    print(
+        f"float32: {embeddings.nbytes / 2**20:.2f} MiB, "
+        f"{exact_time / len(queries) * 1000:.3f} ms/query"
+    )
+    for method in methods:
+        if chunks:
+            quantized = searcher.load_or_create_chunk_quantized(method)
+        else:
+            quantized = searcher.load_or_create_quantized(method)
+        start = time.perf_counter()
+        found = [top_rows(q) for q in query_embeddings]
+        quantized_time = time.perf_counter() - start
+        recall = sum(len(e.keys() & f.keys()) for e, f in zip(exact, found)) / max(
+            1, sum(len(e) for e in exact)
+        )
+        # results that are re-scored must carry the exact path's score; for
+        # chunks that means every chunk of the movie was re-scored
+        mismatched = sum(
+            not math.isclose(e[row], f[row], abs_tol=1e-6)
+            for e, f in zip(exact, found)
+            for row in e.keys() & f.keys()
+        )
+        print(
+            f"{method + ':':<8} {quantized.nbytes / 2**20:.2f} MiB "
+            f"({embeddings.nbytes / quantized.nbytes:.0f}x smaller), "
+            f"{quantized_time / len(queries) * 1000:.3f} ms/query, "
+            f"recall {recall:.3f}, {mismatched} scores differ from exact"
+        )
+
+
+def profile_imports(command: list[str]) -> list[tuple[int, str, int]]:
+    """(depth, module, cumulative microseconds) for every import `command` makes."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        cwd=CLI_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise ValueError(f"{' '.join(command)} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # one separator space, then two spaces per level of nesting
+        module = name[1:]
+        depth = (len(module) - len(module.lstrip())) // 2
+        imports.append((depth, module.strip(), int(cumulative)))
+    return imports
+
+
+def startup_benchmark(budget_ms: float) -> bool:
+    """Report import time per command; False if any is over budget or loads a model."""
+    ok = True
+    for command in STARTUP_COMMANDS:
+        imports = profile_imports(command)
+        top_level = [(module, us) for depth, module, us in imports if depth == 0]
+        total_ms = sum(us for _, us in top_level) / 1000
+        loaded_models = sorted(
+            {
+                model
+                for _, module, _ in imports
+                for model in MODEL_MODULES
+                if module == model or module.startswith(f"{model}.")
+            }
+        )
+
+        over_budget = total_ms > budget_ms
+        status = "FAIL" if over_budget or loaded_models else "ok"
+        print(f"[{status}] {' '.join(command)}: {total_ms:.0f} ms of imports")
+        slowest = sorted(top_level, key=lambda item: item[1], reverse=True)[:3]
+        for module, us in slowest:
+            print(f"    {us / 1000:8.1f} ms  {module}")
+        if over_budget:
+            print(f"    over the {budget_ms:.0f} ms budget")
+        if loaded_models:
+            print(f"    imports {', '.join(loaded_models)}")
+        ok = ok and status == "ok"
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search Benchmark CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    ann_parser = subparsers.add_parser(
+        "ann", help="Measure IVF ANN recall@k and latency against the exact scan"
+    )
+    ann_parser.add_argument(
+        "queries",
+        type=str,
+        nargs="*",
+        help="Queries to run (default: golden dataset queries)",
+    )
+    ann_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Top-k to retrieve"
+    )
+    ann_parser.add_argument(
+        "--nprobe",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="Numbers of lists to scan",
+    )
+    ann_parser.add_argument(
+        "--chunks", action="store_true", help="Benchmark the chunk index"
+    )
+    ann_parser.add_argument(
+        "--n-lists",
+        type=int,
+        default=None,
+        help="Lists to build if the index is missing (default: sqrt of rows)",
+    )
+
+    quantization_parser = subparsers.add_parser(
+        "quantization",
+        help="Measure memory and recall@k of quantized scans with re-scoring",
+    )
+    quantization_parser.add_argument(
+        "queries",
+        type=str,
+        nargs="*",
+        help="Queries to run (default: golden dataset queries)",
+    )
+    quantization_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Top-k to retrieve"
+    )
+    quantization_parser.add_argument(
+        "--methods",
+        choices=QUANTIZATION_METHODS,
+        nargs="+",
+        default=list(QUANTIZATION_METHODS),
+        help="Quantization methods to compare",
+    )
+    quantization_parser.add_argument(
+        "--chunks", action="store_true", help="Benchmark the chunk embeddings"
+    )
+    quantization_parser.add_argument(
+        "--aggregation",
+        choices=CHUNK_AGGREGATIONS,
+        default=DEFAULT_CHUNK_AGGREGATION,
+        help="How --chunks combines chunk scores into a movie score",
+    )
+
+    startup_parser = subparsers.add_parser(
+        "startup",
+        help="Profile CLI imports with -X importtime; fail if a light command "
+        "loads a model or exceeds its budget",
+    )
+    startup_parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=IMPORT_TIME_BUDGET_MS,
+        help="Import time allowed per command",
+    )
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "ann":
+            queries = load_benchmark_queries(args.queries)
+            ann_benchmark(queries, args.limit, args.nprobe, args.chunks, args.n_lists)
+        case "quantization":
+            queries = load_benchmark_queries(args.queries)
+            quantization_benchmark(
+                queries, args.limit, args.methods, args.chunks, args.aggregation
+            )
+        case "startup":
+            if not startup_benchmark(args.budget_ms):
+                sys.exit(1)
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,15 @@ import json
 import os
 
 from dotenv import load_dotenv
-from google import genai
 
+from .doc_store import load_doc_store
 from .hybrid_search import HybridSearch
-from .search_utils import (
-    load_golden_dataset,
-    load_movies,
-)
+from .models import get_genai_client
+from .search_utils import load_golden_dataset
 from .semantic_search import SemanticSearch
 
 load_dotenv()
 api_key = os.environ.get("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
 model = "gemini-2.0-flash-001"
 
 
@@ -46,7 +43,7 @@ def f1_score(precision: float, recall: float) -> float:
 
 
 def evaluate_command(limit: int = 5) -> dict:
-    movies = load_movies()
+    movies = load_doc_store()
     golden_data = load_golden_dataset()
     test_cases = golden_data["test_cases"]
 
@@ -61,10 +58,9 @@ def evaluate_command(limit: int = 5) -> dict:
         relevant_docs = set(test_case["relevant_docs"])
         search_results = hybrid_search.rrf_search(query, k=60, limit=limit)
         retrieved_docs = []
-        for result in search_results:
-            title = result.get("title", "")
-            if title:
-                retrieved_docs.append(title)
+        for hit in search_results:
+            if hit.title:
+                retrieved_docs.append(hit.title)
 
         precision = precision_at_k(retrieved_docs, relevant_docs, limit)
         recall = recall_at_k(retrieved_docs, relevant_docs, limit)
@@ -115,7 +111,9 @@ def llm_judge_results(query: str, results: list[dict]) -> list[int]:
 
         [2, 0, 3, 2, 0, 1]"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = get_genai_client(api_key).models.generate_content(
+        model=model, contents=prompt
+    )
     ranking_text = (response.text or "").strip()
     scores = json.loads(ranking_text)
 
@@ -7,6 +7,25 @@ from lib.hybrid_search import (
 )
 
 from lib.reranking import evaluate
+from lib.search_client import request_search
+from lib.search_utils import SEARCH_SERVER_URL
+
+
+def leg_timeouts(args) -> dict:
+    return {"bm25": args.bm25_timeout, "semantic": args.semantic_timeout}
+
+
+def print_depth(result: dict) -> None:
+    depth = result["depth"]
+    print(f"Candidate depth: {depth['depth']} per leg ({depth['rounds']} rounds)")
+
+
+def print_degraded_legs(result: dict) -> None:
+    if result["degraded_legs"]:
+        print(
+            f"Warning: {', '.join(result['degraded_legs'])} search timed out; "
+            "showing results from the remaining leg only\n"
+        )
 
 
 def main() -> None:
@@ -33,6 +52,26 @@ def main() -> None:
     weighted_parser.add_argument(
         "--limit", type=int, default=5, help="Number of results to return (default=5)"
     )
+    weighted_parser.add_argument(
+        "--server",
+        nargs="?",
+        const=SEARCH_SERVER_URL,
+        default=None,
+        metavar="URL",
+        help=f"Forward to a running search server (default URL: {SEARCH_SERVER_URL})",
+    )
+    weighted_parser.add_argument(
+        "--bm25-timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for BM25 before returning semantic results alone",
+    )
+    weighted_parser.add_argument(
+        "--semantic-timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for semantic search before returning BM25 results alone",
+    )
 
     rrf_parser = subparsers.add_parser("rrf-search", help="Perform Reciprocal Rank Fusion search")
     rrf_parser.add_argument("query", type=str, help="Search query")
@@ -41,6 +80,26 @@ def main() -> None:
     rrf_parser.add_argument("--rerank-method",type=str,choices=["individual", "batch", "cross_encoder"],help="Reranking method",)
     rrf_parser.add_argument("--limit", type=int, default=5, help="Number of results to return (default=5)")
     rrf_parser.add_argument("--evaluate", action="store_true", help="Use LLM to evaluate the answer")
+    rrf_parser.add_argument(
+        "--server",
+        nargs="?",
+        const=SEARCH_SERVER_URL,
+        default=None,
+        metavar="URL",
+        help=f"Forward to a running search server (default URL: {SEARCH_SERVER_URL})",
+    )
+    rrf_parser.add_argument(
+        "--bm25-timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for BM25 before returning semantic results alone",
+    )
+    rrf_parser.add_argument(
+        "--semantic-timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for semantic search before returning BM25 results alone",
+    )
     args = parser.parse_args()
 
     match args.command:
@@ -49,11 +108,27 @@ def main() -> None:
             for score in normalized:
                 print(f"* {score:.4f}")
         case "weighted-search":
-            result = weighted_search_command(args.query, args.alpha, args.limit)
+            if args.server:
+                result = request_search(
+                    "weighted_search",
+                    {
+                        "query": args.query,
+                        "alpha": args.alpha,
+                        "limit": args.limit,
+                        "timeouts": leg_timeouts(args),
+                    },
+                    args.server,
+                )
+            else:
+                result = weighted_search_command(
+                    args.query, args.alpha, args.limit, leg_timeouts(args)
+                )
 
+            print_degraded_legs(result)
             print(
                 f"Weighted Hybrid Search Results for '{result['query']}' (alpha={result['alpha']}):"
             )
+            print_depth(result)
             print(
                 f"  Alpha {result['alpha']}: {int(result['alpha'] * 100)}% Keyword, {int((1 - result['alpha']) * 100)}% Semantic"
             )
@@ -69,9 +144,28 @@ def main() -> None:
                 print()
         case "rrf-search":
             print("using rrf_search")
-            result = rrf_search_command(
-                args.query, args.k, args.enhance, args.rerank_method, args.limit
-            )
+            if args.server:
+                result = request_search(
+                    "rrf_search",
+                    {
+                        "query": args.query,
+                        "k": args.k,
+                        "enhance": args.enhance,
+                        "rerank_method": args.rerank_method,
+                        "limit": args.limit,
+                        "timeouts": leg_timeouts(args),
+                    },
+                    args.server,
+                )
+            else:
+                result = rrf_search_command(
+                    args.query,
+                    args.k,
+                    args.enhance,
+                    args.rerank_method,
+                    args.limit,
+                    leg_timeouts(args),
+                )
 
             if result["enhanced_query"]:
                 print(
@@ -83,7 +177,9 @@ def main() -> None:
                     f"Reranking top {len(result['results'])} results using {result['rerank_method']} method...\n"
                 )
 
+            print_degraded_legs(result)
             print(f"Reciprocal Rank Fusion Results for '{result['query']}' (k={result['k']}):")
+            print_depth(result)
 
             for i, res in enumerate(result["results"], 1):
                 print(f"{i}. {res['title']}")
@@ -2,6 +2,7 @@
 
 import argparse
 
+from lib.ingestion import add_command, delete_command, update_command
 from lib.keyword_search import (
     bm25_idf_command,
     bm25_tf_command,
@@ -12,17 +13,50 @@ from lib.keyword_search import (
     tf_command,
     tfidf_command,
 )
-from lib.search_utils import BM25_B, BM25_K1
+from lib.search_utils import BM25_B, BM25_K1, CATALOG_HELP
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Keyword Search CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
-    subparsers.add_parser("build", help="Build the inverted index")
+    build_parser = subparsers.add_parser("build", help="Build the inverted index")
+    build_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to build the index (default=1)",
+    )
+    build_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
+
+    add_parser = subparsers.add_parser(
+        "add",
+        help="Add movies to the catalog, index and embeddings without a rebuild",
+    )
+    add_parser.add_argument(
+        "movies", type=str, help="Movies to add, in any format --catalog accepts"
+    )
+    add_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
+
+    update_parser = subparsers.add_parser(
+        "update", help="Replace movies with the same ids without a rebuild"
+    )
+    update_parser.add_argument(
+        "movies",
+        type=str,
+        help="Updated movies, in any format --catalog accepts",
+    )
+    update_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
+
+    delete_parser = subparsers.add_parser(
+        "delete", help="Remove movies by id without a rebuild"
+    )
+    delete_parser.add_argument("doc_ids", type=int, nargs="+", help="Document IDs")
+    delete_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
 
     search_parser = subparsers.add_parser("search", help="Search movies using BM25")
     search_parser.add_argument("query", type=str, help="Search query")
+    search_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
 
     tf_parser = subparsers.add_parser(
         "tf", help="Get term frequency for a given document ID and term"
@@ -64,17 +98,27 @@ def main() -> None:
         "bm25search", help="Search movies using full BM25 scoring"
     )
     bm25search_parser.add_argument("query", type=str, help="Search query")
+    bm25search_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
 
     args = parser.parse_args()
 
     match args.command:
         case "build":
             print("Building inverted index...")
-            build_command()
+            build_command(args.workers, args.catalog)
             print("Inverted index built successfully.")
+        case "add":
+            count = add_command(args.movies, args.catalog)
+            print(f"Added {count} movies.")
+        case "update":
+            count = update_command(args.movies, args.catalog)
+            print(f"Updated {count} movies.")
+        case "delete":
+            delete_command(args.doc_ids, args.catalog)
+            print(f"Deleted {len(args.doc_ids)} movies.")
         case "search":
             print("Searching for:", args.query)
-            results = search_command(args.query)
+            results = search_command(args.query, catalog_path=args.catalog)
             for i, res in enumerate(results, 1):
                 print(f"{i}. ({res['id']}) {res['title']}")
         case "tf":
@@ -98,7 +142,7 @@ def main() -> None:
             )
         case "bm25search":
             print("Searching for:", args.query)
-            results = bm25search_command(args.query)
+            results = bm25search_command(args.query, catalog_path=args.catalog)
             for i, res in enumerate(results, 1):
                 print(f"{i}. ({res['id']}) {res['title']} - Score: {res['score']:.2f}")
         case _:
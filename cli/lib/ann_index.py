@@ -0,0 +1,152 @@
+import math
+import os
+
+import numpy as np
+
+from .search_utils import ANN_KMEANS_ITERATIONS, ANN_KMEANS_SAMPLE
+
+ANN_INDEX_VERSION = 1
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = ANN_KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """Cluster unit-length rows by cosine similarity; returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > ANN_KMEANS_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), ANN_KMEANS_SAMPLE, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # re-seed empty clusters from random points so none go unused
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        updated = (sums / norms).astype(vectors.dtype)
+        if np.array_equal(updated, centroids):
+            break
+        centroids = updated
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file ANN index over L2-normalized embedding rows.
+
+    A spherical k-means coarse quantizer splits the rows into `n_lists`
+    clusters. A query scores the centroids, then only the rows in its
+    `nprobe` closest lists; raising nprobe trades latency for recall, and
+    nprobe == n_lists is an exact scan. Rows are stored grouped by list, so
+    each list is one contiguous slice of `list_rows`. `fingerprint` is that
+    of the embeddings it was saved for (see `save`), None for an unsaved one.
+    """
+
+    def __init__(
+        self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray
+    ) -> None:
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.fingerprint: str | None = None
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.list_rows)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, n_lists: int | None = None) -> "IVFIndex":
+        if len(embeddings) == 0:
+            raise ValueError("cannot build an ANN index over no embeddings")
+        if n_lists is None:
+            n_lists = round(math.sqrt(len(embeddings)))
+        n_lists = max(1, min(n_lists, len(embeddings)))
+        centroids = spherical_kmeans(embeddings, n_lists)
+        return cls.from_assignment(centroids, cls.assign(centroids, embeddings))
+
+    @classmethod
+    def from_assignment(
+        cls, centroids: np.ndarray, assignment: np.ndarray
+    ) -> "IVFIndex":
+        list_rows = np.argsort(assignment, kind="stable").astype(np.int32)
+        counts = np.bincount(assignment, minlength=len(centroids))
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(counts)
+        return cls(centroids, list_offsets, list_rows)
+
+    @staticmethod
+    def assign(centroids: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+        return np.argmax(embeddings @ centroids.T, axis=1).astype(np.int32)
+
+    def assignment(self) -> np.ndarray:
+        """List number of every row, indexed by row."""
+        assignment = np.empty(self.n_rows, dtype=np.int32)
+        assignment[self.list_rows] = np.repeat(
+            np.arange(self.n_lists, dtype=np.int32), np.diff(self.list_offsets)
+        )
+        return assignment
+
+    def add(self, embeddings: np.ndarray) -> "IVFIndex":
+        """Index with rows appended after the current ones, centroids kept."""
+        assignment = np.concatenate(
+            [self.assignment(), self.assign(self.centroids, embeddings)]
+        )
+        return self.from_assignment(self.centroids, assignment)
+
+    def keep_rows(self, rows: list[int]) -> "IVFIndex":
+        """Index over the given ascending rows, renumbered from zero."""
+        return self.from_assignment(self.centroids, self.assignment()[rows])
+
+    def candidates(self, query_embedding: np.ndarray, nprobe: int) -> np.ndarray:
+        """Sorted rows in the `nprobe` lists closest to the query."""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ query_embedding
+        if nprobe < self.n_lists:
+            probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probed = np.arange(self.n_lists)
+        rows = np.concatenate(
+            [
+                self.list_rows[self.list_offsets[i] : self.list_offsets[i + 1]]
+                for i in probed
+            ]
+        )
+        rows.sort()
+        return rows
+
+    def save(self, path: str, fingerprint: str | None = None) -> None:
+        """Write the index, recording the `fingerprint` of the embeddings it
+        covers so a load can tell whether they have changed."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            version=ANN_INDEX_VERSION,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+            fingerprint=fingerprint or "",
+        )
+        os.replace(tmp_path, path)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            if int(data["version"]) != ANN_INDEX_VERSION:
+                raise ValueError(f"unsupported ANN index format: {path}")
+            index = cls(data["centroids"], data["list_offsets"], data["list_rows"])
+            if "fingerprint" in data:
+                index.fingerprint = str(data["fingerprint"]) or None
+            return index
@@ -0,0 +1,467 @@
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+from .search_utils import DATA_PATH, DOC_STORE_PATH
+from .streaming import iter_movies
+
+DOC_STORE_MAGIC = b"BSDS"
+DOC_STORE_VERSION = 3
+
+# magic, version, n_docs, source size, source mtime_ns, content fingerprint
+HEADER = struct.Struct("<4sIQQQ32s")
+# id, title length, description length: the hashed prefix of each document
+FINGERPRINT_RECORD = struct.Struct("<qQQ")
+SECTIONS = (
+    ("ids", np.int64),
+    ("id_rows", np.int64),
+    ("title_offsets", np.uint64),
+    ("description_offsets", np.uint64),
+    ("text", np.uint8),
+    ("source_path", np.uint8),
+)
+SECTION_TABLE = struct.Struct("<" + "QQ" * len(SECTIONS))
+ALIGNMENT = 8
+# ids up to this many times the document count get a direct-address table
+DENSE_ID_FACTOR = 4
+
+
+def _pad(length: int) -> int:
+    return (-length) % ALIGNMENT
+
+
+def _offsets(lengths: list[int], start: int = 0) -> np.ndarray:
+    offsets = np.full(len(lengths) + 1, start, dtype=np.uint64)
+    offsets[1:] += np.cumsum(lengths, dtype=np.uint64)
+    return offsets
+
+
+def _hash_document(h, doc_id: int, title: bytes, description: bytes) -> None:
+    h.update(FINGERPRINT_RECORD.pack(doc_id, len(title), len(description)))
+    h.update(title)
+    h.update(description)
+
+
+def catalog_fingerprint(documents: Iterable[dict]) -> bytes:
+    """sha256 over the ids, titles and descriptions of `documents` in order.
+
+    Files derived from a catalog (the inverted index, embeddings) record it
+    so they can tell when the catalog they were built from has changed.
+    """
+    h = hashlib.sha256()
+    for doc in documents:
+        _hash_document(
+            h,
+            doc["id"],
+            doc["title"].encode("utf-8"),
+            doc["description"].encode("utf-8"),
+        )
+    return h.digest()
+
+
+def id_row_table(ids: np.ndarray) -> np.ndarray:
+    """Direct-address id -> row table (-1 where unused), or an empty array
+    when the ids are too sparse for one.
+
+    A later row wins for a repeated id, matching appends that re-add an
+    updated document before the old row is compacted away.
+    """
+    if len(ids) == 0 or ids.min() < 0:
+        return np.zeros(0, dtype=np.int64)
+    size = int(ids.max()) + 1
+    if size > DENSE_ID_FACTOR * len(ids) + 1024:
+        return np.zeros(0, dtype=np.int64)
+    table = np.full(size, -1, dtype=np.int64)
+    table[ids] = np.arange(len(ids))
+    return table
+
+
+class DocStore:
+    """Columnar catalog: ids plus titles and descriptions as offsets into one
+    UTF-8 blob (all titles, then all descriptions).
+
+    Opened from disk, every column is a view into an mmap'd file, so loading
+    parses only a header and processes share the pages, and `source_path` is
+    the catalog file it was built from. Text is decoded per field on access;
+    indexing a row still gives the `{"id", "title", "description"}` dict the
+    rest of the code expects.
+
+    Changes are append-only: `append` adds rows after the columns and
+    `delete` tombstones a row, so row numbers stay stable for the embedding
+    matrices aligned with them until `compact` drops the tombstoned rows.
+    A store returned by `load_doc_store` is shared by the whole process and
+    `frozen`; `writable` gives a copy that shares its columns. `fingerprint`
+    identifies the content of the live rows (see `catalog_fingerprint`).
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        title_offsets: np.ndarray,
+        description_offsets: np.ndarray,
+        text,
+        id_rows: np.ndarray | None = None,
+        source_path: str | None = None,
+    ) -> None:
+        self.ids = ids
+        self.title_offsets = title_offsets
+        self.description_offsets = description_offsets
+        self.text = text
+        self.id_rows = id_row_table(ids) if id_rows is None else id_rows
+        self.source_path = source_path
+        self.frozen = False
+        self.deleted_rows: set[int] = set()
+        self._fingerprint: bytes | None = None
+        self._sparse_rows: dict[int, int] | None = None
+        # appended rows, after the columns, and the row of each appended id
+        self._appended: list[dict] = []
+        self._appended_rows: dict[int, int] = {}
+        self._mmap = None
+        self._file = None
+
+    @classmethod
+    def from_documents(cls, documents) -> "DocStore":
+        titles = [doc["title"].encode("utf-8") for doc in documents]
+        descriptions = [doc["description"].encode("utf-8") for doc in documents]
+        title_offsets = _offsets([len(t) for t in titles])
+        description_offsets = _offsets(
+            [len(d) for d in descriptions], start=int(title_offsets[-1])
+        )
+        text = np.frombuffer(b"".join(titles) + b"".join(descriptions), np.uint8)
+        ids = np.array([doc["id"] for doc in documents], dtype=np.int64)
+        return cls(ids, title_offsets, description_offsets, text)
+
+    @classmethod
+    def open(cls, path: str) -> "DocStore":
+        f = open(path, "rb")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, _, _, fingerprint = HEADER.unpack_from(mm, 0)
+        if magic != DOC_STORE_MAGIC or version != DOC_STORE_VERSION:
+            raise ValueError("unsupported document store format")
+        table = SECTION_TABLE.unpack_from(mm, HEADER.size)
+        sections = {}
+        for i, (name, dtype) in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            sections[name] = np.frombuffer(
+                mm, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset
+            )
+        source_path = sections.pop("source_path").tobytes().decode("utf-8")
+        store = cls(**sections, source_path=source_path)
+        store._fingerprint = fingerprint
+        store._file = f
+        store._mmap = mm
+        return store
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self._appended)
+
+    def doc_id(self, row: int) -> int:
+        if row >= len(self.ids):
+            return self._appended[row - len(self.ids)]["id"]
+        return int(self.ids[row])
+
+    def _decode(self, offsets: np.ndarray, row: int) -> str:
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        return self.text[start:end].tobytes().decode("utf-8")
+
+    def title(self, row: int) -> str:
+        if row >= len(self.ids):
+            return self._appended[row - len(self.ids)]["title"]
+        return self._decode(self.title_offsets, row)
+
+    def description(self, row: int) -> str:
+        if row >= len(self.ids):
+            return self._appended[row - len(self.ids)]["description"]
+        return self._decode(self.description_offsets, row)
+
+    def document(self, row: int) -> dict:
+        return {
+            "id": self.doc_id(row),
+            "title": self.title(row),
+            "description": self.description(row),
+        }
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.document(i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("document row out of range")
+        return self.document(row)
+
+    def __iter__(self) -> Iterator[dict]:
+        for row in range(len(self)):
+            yield self.document(row)
+
+    def _column_row(self, doc_id: int) -> int | None:
+        if len(self.id_rows):
+            if 0 <= doc_id < len(self.id_rows):
+                row = int(self.id_rows[doc_id])
+                return row if row >= 0 else None
+            return None
+        if self._sparse_rows is None:
+            self._sparse_rows = {
+                doc_id: row for row, doc_id in enumerate(self.ids.tolist())
+            }
+        return self._sparse_rows.get(doc_id)
+
+    def row_of(self, doc_id: int) -> int | None:
+        """Row of `doc_id`, or None if it is missing or deleted."""
+        row = self._appended_rows.get(doc_id)
+        if row is None:
+            row = self._column_row(doc_id)
+        if row is None or row in self.deleted_rows:
+            return None
+        return row
+
+    def get(self, doc_id: int) -> dict | None:
+        row = self.row_of(doc_id)
+        return None if row is None else self.document(row)
+
+    def live_rows(self) -> list[int]:
+        return [row for row in range(len(self)) if row not in self.deleted_rows]
+
+    @property
+    def fingerprint(self) -> bytes:
+        if self._fingerprint is None:
+            self._fingerprint = catalog_fingerprint(
+                self.document(row) for row in self.live_rows()
+            )
+        return self._fingerprint
+
+    def _check_writable(self) -> None:
+        if self.frozen:
+            raise ValueError("shared document store is read-only; use writable()")
+
+    def writable(self) -> "DocStore":
+        """This store, or a mutable copy of it if it is frozen."""
+        return self.copy() if self.frozen else self
+
+    def copy(self) -> "DocStore":
+        """A mutable store sharing these columns; only the appended rows and
+        tombstones are copied."""
+        store = DocStore(
+            self.ids,
+            self.title_offsets,
+            self.description_offsets,
+            self.text,
+            self.id_rows,
+            self.source_path,
+        )
+        store.deleted_rows = set(self.deleted_rows)
+        store._fingerprint = self._fingerprint
+        store._sparse_rows = self._sparse_rows
+        store._appended = list(self._appended)
+        store._appended_rows = dict(self._appended_rows)
+        # keep the mapping open for as long as the copy uses it
+        store._mmap, store._file = self._mmap, self._file
+        return store
+
+    def append(self, documents: list[dict]) -> int:
+        """Add `documents` after the existing rows; returns the first new row.
+
+        An id can have only one live row, so an updated document is deleted
+        before it is appended again.
+        """
+        self._check_writable()
+        seen = set()
+        for doc in documents:
+            if self.row_of(doc["id"]) is not None or doc["id"] in seen:
+                raise ValueError(f"document {doc['id']} is already stored")
+            seen.add(doc["id"])
+        start = len(self)
+        if documents:
+            self._fingerprint = None
+        for doc in documents:
+            self._appended_rows[doc["id"]] = len(self)
+            self._appended.append(
+                {
+                    "id": doc["id"],
+                    "title": doc["title"],
+                    "description": doc["description"],
+                }
+            )
+        return start
+
+    def add_missing(self, documents: list[dict]) -> None:
+        """Append the documents whose ids have no live row yet."""
+        self.append([doc for doc in documents if self.row_of(doc["id"]) is None])
+
+    def delete(self, doc_id: int) -> int:
+        """Tombstone the live row of `doc_id` and return it."""
+        self._check_writable()
+        row = self.row_of(doc_id)
+        if row is None:
+            raise ValueError(f"document {doc_id} is not stored")
+        self.deleted_rows.add(row)
+        self._fingerprint = None
+        return row
+
+    def discard(self, doc_id: int) -> None:
+        """`delete` that does nothing when `doc_id` has no live row."""
+        if self.row_of(doc_id) is not None:
+            self.delete(doc_id)
+
+    def compact(self, rows: list[int] | None = None) -> None:
+        """Rewrite the columns in place to hold only `rows` (by default the
+        live rows), in that order, folding in the appended rows."""
+        self._check_writable()
+        live_rows = self.live_rows()
+        if rows is None:
+            rows = live_rows
+        if rows != live_rows:
+            self._fingerprint = None
+        compacted = DocStore.from_documents([self.document(row) for row in rows])
+        self.ids = compacted.ids
+        self.title_offsets = compacted.title_offsets
+        self.description_offsets = compacted.description_offsets
+        self.text = compacted.text
+        self.id_rows = compacted.id_rows
+        self.deleted_rows = set()
+        self._sparse_rows = None
+        self._appended = []
+        self._appended_rows = {}
+        self._mmap = self._file = None
+
+    def to_list(self) -> list[dict]:
+        return list(self)
+
+
+def as_doc_store(documents) -> DocStore:
+    if isinstance(documents, DocStore):
+        return documents
+    return DocStore.from_documents(documents)
+
+
+def source_signature(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_doc_store(
+    path: str,
+    documents: Iterable[dict],
+    source_path: str,
+    signature: tuple[int, int],
+) -> None:
+    """Write a store from a stream of documents read from `source_path`.
+
+    Titles and descriptions are spooled to two temporary files as they
+    arrive and copied into the text section at the end, so only the
+    fixed-width columns are held in memory.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    ids, title_lengths, description_lengths = array("q"), array("q"), array("q")
+    fingerprint = hashlib.sha256()
+    with (
+        tempfile.TemporaryFile(dir=os.path.dirname(path)) as titles,
+        tempfile.TemporaryFile(dir=os.path.dirname(path)) as descriptions,
+    ):
+        for doc in documents:
+            title = doc["title"].encode("utf-8")
+            description = doc["description"].encode("utf-8")
+            _hash_document(fingerprint, doc["id"], title, description)
+            ids.append(doc["id"])
+            title_lengths.append(titles.write(title))
+            description_lengths.append(descriptions.write(description))
+
+        ids = np.frombuffer(ids, dtype=np.int64)
+        title_offsets = _offsets(title_lengths)
+        description_offsets = _offsets(
+            description_lengths, start=int(title_offsets[-1])
+        )
+        payloads = {
+            "ids": ids.tobytes(),
+            "id_rows": id_row_table(ids).tobytes(),
+            "title_offsets": title_offsets.tobytes(),
+            "description_offsets": description_offsets.tobytes(),
+            "source_path": source_path.encode("utf-8"),
+        }
+        sizes = {name: len(payload) for name, payload in payloads.items()}
+        sizes["text"] = int(description_offsets[-1])
+
+        offset = HEADER.size + SECTION_TABLE.size
+        offset += _pad(offset)
+        table = []
+        for name, _ in SECTIONS:
+            table.extend([offset, sizes[name]])
+            offset += sizes[name]
+            offset += _pad(offset)
+
+        with open(tmp_path, "wb") as f:
+            header = HEADER.pack(
+                DOC_STORE_MAGIC,
+                DOC_STORE_VERSION,
+                len(ids),
+                *signature,
+                fingerprint.digest(),
+            )
+            written = f.write(header + SECTION_TABLE.pack(*table))
+            for name, _ in SECTIONS:
+                written += f.write(b"\0" * _pad(written))
+                if name == "text":
+                    for spool in (titles, descriptions):
+                        spool.seek(0)
+                        shutil.copyfileobj(spool, f)
+                    written += sizes["text"]
+                else:
+                    written += f.write(payloads[name])
+    os.replace(tmp_path, path)
+
+
+def read_source(path: str) -> tuple[str, tuple[int, int]] | None:
+    """The catalog path and signature a store file was built from, or None
+    if there is no readable store at `path`."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size + SECTION_TABLE.size)
+            if len(header) < HEADER.size + SECTION_TABLE.size:
+                return None
+            magic, version, _, size, mtime_ns, _ = HEADER.unpack_from(header)
+            if magic != DOC_STORE_MAGIC or version != DOC_STORE_VERSION:
+                return None
+            table = SECTION_TABLE.unpack_from(header, HEADER.size)
+            i = [name for name, _ in SECTIONS].index("source_path")
+            f.seek(table[2 * i])
+            source_path = f.read(table[2 * i + 1]).decode("utf-8")
+    except FileNotFoundError:
+        return None
+    return source_path, (size, mtime_ns)
+
+
+_stores: dict[str, tuple[tuple[str, tuple[int, int]], DocStore]] = {}
+
+
+def load_doc_store(
+    catalog_path: str | None = None, path: str = DOC_STORE_PATH
+) -> DocStore:
+    """The catalog as a shared, memory-mapped `DocStore`.
+
+    `catalog_path` is a `{"movies": [...]}` .json or a .jsonl catalog,
+    DATA_PATH by default; other catalogs are only used when passed
+    explicitly (--catalog). The catalog is streamed into a new store file
+    only when the store is missing or was built from another file or
+    version of it; otherwise this maps the existing file. Repeated calls
+    return the same store until the catalog changes.
+    """
+    if catalog_path is None:
+        catalog_path = DATA_PATH
+    source = (os.path.abspath(catalog_path), source_signature(catalog_path))
+    cached = _stores.get(path)
+    if cached is not None and cached[0] == source:
+        return cached[1]
+    if read_source(path) != source:
+        write_doc_store(path, iter_movies(source[0]), *source)
+    store = DocStore.open(path)
+    store.frozen = True
+    _stores[path] = (source, store)
+    return store
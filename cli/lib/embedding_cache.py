@@ -0,0 +1,333 @@
+import atexit
+import hashlib
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: appends there are not locked
+    fcntl = None
+
+from .models import get_sentence_transformer
+from .search_utils import (
+    EMBEDDING_CACHE_DIR,
+    QUERY_CACHE_FLUSH_ENTRIES,
+    QUERY_CACHE_FLUSH_SECONDS,
+    QUERY_CACHE_SIZE,
+)
+
+VECTORS_MAGIC = b"BSEC"
+# magic, dimension
+VECTORS_HEADER = struct.Struct("<4sI")
+
+
+def cache_file_name(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+
+
+class EmbeddingCache:
+    """Persistent text embeddings keyed by (model name, hash of the text).
+
+    `encode` only loads and runs the model for texts it has not seen before,
+    so rebuilding embeddings after a catalog change re-encodes just the new
+    or edited strings. `hits` / `misses` count texts served from the cache and
+    texts that had to be encoded.
+
+    On disk the cache is append-only: float32 vectors go to a `.vectors`
+    file that is memory-mapped for lookups and their keys to a `.keys` file,
+    one per line, so neither building nor reading it holds the cached
+    vectors in memory or rewrites the files. Appends hold an exclusive lock
+    and first pick up rows that other processes added.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR) -> None:
+        self.model_name = model_name
+        base = os.path.join(cache_dir, cache_file_name(model_name))
+        self.keys_path = f"{base}.keys"
+        self.vectors_path = f"{base}.vectors"
+        self.lock_path = f"{base}.lock"
+        # the earlier format, one .npz rewritten on every save
+        self.legacy_path = f"{base}.npz"
+        self.hits = 0
+        self.misses = 0
+        self._rows: dict[str, int] | None = None
+        self._keys_read = 0
+        self._dim: int | None = None
+        self._vectors: np.ndarray | None = None
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Read keys appended since the last refresh and remap the vectors.
+
+        Vectors are written before their keys, so every complete key line
+        has its row on disk; a partly written last line is left for later.
+        """
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_read)
+            data = f.read()
+        complete = data[: data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            self._rows[line.decode("ascii")] = len(self._rows)
+        self._keys_read += len(complete)
+        if self._dim is None:
+            with open(self.vectors_path, "rb") as f:
+                magic, self._dim = VECTORS_HEADER.unpack(f.read(VECTORS_HEADER.size))
+            if magic != VECTORS_MAGIC:
+                raise ValueError(f"unsupported embedding cache: {self.vectors_path}")
+        if self._vectors is None or len(self._vectors) < len(self._rows):
+            self._vectors = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r",
+                offset=VECTORS_HEADER.size,
+                shape=(len(self._rows), self._dim),
+            )
+
+    def _load(self) -> None:
+        if self._rows is not None:
+            return
+        self._rows = {}
+        self._refresh()
+        if not self._rows and os.path.exists(self.legacy_path):
+            with np.load(self.legacy_path) as data:
+                keys, vectors = data["keys"].tolist(), data["vectors"]
+            self._append(keys, vectors)
+            os.remove(self.legacy_path)
+
+    def _append(self, keys: list[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._locked():
+            self._refresh()
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            keys, vectors = [keys[i] for i in new], vectors[new]
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self.vectors_path, "wb") as f:
+                    f.write(VECTORS_HEADER.pack(VECTORS_MAGIC, self._dim))
+            row_bytes = 4 * self._dim
+            with open(self.vectors_path, "r+b") as f:
+                # drop rows (or keys below) whose write was interrupted
+                f.truncate(VECTORS_HEADER.size + len(self._rows) * row_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(vectors.tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.truncate(self._keys_read)
+                f.write("".join(f"{key}\n" for key in keys).encode("ascii"))
+            self._refresh()
+
+    def encode(self, texts: list[str], **encode_kwargs) -> np.ndarray:
+        """Embed `texts`, encoding only cache misses; new vectors are on disk
+        when this returns."""
+        self._load()
+        keys = [self.key(text) for text in texts]
+
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        misses = sum(1 for key in keys if key in missing)
+        self.misses += misses
+        self.hits += len(texts) - misses
+
+        if missing:
+            model = get_sentence_transformer(self.model_name)
+            new_vectors = np.asarray(
+                model.encode(list(missing.values()), **encode_kwargs)
+            )
+            self._append(list(missing), new_vectors)
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(self._vectors[[self._rows[key] for key in keys]])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query embeddings keyed by whitespace-normalized text.
+
+    With `persist` the entries are loaded from a small per-model .npz next to
+    the document embedding cache and written back at exit, and also after
+    QUERY_CACHE_FLUSH_ENTRIES new entries or QUERY_CACHE_FLUSH_SECONDS, so
+    a long-running server that is killed loses little. Repeated CLI runs
+    skip the model for queries they have already seen. Use
+    `get_query_cache` to share one instance per model and file.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = QUERY_CACHE_SIZE,
+        persist: bool = False,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+    ) -> None:
+        self.model_name = model_name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self.path = None
+        if persist:
+            name = cache_file_name(model_name)
+            self.path = os.path.join(cache_dir, f"{name}.queries.npz")
+            self._entries = self._read()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split())
+
+    def _read(self) -> OrderedDict[str, np.ndarray]:
+        entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                for key, vector in zip(data["keys"].tolist(), data["vectors"]):
+                    entries[key] = vector
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+        return entries
+
+    def save(self) -> None:
+        """Write the entries back, merged over whatever another process
+        saved since they were loaded (this process's entries count as the
+        most recently used)."""
+        with self._lock:
+            if self.path is None or not self._dirty or not self._entries:
+                return
+            entries = self._read()
+            for key, vector in self._entries.items():
+                entries.pop(key, None)
+                entries[key] = vector
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # a temporary file of its own, so processes saving at the same
+            # time never write into each other's
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix=".tmp.npz"
+            )
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    keys=np.array(list(entries), dtype=np.str_),
+                    vectors=np.stack(list(entries.values())),
+                )
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._unsaved = 0
+            self._saved_at = time.monotonic()
+
+    def _should_flush(self) -> bool:
+        return self.path is not None and (
+            self._unsaved >= QUERY_CACHE_FLUSH_ENTRIES
+            or time.monotonic() - self._saved_at >= QUERY_CACHE_FLUSH_SECONDS
+        )
+
+    def encode(self, queries: list[str]) -> np.ndarray:
+        """Embed `queries`, loading and running the model only for unseen
+        queries."""
+        keys = [self.normalize(query) for query in queries]
+        found: dict[str, np.ndarray] = {}
+        missing: dict[str, None] = {}
+        with self._lock:
+            for key in keys:
+                if key in found or key in missing:
+                    continue
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                else:
+                    missing[key] = None
+            misses = sum(1 for key in keys if key in missing)
+            self.misses += misses
+            self.hits += len(keys) - misses
+
+        if missing:
+            # encode outside the lock so other threads keep hitting the cache
+            model = get_sentence_transformer(self.model_name)
+            vectors = np.asarray(model.encode(list(missing)))
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._entries[key] = vector
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                self._dirty = True
+                self._unsaved += len(missing)
+                flush = self._should_flush()
+            if flush:
+                self.save()
+
+        return np.stack([found[key] for key in keys]).copy()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_query_caches: dict[tuple[str, str | None], QueryEmbeddingCache] = {}
+_query_caches_lock = threading.Lock()
+
+
+def get_query_cache(
+    model_name: str, persist: bool = False, cache_dir: str = EMBEDDING_CACHE_DIR
+) -> QueryEmbeddingCache:
+    """The process-wide query cache for `model_name` (and its file when
+    persisted), so every searcher shares its entries and one exit hook
+    saves each file once."""
+    key = (model_name, cache_dir if persist else None)
+    with _query_caches_lock:
+        cache = _query_caches.get(key)
+        if cache is None:
+            cache = QueryEmbeddingCache(
+                model_name, persist=persist, cache_dir=cache_dir
+            )
+            _query_caches[key] = cache
+        return cache
+
+
+@atexit.register
+def _save_query_caches() -> None:
+    for cache in list(_query_caches.values()):
+        cache.save()
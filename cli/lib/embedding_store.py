@@ -0,0 +1,280 @@
+import io
+import json
+import math
+import os
+import shutil
+import struct
+from collections.abc import Iterable
+
+import numpy as np
+
+EMBEDDING_MANIFEST_VERSION = 1
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize a vector or each row of a matrix; zero vectors stay zero.
+
+    With unit-length rows, cosine similarity against a normalized query is a
+    single matrix-vector product.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def manifest_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.manifest.json"
+
+
+def read_manifest(path: str) -> dict | None:
+    try:
+        with open(manifest_path(path), "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("version") != EMBEDDING_MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_array(path: str, array: np.ndarray) -> None:
+    """Write an .npy file to a temporary file and swap it in, so processes
+    that still have the old file memory-mapped keep a consistent view of it.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def read_npy_header(f) -> tuple[tuple[int, ...], np.dtype, tuple[int, int]]:
+    """Shape, dtype and format version of an open .npy file, leaving it at
+    the start of the data."""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if fortran_order:
+        raise ValueError(f"{f.name} is not a C-ordered array")
+    return shape, dtype, version
+
+
+def map_array_rows(path: str, rows: int) -> np.memmap:
+    """Memory-map the first `rows` rows of an .npy file, including rows
+    appended past the count its header records."""
+    with open(path, "rb") as f:
+        shape, dtype, _ = read_npy_header(f)
+        offset = f.tell()
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=offset, shape=(rows, *shape[1:])
+    )
+
+
+def append_array_rows(path: str, rows: int, new_rows: np.ndarray) -> np.memmap:
+    """Write `new_rows` after the first `rows` rows of the .npy file at
+    `path` and memory-map all of them.
+
+    Only the new rows are written. The header keeps the row count the file
+    was saved with, so processes that load it meanwhile still see exactly
+    the saved rows; `commit_array_rows` records the new count.
+    """
+    with open(path, "r+b") as f:
+        shape, dtype, _ = read_npy_header(f)
+        offset = f.tell()
+        row_bytes = dtype.itemsize * math.prod(shape[1:])
+        new_rows = np.ascontiguousarray(new_rows, dtype=dtype)
+        if (
+            rows < shape[0]
+            or os.fstat(f.fileno()).st_size < offset + rows * row_bytes
+            or new_rows.shape[1:] != shape[1:]
+        ):
+            raise ValueError(f"{path} does not hold the rows being appended to")
+        # anything past `rows` was appended but never committed
+        f.seek(offset + rows * row_bytes)
+        f.truncate()
+        f.write(new_rows.tobytes())
+    return map_array_rows(path, rows + len(new_rows))
+
+
+def _set_row_count(path: str, rows: int) -> bool:
+    """Rewrite the header of an .npy file in place for `rows` rows; False if
+    the new header would not fit in the old one."""
+    with open(path, "r+b") as f:
+        shape, dtype, version = read_npy_header(f)
+        offset = f.tell()
+        if version != (1, 0):
+            return False
+        buffer = io.BytesIO()
+        np.lib.format.write_array_header_1_0(
+            buffer,
+            {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": False,
+                "shape": (rows, *shape[1:]),
+            },
+        )
+        header = buffer.getvalue()
+        if len(header) > offset:
+            return False
+        # pad the header text so the data keeps its offset
+        header = header[:-1] + b" " * (offset - len(header)) + b"\n"
+        header = header[:8] + struct.pack("<H", offset - 10) + header[10:]
+        f.seek(0)
+        f.write(header)
+        f.truncate(offset + rows * dtype.itemsize * math.prod(shape[1:]))
+    return True
+
+
+def commit_array_rows(path: str, rows: int, source: str | None = None) -> None:
+    """Save the first `rows` rows of the .npy file `source` (default: `path`
+    itself), extended by `append_array_rows`, as the array at `path`.
+
+    When the new row count fits in the header only the header is rewritten,
+    and a separate `source` file is then renamed over `path`; otherwise the
+    rows are copied.
+    """
+    source = source or path
+    if _set_row_count(source, rows):
+        if source != path:
+            os.replace(source, path)
+        return
+    save_array(path, map_array_rows(source, rows))
+    if source != path:
+        os.remove(source)
+
+
+def _write_manifest(
+    path: str,
+    model_name: str,
+    rows: int,
+    dim: int,
+    dtype,
+    fingerprint: str | None = None,
+) -> None:
+    manifest = {
+        "version": EMBEDDING_MANIFEST_VERSION,
+        "model": model_name,
+        "rows": rows,
+        "dim": dim,
+        "dtype": np.dtype(dtype).str,
+        "normalized": True,
+        "fingerprint": fingerprint,
+    }
+    tmp_path = f"{manifest_path(path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path(path))
+
+
+def save_embeddings_file(
+    path: str, embeddings: np.ndarray, model_name: str, fingerprint: str | None = None
+) -> None:
+    """Write normalized embeddings and their manifest; `fingerprint`
+    identifies the texts they embed."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    save_array(path, embeddings)
+    _write_manifest(
+        path,
+        model_name,
+        int(embeddings.shape[0]),
+        int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        embeddings.dtype,
+        fingerprint,
+    )
+
+
+def commit_embeddings_file(
+    path: str,
+    rows: int,
+    model_name: str,
+    fingerprint: str | None = None,
+    source: str | None = None,
+) -> None:
+    """`save_embeddings_file` for embeddings extended by `append_array_rows`:
+    the matrix is not copied again, see `commit_array_rows`."""
+    commit_array_rows(path, rows, source)
+    embeddings = np.load(path, mmap_mode="r")
+    _write_manifest(
+        path,
+        model_name,
+        rows,
+        int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        embeddings.dtype,
+        fingerprint,
+    )
+
+
+def save_embeddings_stream(
+    path: str,
+    batches: Iterable[np.ndarray],
+    model_name: str,
+    fingerprint: str | None = None,
+) -> int:
+    """Write normalized embedding batches as they are produced.
+
+    Rows are spooled to a temporary file because the .npy header needs the
+    final row count; the file is then assembled and swapped in like
+    `save_array`. Returns the number of rows written.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows_path = f"{path}.rows.tmp"
+    rows, dim = 0, 0
+    with open(rows_path, "wb") as f:
+        for batch in batches:
+            batch = np.ascontiguousarray(batch, dtype=np.float32)
+            f.write(batch.tobytes())
+            rows += len(batch)
+            dim = batch.shape[1]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f, open(rows_path, "rb") as data:
+        np.lib.format.write_array_header_1_0(
+            f,
+            {
+                "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                "fortran_order": False,
+                "shape": (rows, dim),
+            },
+        )
+        shutil.copyfileobj(data, f)
+    os.remove(rows_path)
+    os.replace(tmp_path, path)
+    _write_manifest(path, model_name, rows, dim, np.float32, fingerprint)
+    return rows
+
+
+def load_embeddings_file(
+    path: str, model_name: str, fingerprint: str | None = None
+) -> np.ndarray | None:
+    """Memory-map saved embeddings, or None if missing, not for this model
+    or, given a `fingerprint`, saved for different texts.
+
+    The returned array is read-only and backed by the page cache, so every
+    process that loads the same file shares one copy and loading does not
+    read the matrix up front. Files saved before manifests existed are
+    normalized and rewritten once.
+    """
+    if not os.path.exists(path):
+        return None
+    manifest = read_manifest(path)
+    if manifest is None:
+        save_embeddings_file(path, normalize_embeddings(np.load(path)), model_name)
+        manifest = read_manifest(path)
+    if manifest["model"] != model_name:
+        return None
+    if fingerprint is not None and manifest.get("fingerprint") != fingerprint:
+        return None
+
+    embeddings = np.load(path, mmap_mode="r")
+    if (
+        embeddings.shape[0] != manifest["rows"]
+        or embeddings.dtype.str != manifest["dtype"]
+        or (embeddings.ndim == 2 and embeddings.shape[1] != manifest["dim"])
+    ):
+        return None
+    if not manifest["normalized"]:
+        return normalize_embeddings(embeddings)
+    return embeddings
@@ -0,0 +1,142 @@
+import numpy as np
+
+from .search_utils import RRF_K
+
+
+class FusedRanking:
+    """Every candidate of a fusion, best first, with per-retriever provenance.
+
+    `ranks[i, r]` is the 1-based rank retriever r gave `doc_ids[i]` (0 if it
+    did not return it) and `leg_scores[i, r]` that retriever's contribution
+    before weighting: the reciprocal-rank term for RRF, the min-max
+    normalized score for weighted fusion.
+    """
+
+    def __init__(
+        self,
+        doc_ids: np.ndarray,
+        scores: np.ndarray,
+        ranks: np.ndarray,
+        leg_scores: np.ndarray,
+    ) -> None:
+        self.doc_ids = doc_ids
+        self.scores = scores
+        self.ranks = ranks
+        self.leg_scores = leg_scores
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+def candidate_union(
+    rankings: list[np.ndarray],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Distinct doc ids in order of first appearance, and where each input
+    position lands: (doc_ids, doc_rows, legs, ranks) with one entry of the
+    last three per returned result.
+    """
+    lengths = [len(ranking) for ranking in rankings]
+    all_ids = np.concatenate([np.asarray(r) for r in rankings] or [np.zeros(0)])
+    legs = np.repeat(np.arange(len(rankings)), lengths)
+    ranks = np.concatenate(
+        [np.arange(1, n + 1) for n in lengths] or [np.zeros(0, dtype=np.int64)]
+    )
+    unique, first, inverse = np.unique(all_ids, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    return unique[order], position[inverse], legs, ranks
+
+
+def _ranked(
+    doc_ids: np.ndarray, ranks: np.ndarray, leg_scores: np.ndarray, weights
+) -> FusedRanking:
+    scores = (leg_scores * weights).sum(axis=1)
+    # stable, so ties keep first-appearance order
+    order = np.argsort(-scores, kind="stable")
+    return FusedRanking(doc_ids[order], scores[order], ranks[order], leg_scores[order])
+
+
+def _rank_matrix(doc_rows, legs, ranks, n_docs: int, n_legs: int) -> np.ndarray:
+    # a retriever that returns a document twice is credited with the first
+    matrix = np.full((n_docs, n_legs), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(matrix, (doc_rows, legs), ranks)
+    matrix[matrix == np.iinfo(np.int64).max] = 0
+    return matrix
+
+
+def leg_weights(n_legs: int, weights=None) -> np.ndarray:
+    if weights is None:
+        return np.ones(n_legs)
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (n_legs,):
+        raise ValueError(f"expected {n_legs} retriever weights, got {len(weights)}")
+    return weights
+
+
+def rrf_fuse(rankings: list[np.ndarray], k: int = RRF_K, weights=None) -> FusedRanking:
+    """Weighted reciprocal rank fusion of ranked doc id arrays."""
+    weights = leg_weights(len(rankings), weights)
+    doc_ids, doc_rows, legs, ranks = candidate_union(rankings)
+    rank_matrix = _rank_matrix(doc_rows, legs, ranks, len(doc_ids), len(rankings))
+    contributions = np.where(rank_matrix > 0, 1 / (k + rank_matrix), 0.0)
+    return _ranked(doc_ids, rank_matrix, contributions, weights)
+
+
+def min_max_normalize(scores: np.ndarray) -> np.ndarray:
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def weighted_fuse(
+    rankings: list[np.ndarray], scores: list[np.ndarray], weights=None
+) -> FusedRanking:
+    """Weighted sum of each retriever's min-max normalized scores.
+
+    A document a retriever did not return gets 0 from it.
+    """
+    weights = leg_weights(len(rankings), weights)
+    doc_ids, doc_rows, legs, ranks = candidate_union(rankings)
+    rank_matrix = _rank_matrix(doc_rows, legs, ranks, len(doc_ids), len(rankings))
+    normalized = np.concatenate([min_max_normalize(s) for s in scores] or [np.zeros(0)])
+    leg_scores = np.zeros((len(doc_ids), len(rankings)))
+    np.maximum.at(leg_scores, (doc_rows, legs), normalized)
+    return _ranked(doc_ids, rank_matrix, leg_scores, weights)
+
+
+def rrf_top_k_is_final(
+    fused: FusedRanking,
+    limit: int,
+    k: int,
+    depth: int,
+    exhausted: np.ndarray,
+    weights=None,
+) -> bool:
+    """Whether deeper retrievers could still change the RRF top `limit` or
+    its order.
+
+    A retriever cut off at `depth` ranks every document it did not return
+    below `depth`, so it adds at most w / (k + depth + 1) to such a document.
+    The top-k is final when each of its documents scores at least the upper
+    bound of everything ranked below it. A document that could still gain a
+    rank must be beaten outright: tied, it may first appear in an earlier leg
+    at full depth and be ordered ahead.
+    """
+    weights = leg_weights(len(exhausted), weights)
+    missing_bound = weights / (k + depth + 1) * ~np.asarray(exhausted)
+    missing = ((fused.ranks == 0) * missing_bound).sum(axis=1)
+    upper = fused.scores + missing
+    upper = np.where(missing > 0, np.nextafter(upper, np.inf), upper)
+
+    # documents no retriever has returned yet
+    rest = max(
+        np.nextafter(missing_bound.sum(), np.inf), upper[limit:].max(initial=0.0)
+    )
+    below = np.append(upper[1:limit], rest)
+    below = np.maximum.accumulate(below[::-1])[::-1]
+    return bool(np.all(fused.scores[:limit] >= below[: len(fused.scores[:limit])]))
@@ -1,16 +1,35 @@
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Optional
 
+import numpy as np
+
+from .doc_store import load_doc_store
+from .fusion import (
+    FusedRanking,
+    min_max_normalize,
+    rrf_fuse,
+    rrf_top_k_is_final,
+    weighted_fuse,
+)
 from .keyword_search import InvertedIndex
 from .query_enhancement import enhance_query
 from .reranking import rerank
 from .search_utils import (
     DEFAULT_ALPHA,
     DEFAULT_SEARCH_LIMIT,
+    DEPTH_GROWTH,
+    HYBRID_LEGS,
+    INITIAL_DEPTH_MULTIPLIER,
+    MAX_DEPTH_MULTIPLIER,
     RRF_K,
     SEARCH_MULTIPLIER,
-    format_search_result,
-    load_movies,
+    SearchHit,
+    hits_to_dicts,
 )
 from .semantic_search import ChunkedSemanticSearch
 
@@ -18,59 +37,364 @@ from .semantic_search import ChunkedSemanticSearch
 class HybridSearch:
     def __init__(self, documents: list[dict]) -> None:
         self.documents = documents
-        self.semantic_search = ChunkedSemanticSearch()
+        self.semantic_search = ChunkedSemanticSearch(persist_query_cache=True)
         self.semantic_search.load_or_create_chunk_embeddings(documents)
 
         self.idx = InvertedIndex()
         if not os.path.exists(self.idx.index_path):
             self.idx.build()
             self.idx.save()
-
-    def _bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
         self.idx.load()
-        return self.idx.bm25_search(query, limit)
-
-    def weighted_search(self, query: str, alpha: float, limit: int = 5) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * 500)
-        semantic_results = self.semantic_search.search_chunks(query, limit * 500)
 
-        combined = combine_search_results(bm25_results, semantic_results, alpha)
-        return combined[:limit]
+        self._executor = self._new_executor()
+        self._executor_lock = threading.Lock()
+        self.degraded_legs: list[str] = []
+        self.last_depth: dict = {}
+        self.depth_stats = {"queries": 0, "rounds": 0, "total_depth": 0, "max_depth": 0}
 
-    def rrf_search(self, query: str, k: int, limit: int = 10) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * 500)
-        semantic_results = self.semantic_search.search_chunks(query, limit * 500)
+    def _bm25_search(
+        self, query: str, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[SearchHit]:
+        self.idx.reload_if_changed()
+        return self.idx.bm25_search(query, limit)
 
-        fused = reciprocal_rank_fusion(bm25_results, semantic_results, k)
-        return fused[:limit]
+    def index_load_stats(self) -> dict:
+        return self.idx.load_stats()
 
+    @staticmethod
+    def _new_executor() -> ThreadPoolExecutor:
+        # the semantic leg spends most of its time in numpy/torch with the
+        # GIL released; the BM25 leg pins the index reader it started with
+        return ThreadPoolExecutor(
+            max_workers=len(HYBRID_LEGS), thread_name_prefix="hybrid-leg"
+        )
 
-def normalize_scores(scores: list[float]) -> list[float]:
-    if not scores:
-        return []
+    def _retire_executor(self) -> None:
+        """Give new legs a fresh pool while abandoned ones finish on the old
+        pool, whose threads exit once those legs are done."""
+        with self._executor_lock:
+            self._executor.shutdown(wait=False)
+            self._executor = self._new_executor()
+
+    def _submit(self, fn, *args) -> Future:
+        with self._executor_lock:
+            return self._executor.submit(fn, *args)
+
+    def _start_legs(self, query: str, depth: int) -> dict[str, Future]:
+        with self._executor_lock:
+            return {
+                "bm25": self._executor.submit(self._bm25_search, query, depth),
+                "semantic": self._executor.submit(
+                    self.semantic_search.search_chunks, query, depth
+                ),
+            }
 
-    min_score = min(scores)
-    max_score = max(scores)
+    def _finish_legs(
+        self, results: dict[str, list[SearchHit]], futures: dict[str, Future]
+    ) -> tuple[list[SearchHit], list[SearchHit]]:
+        """Both rankings, with an empty one for a leg that missed its deadline.
+
+        The names of missing legs are kept in `degraded_legs`; if every leg
+        missed its deadline there is nothing to fall back to.
+        """
+        self.degraded_legs = [name for name in futures if name not in results]
+        # a leg that is already running cannot be stopped; its result is
+        # simply discarded when it finishes, but it must not hold a worker
+        # that the next query's legs would queue behind. It keeps the index
+        # reader it pinned, so a reload by the next query cannot close it
+        abandoned = [name for name in self.degraded_legs if not futures[name].cancel()]
+        if abandoned:
+            self._retire_executor()
+        if not results:
+            raise TimeoutError("every retrieval leg missed its deadline")
+        return results.get("bm25", []), results.get("semantic", [])
+
+    def _retrieve(
+        self, query: str, depth: int, timeouts: Optional[dict] = None
+    ) -> tuple[list[SearchHit], list[SearchHit]]:
+        """Run the BM25 and semantic legs concurrently.
+
+        `timeouts` maps a leg name to seconds from the start of the search;
+        a leg without one is waited for indefinitely.
+        """
+        timeouts = timeouts or {}
+        start = time.monotonic()
+        futures = self._start_legs(query, depth)
+        results = {}
+        for name, future in futures.items():
+            remaining = None
+            if timeouts.get(name) is not None:
+                remaining = max(0.0, start + timeouts[name] - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                pass
+        return self._finish_legs(results, futures)
+
+    async def _retrieve_async(
+        self, query: str, depth: int, timeouts: Optional[dict] = None
+    ) -> tuple[list[SearchHit], list[SearchHit]]:
+        timeouts = timeouts or {}
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        futures = self._start_legs(query, depth)
+        results = {}
+        for name, future in futures.items():
+            remaining = None
+            if timeouts.get(name) is not None:
+                remaining = max(0.0, start + timeouts[name] - loop.time())
+            try:
+                results[name] = await asyncio.wait_for(
+                    asyncio.wrap_future(future), remaining
+                )
+            except asyncio.TimeoutError:
+                pass
+        return self._finish_legs(results, futures)
+
+    def _depths(self, limit: int, after: Optional[int] = None):
+        """Candidate depths to try per leg, smallest first."""
+        max_depth = limit * MAX_DEPTH_MULTIPLIER
+        depth = limit * INITIAL_DEPTH_MULTIPLIER
+        if after is not None:
+            depth = after * DEPTH_GROWTH
+        while depth < max_depth:
+            yield depth
+            depth *= DEPTH_GROWTH
+        if after is None or after < max_depth:
+            yield max_depth
+
+    def _fuse_round(self, legs, depth, fuse, is_final, previous):
+        """Fuse one round of leg results.
+
+        Returns whether to stop deepening, and the (fused, depth, legs) to
+        keep.
+        """
+        if self.degraded_legs and previous is not None:
+            # a deeper round lost a leg: the shallower complete round is better
+            self.degraded_legs = []
+            return True, previous
+        fused = fuse(legs)
+        exhausted = np.array([len(results) < depth for results in legs])
+        stop = (
+            bool(self.degraded_legs)
+            or bool(exhausted.all())
+            or is_final(fused, previous and previous[0], depth, exhausted)
+        )
+        return stop, (fused, depth, legs)
+
+    def _record_depth(self, depth: int, rounds: int) -> None:
+        self.last_depth = {"depth": depth, "rounds": rounds}
+        self.depth_stats["queries"] += 1
+        self.depth_stats["rounds"] += rounds
+        self.depth_stats["total_depth"] += depth
+        self.depth_stats["max_depth"] = max(self.depth_stats["max_depth"], depth)
+
+    def depth_summary(self) -> dict:
+        queries = max(1, self.depth_stats["queries"])
+        return {
+            "queries": self.depth_stats["queries"],
+            "mean_depth": self.depth_stats["total_depth"] / queries,
+            "max_depth": self.depth_stats["max_depth"],
+            "mean_rounds": self.depth_stats["rounds"] / queries,
+        }
+
+    def _adaptive_search(
+        self, query, limit, fuse, is_final, timeouts=None, first_round=None
+    ) -> tuple[FusedRanking, dict[str, list[SearchHit]]]:
+        """Fuse the legs at growing depths until `is_final` accepts the top-k.
+
+        Both legs are cut at the same depth each round; a round that exhausts
+        both legs, or reaches limit * MAX_DEPTH_MULTIPLIER, is final.
+        """
+        started = time.monotonic()
+        kept, rounds = first_round, int(first_round is not None)
+        for depth in self._depths(limit, first_round and first_round[1]):
+            rounds += 1
+            legs = self._retrieve(query, depth, remaining_timeouts(timeouts, started))
+            stop, kept = self._fuse_round(legs, depth, fuse, is_final, kept)
+            if stop:
+                break
+        fused, depth, legs = kept
+        self._record_depth(depth, rounds)
+        return fused, dict(zip(HYBRID_LEGS, legs))
+
+    async def _adaptive_search_async(
+        self, query, limit, fuse, is_final, timeouts=None
+    ) -> tuple[FusedRanking, dict[str, list[SearchHit]]]:
+        started = time.monotonic()
+        kept, rounds = None, 0
+        for depth in self._depths(limit):
+            rounds += 1
+            legs = await self._retrieve_async(
+                query, depth, remaining_timeouts(timeouts, started)
+            )
+            stop, kept = self._fuse_round(legs, depth, fuse, is_final, kept)
+            if stop:
+                break
+        fused, depth, legs = kept
+        self._record_depth(depth, rounds)
+        return fused, dict(zip(HYBRID_LEGS, legs))
+
+    def _rrf_round(self, k: int, limit: int, weights: Optional[dict] = None):
+        weights = [(weights or {}).get(name, 1.0) for name in HYBRID_LEGS]
+
+        def fuse(legs):
+            return rrf_fuse([result_ids(results) for results in legs], k, weights)
+
+        def is_final(fused, previous, depth, exhausted):
+            return rrf_top_k_is_final(fused, limit, k, depth, exhausted, weights)
+
+        return fuse, is_final
+
+    def weighted_search(
+        self,
+        query: str,
+        alpha: float,
+        limit: int = 5,
+        timeouts: Optional[dict] = None,
+    ) -> list[SearchHit]:
+        def fuse(legs):
+            return weighted_fuse(
+                [result_ids(results) for results in legs],
+                [result_scores(results) for results in legs],
+                [alpha, 1 - alpha],
+            )
+
+        # min-max normalization depends on the whole candidate list, so no
+        # shallower round can be proven to give the same top-k: fetch the
+        # full depth in one round
+        depth = limit * MAX_DEPTH_MULTIPLIER
+        legs = self._retrieve(query, depth, timeouts)
+        self._record_depth(depth, 1)
+        return fused_hits(fuse(legs), dict(zip(HYBRID_LEGS, legs)), limit, rrf=False)
+
+    def rrf_search(
+        self,
+        query: str,
+        k: int,
+        limit: int = 10,
+        timeouts: Optional[dict] = None,
+        weights: Optional[dict] = None,
+    ) -> list[SearchHit]:
+        """RRF over the legs; `weights` scales each leg's reciprocal ranks
+        (default 1.0 per leg).
+        """
+        fuse, is_final = self._rrf_round(k, limit, weights)
+        fused, legs = self._adaptive_search(query, limit, fuse, is_final, timeouts)
+        return fused_hits(fused, legs, limit)
+
+    async def rrf_search_async(
+        self,
+        query: str,
+        k: int = RRF_K,
+        limit: int = 10,
+        timeouts: Optional[dict] = None,
+        weights: Optional[dict] = None,
+    ) -> list[SearchHit]:
+        """`rrf_search` that awaits the legs instead of blocking the loop."""
+        fuse, is_final = self._rrf_round(k, limit, weights)
+        fused, legs = await self._adaptive_search_async(
+            query, limit, fuse, is_final, timeouts
+        )
+        return fused_hits(fused, legs, limit)
+
+    def search_many(
+        self, queries: list[str], limit: int = 10, k: int = RRF_K
+    ) -> list[list[SearchHit]]:
+        """`rrf_search` for several queries, batching the semantic leg.
+
+        The first round runs for every query at once, with BM25 on this
+        thread while the batched semantic leg runs on the pool; only queries
+        whose top-k is not yet final go deeper, one at a time.
+        """
+        depth = limit * INITIAL_DEPTH_MULTIPLIER
+        semantic_future = self._submit(
+            self.semantic_search.search_chunks_many, queries, depth
+        )
+        bm25_results = [self._bm25_search(query, depth) for query in queries]
+        fuse, is_final = self._rrf_round(k, limit)
+        results = []
+        for query, bm25, semantic in zip(
+            queries, bm25_results, semantic_future.result()
+        ):
+            self.degraded_legs = []
+            stop, first_round = self._fuse_round(
+                (bm25, semantic), depth, fuse, is_final, None
+            )
+            if stop:
+                self._record_depth(depth, 1)
+                fused, legs = first_round[0], dict(zip(HYBRID_LEGS, first_round[2]))
+            else:
+                fused, legs = self._adaptive_search(
+                    query, limit, fuse, is_final, first_round=first_round
+                )
+            results.append(fused_hits(fused, legs, limit))
+        return results
+
+
+def remaining_timeouts(timeouts: Optional[dict], started: float) -> dict:
+    elapsed = time.monotonic() - started
+    return {
+        name: timeout - elapsed
+        for name, timeout in (timeouts or {}).items()
+        if timeout is not None
+    }
 
-    if max_score == min_score:
-        return [1.0] * len(scores)
 
-    normalized_scores = []
-    for s in scores:
-        normalized_scores.append((s - min_score) / (max_score - min_score))
-    return normalized_scores
+def result_ids(hits: list[SearchHit]) -> np.ndarray:
+    return np.array([hit.id for hit in hits])
+
+
+def result_scores(hits: list[SearchHit]) -> np.ndarray:
+    return np.array([hit.score for hit in hits], dtype=np.float64)
+
+
+def fused_hits(
+    fused: FusedRanking,
+    legs: dict[str, list[SearchHit]],
+    limit: Optional[int] = None,
+    rrf: bool = True,
+) -> list[SearchHit]:
+    """Hits for the top `limit` fused documents (default: all).
+
+    Each hit shows the document as the first leg that returned it did, found
+    through its rank there, with the per-leg ranks (RRF) or normalized scores
+    (weighted) as metadata.
+    """
+    names = list(legs)
+    n_results = len(fused) if limit is None else min(limit, len(fused))
+    hits = []
+    for i in range(n_results):
+        ranks = fused.ranks[i].tolist()
+        first_leg = next(leg for leg, rank in enumerate(ranks) if rank)
+        source = legs[names[first_leg]][ranks[first_leg] - 1]
+        score = float(fused.scores[i])
+        if rrf:
+            metadata = {"rrf_score": score}
+            for name, rank in zip(names, ranks):
+                metadata[f"{name}_rank"] = rank or None
+        else:
+            metadata = {
+                f"{name}_score": leg_score
+                for name, leg_score in zip(names, fused.leg_scores[i].tolist())
+            }
+        hits.append(
+            SearchHit(source.docs, source.row, score, metadata, preview=source.preview)
+        )
+    return hits
 
 
-def normalize_search_results(results: list[dict]) -> list[dict]:
-    scores: list[float] = []
-    for result in results:
-        scores.append(result["score"])
+def normalize_scores(scores: list[float]) -> list[float]:
+    return min_max_normalize(np.asarray(scores, dtype=np.float64)).tolist()
 
-    normalized: list[float] = normalize_scores(scores)
-    for i, result in enumerate(results):
-        result["normalized_score"] = normalized[i]
 
-    return results
+def normalize_search_results(results: list[dict]) -> list[dict]:
+    """Copies of result dicts with a min-max `normalized_score` added."""
+    normalized = normalize_scores([result["score"] for result in results])
+    return [
+        {**result, "normalized_score": score}
+        for result, score in zip(results, normalized)
+    ]
 
 
 def hybrid_score(
@@ -80,51 +404,18 @@ def hybrid_score(
 
 
 def combine_search_results(
-    bm25_results: list[dict], semantic_results: list[dict], alpha: float = DEFAULT_ALPHA
-) -> list[dict]:
-    bm25_normalized = normalize_search_results(bm25_results)
-    semantic_normalized = normalize_search_results(semantic_results)
-
-    combined_scores = {}
-
-    for result in bm25_normalized:
-        doc_id = result["id"]
-        if doc_id not in combined_scores:
-            combined_scores[doc_id] = {
-                "title": result["title"],
-                "document": result["document"],
-                "bm25_score": 0.0,
-                "semantic_score": 0.0,
-            }
-        if result["normalized_score"] > combined_scores[doc_id]["bm25_score"]:
-            combined_scores[doc_id]["bm25_score"] = result["normalized_score"]
-
-    for result in semantic_normalized:
-        doc_id = result["id"]
-        if doc_id not in combined_scores:
-            combined_scores[doc_id] = {
-                "title": result["title"],
-                "document": result["document"],
-                "bm25_score": 0.0,
-                "semantic_score": 0.0,
-            }
-        if result["normalized_score"] > combined_scores[doc_id]["semantic_score"]:
-            combined_scores[doc_id]["semantic_score"] = result["normalized_score"]
-
-    hybrid_results = []
-    for doc_id, data in combined_scores.items():
-        score_value = hybrid_score(data["bm25_score"], data["semantic_score"], alpha)
-        result = format_search_result(
-            doc_id=doc_id,
-            title=data["title"],
-            document=data["document"],
-            score=score_value,
-            bm25_score=data["bm25_score"],
-            semantic_score=data["semantic_score"],
-        )
-        hybrid_results.append(result)
-
-    return sorted(hybrid_results, key=lambda x: x["score"], reverse=True)
+    bm25_results: list[SearchHit],
+    semantic_results: list[SearchHit],
+    alpha: float = DEFAULT_ALPHA,
+    limit: Optional[int] = None,
+) -> list[SearchHit]:
+    legs = {"bm25": bm25_results, "semantic": semantic_results}
+    fused = weighted_fuse(
+        [result_ids(results) for results in legs.values()],
+        [result_scores(results) for results in legs.values()],
+        [alpha, 1 - alpha],
+    )
+    return fused_hits(fused, legs, limit, rrf=False)
 
 
 def rrf_score(rank: int, k: int = RRF_K) -> float:
@@ -132,73 +423,39 @@ def rrf_score(rank: int, k: int = RRF_K) -> float:
 
 
 def reciprocal_rank_fusion(
-    bm25_results: list[dict], semantic_results: list[dict], k: int = RRF_K
-) -> list[dict]:
-    rrf_scores = {}
-
-    for rank, result in enumerate(bm25_results, start=1):
-        doc_id = result["id"]
-        if doc_id not in rrf_scores:
-            rrf_scores[doc_id] = {
-                "title": result["title"],
-                "document": result["document"],
-                "rrf_score": 0.0,
-                "bm25_rank": None,
-                "semantic_rank": None,
-            }
-        if rrf_scores[doc_id]["bm25_rank"] is None:
-            rrf_scores[doc_id]["bm25_rank"] = rank
-            rrf_scores[doc_id]["rrf_score"] += rrf_score(rank, k)
-
-    for rank, result in enumerate(semantic_results, start=1):
-        doc_id = result["id"]
-        if doc_id not in rrf_scores:
-            rrf_scores[doc_id] = {
-                "title": result["title"],
-                "document": result["document"],
-                "rrf_score": 0.0,
-                "bm25_rank": None,
-                "semantic_rank": None,
-            }
-        if rrf_scores[doc_id]["semantic_rank"] is None:
-            rrf_scores[doc_id]["semantic_rank"] = rank
-            rrf_scores[doc_id]["rrf_score"] += rrf_score(rank, k)
-
-    sorted_items = sorted(
-        rrf_scores.items(), key=lambda x: x[1]["rrf_score"], reverse=True
-    )
-
-    rrf_results = []
-    for doc_id, data in sorted_items:
-        result = format_search_result(
-            doc_id=doc_id,
-            title=data["title"],
-            document=data["document"],
-            score=data["rrf_score"],
-            rrf_score=data["rrf_score"],
-            bm25_rank=data["bm25_rank"],
-            semantic_rank=data["semantic_rank"],
-        )
-        rrf_results.append(result)
-
-    return rrf_results
+    bm25_results: list[SearchHit],
+    semantic_results: list[SearchHit],
+    k: int = RRF_K,
+    limit: Optional[int] = None,
+) -> list[SearchHit]:
+    legs = {"bm25": bm25_results, "semantic": semantic_results}
+    fused = rrf_fuse([result_ids(results) for results in legs.values()], k)
+    return fused_hits(fused, legs, limit)
 
 
 def weighted_search_command(
-    query: str, alpha: float = DEFAULT_ALPHA, limit: int = DEFAULT_SEARCH_LIMIT
+    query: str,
+    alpha: float = DEFAULT_ALPHA,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    timeouts: Optional[dict] = None,
+    searcher: Optional[HybridSearch] = None,
 ) -> dict:
-    movies = load_movies()
-    searcher = HybridSearch(movies)
+    if searcher is None:
+        searcher = HybridSearch(load_doc_store())
 
     original_query = query
 
     search_limit = limit
-    results = searcher.weighted_search(query, alpha, search_limit)
+    results = hits_to_dicts(
+        searcher.weighted_search(query, alpha, search_limit, timeouts)
+    )
 
     return {
         "original_query": original_query,
         "query": query,
         "alpha": alpha,
+        "degraded_legs": searcher.degraded_legs,
+        "depth": searcher.last_depth,
         "results": results,
     }
 
@@ -209,10 +466,12 @@ def rrf_search_command(
     enhance: Optional[str] = None,
     rerank_method: Optional[str] = None,
     limit: int = DEFAULT_SEARCH_LIMIT,
+    timeouts: Optional[dict] = None,
+    searcher: Optional[HybridSearch] = None,
 ) -> dict:
     print("rrf_Search_command: ")
-    movies = load_movies()
-    searcher = HybridSearch(movies)
+    if searcher is None:
+        searcher = HybridSearch(load_doc_store())
 
     original_query = query
     enhanced_query = None
@@ -221,7 +480,7 @@ def rrf_search_command(
         query = enhanced_query
 
     search_limit = limit * SEARCH_MULTIPLIER if rerank_method else limit
-    results = searcher.rrf_search(query, k, search_limit)
+    results = hits_to_dicts(searcher.rrf_search(query, k, search_limit, timeouts))
 
     reranked = False
     
@@ -237,6 +496,8 @@ def rrf_search_command(
         "k": k,
         "rerank_method": rerank_method,
         "reranked": reranked,
+        "degraded_legs": searcher.degraded_legs,
+        "depth": searcher.last_depth,
         "results": results,
     }
 
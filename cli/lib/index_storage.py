@@ -0,0 +1,404 @@
+import io
+import mmap
+import shutil
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+INDEX_MAGIC = b"BSIX"
+INDEX_VERSION = 2
+
+# magic, version, generation, n_docs, n_terms, n_postings, total_doc_length, k1,
+# b, fingerprint of the catalog the index was built from
+HEADER = struct.Struct("<4sIQQQQQdd32s")
+NO_FINGERPRINT = bytes(32)
+GENERATION = struct.Struct("<Q")
+GENERATION_OFFSET = 8
+SECTIONS = (
+    ("doc_ids", np.int64),
+    ("doc_lengths", np.int32),
+    ("term_offsets", np.uint64),
+    ("term_blob", np.uint8),
+    ("posting_offsets", np.uint64),
+    ("tf_offsets", np.uint64),
+    ("postings", np.uint8),
+    ("tfs", np.uint32),
+    ("impacts", np.float64),
+    ("max_impacts", np.float64),
+)
+SECTION_TABLE = struct.Struct("<" + "QQ" * len(SECTIONS))
+SPOOLED_SECTIONS = ("term_blob", "postings", "tfs", "impacts")
+ALIGNMENT = 8
+RUN_READ_BUFFER = 1 << 16
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128-encode non-negative integers, 7 bits per byte, low bits first."""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    bit_lengths = np.zeros(len(values), dtype=np.int64)
+    remaining = values.copy()
+    while remaining.any():
+        nonzero = remaining > 0
+        bit_lengths[nonzero] += 1
+        remaining >>= np.uint64(1)
+    n_bytes = np.maximum(1, (bit_lengths + 6) // 7)
+
+    width = int(n_bytes.max())
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    groups = (values[:, None] >> shifts[None, :]) & np.uint64(0x7F)
+    continuation = np.arange(width)[None, :] < (n_bytes[:, None] - 1)
+    encoded = (groups | (continuation.astype(np.uint64) << np.uint64(7))).astype(
+        np.uint8
+    )
+    keep = np.arange(width)[None, :] < n_bytes[:, None]
+    return encoded[keep].tobytes()
+
+
+def decode_varints(buf: np.ndarray) -> np.ndarray:
+    """Decode a buffer of LEB128 varints into a uint64 array."""
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    positions = np.arange(len(buf)) - np.repeat(starts, lengths)
+    groups = (buf & 0x7F).astype(np.uint64) << (positions.astype(np.uint64) * 7)
+    return np.add.reduceat(groups, starts)
+
+
+def encode_postings(rows: np.ndarray) -> bytes:
+    """Delta + varint encode one term's sorted document rows."""
+    rows = np.asarray(rows, dtype=np.int64)
+    deltas = np.diff(rows, prepend=0)
+    return encode_varints(deltas)
+
+
+def _pad(length: int) -> int:
+    return (-length) % ALIGNMENT
+
+
+class IndexWriter:
+    """Stream an index into `f` one term at a time, in sorted term order.
+
+    The term blob, postings, term frequencies and impacts go to spools as
+    terms arrive (temporary files by default), so only the per-document
+    columns and per-term offsets are held in memory; `close` writes the
+    header and copies the spools into place.
+    """
+
+    def __init__(
+        self,
+        f,
+        doc_ids: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float,
+        b: float,
+        spool=tempfile.TemporaryFile,
+        fingerprint: bytes = NO_FINGERPRINT,
+    ) -> None:
+        self.f = f
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.int32)
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint
+        self.spools = {name: spool() for name in SPOOLED_SECTIONS}
+        self.term_offsets = array("Q", [0])
+        self.posting_offsets = array("Q", [0])
+        self.tf_offsets = array("Q", [0])
+        self.max_impacts = array("d")
+
+    def add(
+        self,
+        term: str,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        impacts: np.ndarray,
+        max_impact: float,
+    ) -> None:
+        """Append one term: its sorted rows, their term frequencies and BM25
+        weights, and the largest of those weights."""
+        spools = self.spools
+        self.term_offsets.append(
+            self.term_offsets[-1] + spools["term_blob"].write(term.encode("utf-8"))
+        )
+        self.posting_offsets.append(
+            self.posting_offsets[-1] + spools["postings"].write(encode_postings(rows))
+        )
+        self.tf_offsets.append(self.tf_offsets[-1] + len(rows))
+        spools["tfs"].write(np.asarray(tfs, dtype=np.uint32).tobytes())
+        spools["impacts"].write(np.asarray(impacts, dtype=np.float64).tobytes())
+        self.max_impacts.append(float(max_impact))
+
+    def close(self) -> None:
+        payloads = {
+            "doc_ids": self.doc_ids.tobytes(),
+            "doc_lengths": self.doc_lengths.tobytes(),
+            "term_offsets": self.term_offsets.tobytes(),
+            "posting_offsets": self.posting_offsets.tobytes(),
+            "tf_offsets": self.tf_offsets.tobytes(),
+            "max_impacts": self.max_impacts.tobytes(),
+        }
+        sizes = {name: len(payload) for name, payload in payloads.items()}
+        for name, spool in self.spools.items():
+            sizes[name] = spool.tell()
+
+        offset = HEADER.size + SECTION_TABLE.size
+        offset += _pad(offset)
+        table = []
+        for name, _ in SECTIONS:
+            table.extend([offset, sizes[name]])
+            offset += sizes[name]
+            offset += _pad(offset)
+
+        header = HEADER.pack(
+            INDEX_MAGIC,
+            INDEX_VERSION,
+            0,
+            len(self.doc_ids),
+            len(self.max_impacts),
+            self.tf_offsets[-1],
+            int(self.doc_lengths.astype(np.int64).sum()),
+            self.k1,
+            self.b,
+            self.fingerprint,
+        )
+        written = self.f.write(header + SECTION_TABLE.pack(*table))
+        for name, _ in SECTIONS:
+            written += self.f.write(b"\0" * _pad(written))
+            if name in payloads:
+                written += self.f.write(payloads[name])
+            else:
+                spool = self.spools[name]
+                spool.seek(0)
+                shutil.copyfileobj(spool, self.f)
+                written += sizes[name]
+        for spool in self.spools.values():
+            spool.close()
+
+
+def write_index(
+    f,
+    doc_ids: np.ndarray,
+    doc_lengths: np.ndarray,
+    terms: list[str],
+    term_rows: list[np.ndarray],
+    term_tfs: list[np.ndarray],
+    impacts: np.ndarray,
+    max_impacts: np.ndarray,
+    k1: float,
+    b: float,
+    fingerprint: bytes = NO_FINGERPRINT,
+) -> None:
+    """Serialize an in-memory inverted index into the compact on-disk layout.
+
+    `terms` must be sorted; `term_rows[i]` are the sorted document rows that
+    contain `terms[i]` and `term_tfs[i]` the matching term frequencies.
+    `impacts` holds the BM25 weight of every posting for the given k1/b in
+    the same order and `max_impacts` the largest weight of each term;
+    `fingerprint` identifies the catalog the index was built from.
+    """
+    writer = IndexWriter(
+        f, doc_ids, doc_lengths, k1, b, spool=io.BytesIO, fingerprint=fingerprint
+    )
+    start = 0
+    for term, rows, tfs, max_impact in zip(terms, term_rows, term_tfs, max_impacts):
+        end = start + len(rows)
+        writer.add(term, rows, tfs, impacts[start:end], max_impact)
+        start = end
+    writer.close()
+
+
+RUN_RECORD = struct.Struct("<IQ")
+
+
+def write_run(f, postings: Iterable[tuple[str, np.ndarray, np.ndarray]]) -> None:
+    """Write (term, doc_ids, tfs) records, in sorted term order, as one run
+    of a build that spills postings to disk."""
+    for term, doc_ids, tfs in postings:
+        encoded = term.encode("utf-8")
+        f.write(RUN_RECORD.pack(len(encoded), len(doc_ids)))
+        f.write(encoded)
+        f.write(np.asarray(doc_ids, dtype=np.int64).tobytes())
+        f.write(np.asarray(tfs, dtype=np.uint32).tobytes())
+
+
+def iter_run(path: str) -> Iterator[tuple[str, np.ndarray, np.ndarray]]:
+    """Read back the records of a run written by `write_run`."""
+    with open(path, "rb", buffering=RUN_READ_BUFFER) as f:
+        while record := f.read(RUN_RECORD.size):
+            term_length, count = RUN_RECORD.unpack(record)
+            term = f.read(term_length).decode("utf-8")
+            doc_ids = np.frombuffer(f.read(8 * count), dtype=np.int64)
+            tfs = np.frombuffer(f.read(4 * count), dtype=np.uint32)
+            yield term, doc_ids, tfs
+
+
+def read_generation(path: str) -> int | None:
+    """Generation number stored in an index file, or None if unreadable."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, generation = HEADER.unpack(header)[:3]
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return None
+    return generation
+
+
+def write_with_generation(f, buffer, generation: int) -> None:
+    """Write a serialized index with its generation number replaced,
+    without copying the rest of the buffer."""
+    header = bytearray(buffer[: HEADER.size])
+    GENERATION.pack_into(header, GENERATION_OFFSET, generation)
+    f.write(header)
+    f.write(memoryview(buffer)[HEADER.size :])
+
+
+class _TermList:
+    """Sequence view over the sorted term blob, decoded on access."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+class IndexReader:
+    """Read-only view over an index written by `write_index`.
+
+    Opening only parses the fixed-size header; every section is a numpy view
+    into the underlying buffer, so an mmap'd file is shared between processes
+    and pages are only touched for the terms a query needs.
+    """
+
+    def __init__(self, buffer) -> None:
+        self.buffer = buffer
+        (
+            magic,
+            version,
+            self.generation,
+            self.n_docs,
+            self.n_terms,
+            self.n_postings,
+            self.total_doc_length,
+            self.k1,
+            self.b,
+            self.fingerprint,
+        ) = HEADER.unpack_from(buffer, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("unsupported inverted index format")
+
+        table = SECTION_TABLE.unpack_from(buffer, HEADER.size)
+        self.sections: dict[str, np.ndarray] = {}
+        for i, (name, dtype) in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            self.sections[name] = np.frombuffer(
+                buffer,
+                dtype=dtype,
+                count=length // np.dtype(dtype).itemsize,
+                offset=offset,
+            )
+
+        self.doc_ids = self.sections["doc_ids"]
+        self.doc_lengths = self.sections["doc_lengths"]
+        self.impacts = self.sections["impacts"]
+        self.max_impacts = self.sections["max_impacts"]
+        self.tfs = self.sections["tfs"]
+        self.tf_offsets = self.sections["tf_offsets"]
+        self.terms = _TermList(
+            self.sections["term_blob"], self.sections["term_offsets"]
+        )
+        self._mmap = None
+        self._file = None
+
+    @classmethod
+    def open(cls, path: str) -> "IndexReader":
+        return cls.from_file(open(path, "rb"))
+
+    @classmethod
+    def from_file(cls, f) -> "IndexReader":
+        """Map an open index file; the reader closes it."""
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            reader = cls(mm)
+        except ValueError:
+            mm.close()
+            f.close()
+            raise
+        reader._file = f
+        reader._mmap = mm
+        return reader
+
+    def close(self) -> None:
+        self.sections = {}
+        self.doc_ids = self.doc_lengths = self.tfs = None
+        self.impacts = self.max_impacts = None
+        self.tf_offsets = self.terms = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # numpy views handed out to callers still reference the map;
+                # it is released once they are garbage collected
+                pass
+            self._file.close()
+            self._mmap = self._file = None
+
+    @property
+    def avg_doc_length(self) -> float:
+        if self.n_docs == 0:
+            return 0.0
+        return self.total_doc_length / self.n_docs
+
+    def term_id(self, term: str) -> int | None:
+        i = bisect_left(self.terms, term)
+        if i < self.n_terms and self.terms[i] == term:
+            return i
+        return None
+
+    def row_of(self, doc_id: int) -> int | None:
+        row = int(np.searchsorted(self.doc_ids, doc_id))
+        if row < self.n_docs and self.doc_ids[row] == doc_id:
+            return row
+        return None
+
+    def doc_freq(self, term_id: int) -> int:
+        return int(self.tf_offsets[term_id + 1] - self.tf_offsets[term_id])
+
+    def posting_slice(self, term_id: int) -> slice:
+        return slice(int(self.tf_offsets[term_id]), int(self.tf_offsets[term_id + 1]))
+
+    def rows(self, term_id: int) -> np.ndarray:
+        offsets = self.sections["posting_offsets"]
+        start, end = int(offsets[term_id]), int(offsets[term_id + 1])
+        deltas = decode_varints(self.sections["postings"][start:end])
+        return np.cumsum(deltas).astype(np.int64)
+
+    def all_rows(self) -> np.ndarray:
+        """Decode every posting list at once, concatenated in term order."""
+        deltas = decode_varints(self.sections["postings"]).astype(np.int64)
+        cumulative = np.cumsum(deltas)
+        starts = self.tf_offsets[:-1].astype(np.int64)
+        counts = np.diff(self.tf_offsets).astype(np.int64)
+        nonempty = counts > 0
+        base = np.zeros(self.n_terms, dtype=np.int64)
+        base[nonempty] = cumulative[starts[nonempty]] - deltas[starts[nonempty]]
+        return cumulative - np.repeat(base, counts)
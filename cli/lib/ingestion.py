@@ -0,0 +1,100 @@
+import os
+
+from .doc_store import DocStore, as_doc_store, load_doc_store
+from .keyword_search import InvertedIndex
+from .search_utils import DATA_PATH
+from .semantic_search import ChunkedSemanticSearch
+from .streaming import iter_movies, save_movies
+
+
+class IncrementalIndexer:
+    """Apply catalog changes to every search structure without a rebuild.
+
+    The inverted index, movie embeddings and chunk embeddings are updated
+    together. Deletes are tombstoned in each structure and folded in by
+    compaction, which runs automatically once enough changes pile up and
+    always before saving. All of them read one document store, whose rows
+    the semantic search appends, tombstones and compacts in step with its
+    embeddings.
+    """
+
+    def __init__(
+        self, documents: list[dict] | None = None, catalog_path: str | None = None
+    ) -> None:
+        if documents is None:
+            documents = load_doc_store(catalog_path)
+        # a private copy: changes must not leak into the process-wide store
+        self.store: DocStore = as_doc_store(documents).copy()
+        # save() writes the catalog back to the file it came from
+        self.catalog_path = catalog_path or self.store.source_path or DATA_PATH
+
+        self.idx = InvertedIndex(documents=self.store)
+        if os.path.exists(self.idx.index_path):
+            self.idx.load()
+        else:
+            self.idx.build()
+            self.idx.save()
+
+        self.semantic_search = ChunkedSemanticSearch()
+        self.semantic_search.load_or_create_embeddings(self.store)
+        self.semantic_search.load_or_create_chunk_embeddings(self.store)
+
+    @property
+    def documents(self) -> list[dict]:
+        return [self.store[row] for row in self.store.live_rows()]
+
+    # the semantic search goes first so the shared store already matches
+    # the documents the index holds when the index compacts and records
+    # the store's fingerprint
+
+    def add_documents(self, documents: list[dict]) -> None:
+        self.semantic_search.add_documents(documents)
+        self.idx.add_documents(documents)
+
+    def update_document(self, document: dict) -> None:
+        self.semantic_search.update_document(document)
+        self.idx.update_document(document)
+
+    def delete_document(self, doc_id: int) -> None:
+        self.semantic_search.delete_document(doc_id)
+        self.idx.delete_document(doc_id)
+
+    def compact(self) -> None:
+        self.semantic_search.compact()
+        self.idx.compact()
+
+    def save(self) -> None:
+        """Compact and persist the catalog, index and embeddings together."""
+        self.compact()
+        save_movies(self.store, self.catalog_path)
+        self.idx.save()
+        self.semantic_search.save_embeddings()
+        self.semantic_search.save_chunk_embeddings()
+
+
+def add_command(movies_path: str, catalog_path: str | None = None) -> int:
+    """Index the movies in `movies_path` (any format `iter_movies` reads)
+    and save the catalog, index and embeddings; returns how many."""
+    movies = list(iter_movies(movies_path))
+    indexer = IncrementalIndexer(catalog_path=catalog_path)
+    indexer.add_documents(movies)
+    indexer.save()
+    return len(movies)
+
+
+def update_command(movies_path: str, catalog_path: str | None = None) -> int:
+    """Replace the indexed movies with the same ids as those in
+    `movies_path`; returns how many."""
+    movies = list(iter_movies(movies_path))
+    indexer = IncrementalIndexer(catalog_path=catalog_path)
+    for movie in movies:
+        indexer.update_document(movie)
+    indexer.save()
+    return len(movies)
+
+
+def delete_command(doc_ids: list[int], catalog_path: str | None = None) -> None:
+    indexer = IncrementalIndexer(catalog_path=catalog_path)
+    for doc_id in doc_ids:
+        indexer.delete_document(doc_id)
+    indexer.save()
@@ -1,104 +1,500 @@
+import heapq
+import io
 import math
 import os
-import pickle
 import string
+import tempfile
+import threading
+from array import array
 from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import groupby
 
+import numpy as np
 from nltk.stem import PorterStemmer
 
+from .doc_store import DocStore, load_doc_store
+from .index_storage import (
+    NO_FINGERPRINT,
+    IndexReader,
+    IndexWriter,
+    iter_run,
+    read_generation,
+    write_index,
+    write_run,
+    write_with_generation,
+)
 from .search_utils import (
     BM25_B,
     BM25_K1,
+    BUILD_SHARDS_PER_WORKER,
     CACHE_DIR,
+    COMPACTION_RATIO,
     DEFAULT_SEARCH_LIMIT,
-    format_search_result,
-    load_movies,
+    INDEX_MERGE_FAN_IN,
+    INDEX_SPILL_POSTINGS,
+    INGEST_BATCH_SIZE,
+    SearchHit,
+    hits_to_dicts,
     load_stopwords,
 )
+from .streaming import batched, bounded_map
 
 
 class InvertedIndex:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        tokenizer: "Tokenizer | None" = None,
+        documents: DocStore | None = None,
+    ) -> None:
+        self.tokenizer = tokenizer if tokenizer is not None else get_tokenizer()
         self.index = defaultdict(set)
-        self.docmap: dict[int, dict] = {}
-        self.index_path = os.path.join(CACHE_DIR, "index.pkl")
-        self.docmap_path = os.path.join(CACHE_DIR, "docmap.pkl")
-        self.tf_path = os.path.join(CACHE_DIR, "term_frequencies.pkl")
-        self.doc_lengths_path = os.path.join(CACHE_DIR, "doc_lengths.pkl")
+        self.index_path = os.path.join(CACHE_DIR, "index.bin")
         self.term_frequencies = defaultdict(Counter)
         self.doc_lengths = {}
+        self.reader: IndexReader | None = None
+        self.impacts: ImpactIndex | None = None
+        # a store passed in is shared with its owner, who appends, deletes
+        # and compacts its rows
+        self._documents = documents
+        self._shared_documents = documents is not None
+        self._file_signature: tuple[int, int, int] | None = None
+        self.load_count = 0
+        self.reload_check_count = 0
+        # searches on other threads pin the reader they started with; a reload
+        # closes a replaced reader only once its last pin is released
+        self._reader_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._pins: Counter = Counter()
+        self._retired: set[IndexReader] = set()
+        self.deleted: set[int] = set()
+        self._live_stats: tuple[int, float] | None = None
+
+    @property
+    def documents(self) -> DocStore:
+        # the store is mapped on first use
+        if self._documents is None:
+            self._documents = load_doc_store()
+        return self._documents
+
+    def build(self, workers: int = 1, catalog_path: str | None = None) -> None:
+        """Index every movie of the catalog (see `load_doc_store`), or of the
+        shared document store if one was passed in; with workers > 1 shards
+        are built in parallel.
+
+        Each worker indexes a contiguous shard into a partial segment and the
+        segments are merged in shard order, so the result is identical to a
+        serial build. Whenever INDEX_SPILL_POSTINGS postings are pending they
+        are flushed to a sorted run on disk, and the runs are merged term by
+        term into the index file, so memory is bounded by the spill size and
+        the per-document columns rather than by the catalog.
+        """
+        if self._shared_documents:
+            movies = self._documents
+        else:
+            movies = self._documents = load_doc_store(catalog_path)
 
-    def build(self) -> None:
-        movies = load_movies()
-        for m in movies:
-            doc_id = m["id"]
-            doc_description = f"{m['title']} {m['description']}"
-            self.docmap[doc_id] = m
-            self.__add_document(doc_id, doc_description)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=CACHE_DIR) as spill_dir:
+            runs = SpilledRuns(spill_dir)
+            if workers <= 1:
+                for batch in batched(movies, INGEST_BATCH_SIZE):
+                    self.add_movies(batch)
+                    self.__spill(runs)
+            else:
+                shard_size = max(
+                    1, math.ceil(len(movies) / (workers * BUILD_SHARDS_PER_WORKER))
+                )
+                # only a couple of shards per worker are decoded and in flight
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for segment in bounded_map(
+                        executor,
+                        build_segment,
+                        batched(movies, shard_size),
+                        2 * workers,
+                    ):
+                        self.merge_segment(*segment)
+                        self.__spill(runs)
+            self.__spill(runs, force=True)
+
+            index_file = tempfile.TemporaryFile(dir=CACHE_DIR)
+            runs.merge(index_file, fingerprint=movies.fingerprint)
+            index_file.flush()
+        self.__set_reader(IndexReader.from_file(index_file))
+
+    def add_movies(self, movies: list[dict]) -> None:
+        token_lists = self.tokenizer.tokenize_many(
+            f"{m['title']} {m['description']}" for m in movies
+        )
+        for m, tokens in zip(movies, token_lists):
+            self.__add_document(m["id"], tokens)
+
+    def merge_segment(
+        self,
+        index: dict[str, set[int]],
+        term_frequencies: dict[int, Counter],
+        doc_lengths: dict[int, int],
+    ) -> None:
+        for term, doc_ids in index.items():
+            self.index[term].update(doc_ids)
+        for doc_id, counts in term_frequencies.items():
+            self.term_frequencies[doc_id].update(counts)
+        self.doc_lengths.update(doc_lengths)
+
+    def __spill(self, runs: "SpilledRuns", force: bool = False) -> None:
+        pending = sum(len(counts) for counts in self.term_frequencies.values())
+        if pending == 0 or (pending < INDEX_SPILL_POSTINGS and not force):
+            return
+        runs.spill(self.index, self.term_frequencies, self.doc_lengths)
+        self.index = defaultdict(set)
+        self.term_frequencies = defaultdict(Counter)
+        self.doc_lengths = {}
 
     def save(self) -> None:
+        if self.is_dirty:
+            self.compact()
+        if self.reader is None:
+            raise ValueError("No index to save. Call `build` first.")
         os.makedirs(CACHE_DIR, exist_ok=True)
-        with open(self.index_path, "wb") as f:
-            pickle.dump(self.index, f)
-        with open(self.docmap_path, "wb") as f:
-            pickle.dump(self.docmap, f)
-        with open(self.tf_path, "wb") as f:
-            pickle.dump(self.term_frequencies, f)
-        with open(self.doc_lengths_path, "wb") as f:
-            pickle.dump(self.doc_lengths, f)
+        # write-then-rename so processes that have the old file mapped keep a
+        # consistent view; readers use its generation number to detect a new
+        # version
+        previous = read_generation(self.index_path)
+        generation = 0 if previous is None else previous + 1
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            write_with_generation(f, self.reader.buffer, generation)
+        os.replace(tmp_path, self.index_path)
 
     def load(self) -> None:
-        with open(self.index_path, "rb") as f:
-            self.index = pickle.load(f)
-        with open(self.docmap_path, "rb") as f:
-            self.docmap = pickle.load(f)
-        with open(self.tf_path, "rb") as f:
-            self.term_frequencies = pickle.load(f)
-        with open(self.doc_lengths_path, "rb") as f:
-            self.doc_lengths = pickle.load(f)
+        """Map index.bin.
+
+        Raises ValueError if the file is in an older format or was built from
+        a different catalog than the document store holds: the read path
+        never rewrites the index, run `keyword_search_cli.py build` instead.
+        """
+        if not self._shared_documents:
+            self._documents = load_doc_store()
+        signature = self.__file_signature()
+        try:
+            reader = IndexReader.open(self.index_path)
+        except ValueError as e:
+            raise stale_index_error(self.index_path, str(e)) from e
+        if reader.fingerprint != self.documents.fingerprint:
+            reader.close()
+            raise stale_index_error(
+                self.index_path, "it was built from a different catalog"
+            )
+        self.__set_reader(reader)
+        self.deleted = set()
+        self._live_stats = None
+        self._file_signature = signature
+        self.load_count += 1
+
+    def __set_reader(self, reader: IndexReader) -> None:
+        # the previous reader's map and file are released, not left to the GC
+        impacts = ImpactIndex(reader)
+        with self._reader_lock:
+            previous = self.reader
+            self.reader, self.impacts = reader, impacts
+            if previous is None or previous is reader:
+                return
+            if self._pins[previous]:
+                self._retired.add(previous)
+                return
+        previous.close()
+
+    @contextmanager
+    def __pinned(self, k1: float, b: float) -> Iterator[tuple["ImpactIndex", DocStore]]:
+        """The current impacts and documents, with their reader kept open
+        until the block exits even if a reload replaces it meanwhile."""
+        with self._reader_lock:
+            reader = self.reader
+            impacts = self.get_impacts(k1, b)
+            documents = self.documents
+            self._pins[reader] += 1
+        try:
+            yield impacts, documents
+        finally:
+            with self._reader_lock:
+                self._pins[reader] -= 1
+                if self._pins[reader]:
+                    return
+                del self._pins[reader]
+                if reader not in self._retired:
+                    return
+                self._retired.discard(reader)
+            reader.close()
+
+    def reload_if_changed(self) -> bool:
+        """Reload the index only if the file on disk has been replaced.
+
+        Returns True if a (re)load happened.
+        """
+        self.reload_check_count += 1
+        if self.is_dirty:
+            # never drop uncompacted in-memory changes for the on-disk copy
+            return False
+        # concurrent searches noticing the same new file load it once
+        with self._reload_lock:
+            if self.reader is None or self.__file_signature() != self._file_signature:
+                self.load()
+                return True
+        return False
+
+    def load_stats(self) -> dict:
+        return {
+            "loads": self.load_count,
+            "reload_checks": self.reload_check_count,
+            "generation": self.reader.generation if self.reader else None,
+        }
+
+    def __file_signature(self) -> tuple[int, int, int]:
+        st = os.stat(self.index_path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def __freeze(self, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        """Serialize the build-time dicts into the compact index layout."""
+        doc_ids = np.array(sorted(self.doc_lengths), dtype=np.int64)
+        row_of = {doc_id: row for row, doc_id in enumerate(doc_ids.tolist())}
+        doc_lengths = np.array(
+            [self.doc_lengths[doc_id] for doc_id in doc_ids.tolist()], dtype=np.int32
+        )
+
+        terms = sorted(self.index)
+        term_rows = []
+        term_tfs = []
+        for term in terms:
+            rows = sorted(row_of[doc_id] for doc_id in self.index[term])
+            term_rows.append(np.array(rows, dtype=np.int64))
+            term_tfs.append(
+                np.array(
+                    [self.term_frequencies[doc_ids[row]][term] for row in rows],
+                    dtype=np.uint32,
+                )
+            )
+
+        impacts, max_impacts = bm25_impacts(term_rows, term_tfs, doc_lengths, k1, b)
+        buffer = io.BytesIO()
+        write_index(
+            buffer,
+            doc_ids,
+            doc_lengths,
+            terms,
+            term_rows,
+            term_tfs,
+            impacts,
+            max_impacts,
+            k1,
+            b,
+            fingerprint=self.documents.fingerprint,
+        )
+        self.__set_reader(IndexReader(buffer.getvalue()))
+        self.index = defaultdict(set)
+        self.term_frequencies = defaultdict(Counter)
+        self.doc_lengths = {}
+
+    def get_impacts(self, k1: float = BM25_K1, b: float = BM25_B) -> "ImpactIndex":
+        """Return the impact index, rebuilding it if k1/b no longer match."""
+        if self.impacts is None or not self.impacts.matches(k1, b):
+            self.impacts = ImpactIndex(self.reader, k1, b)
+        return self.impacts
 
     def get_documents(self, term: str) -> list[int]:
-        doc_ids = self.index.get(term, set())
-        return sorted(list(doc_ids))
+        doc_ids, _ = self.__live_postings(term)
+        return doc_ids.tolist()
 
-    def __add_document(self, doc_id: int, text: str) -> None:
-        tokens = tokenize_text(text)
+    def __add_document(self, doc_id: int, tokens: list[str]) -> None:
         for token in set(tokens):
             self.index[token].add(doc_id)
         self.term_frequencies[doc_id].update(tokens)
         self.doc_lengths[doc_id] = len(tokens)
 
+    @property
+    def is_dirty(self) -> bool:
+        """True while documents added or deleted since the last compaction."""
+        return bool(self.doc_lengths) or bool(self.deleted)
+
+    def has_document(self, doc_id: int) -> bool:
+        if doc_id in self.doc_lengths:
+            return True
+        return (
+            self.reader is not None
+            and doc_id not in self.deleted
+            and self.reader.row_of(doc_id) is not None
+        )
+
+    def add_documents(self, movies: list[dict]) -> None:
+        """Index new movies without rebuilding the compacted index."""
+        seen = set()
+        for m in movies:
+            if self.has_document(m["id"]) or m["id"] in seen:
+                raise ValueError(f"document {m['id']} is already indexed")
+            seen.add(m["id"])
+        self.add_movies(movies)
+        if not self._shared_documents:
+            self._documents = self.documents.writable()
+            self._documents.add_missing(movies)
+        self._live_stats = None
+        self.maybe_compact()
+
+    def update_document(self, movie: dict) -> None:
+        self.delete_document(movie["id"])
+        self.add_documents([movie])
+
+    def delete_document(self, doc_id: int) -> None:
+        """Remove a movie; compacted documents are tombstoned until compaction."""
+        if doc_id in self.doc_lengths:
+            for term in self.term_frequencies.pop(doc_id):
+                self.index[term].discard(doc_id)
+                if not self.index[term]:
+                    del self.index[term]
+            del self.doc_lengths[doc_id]
+        elif self.has_document(doc_id):
+            self.deleted.add(doc_id)
+        else:
+            raise ValueError(f"document {doc_id} is not indexed")
+        if not self._shared_documents:
+            self._documents = self.documents.writable()
+            self._documents.discard(doc_id)
+        self._live_stats = None
+        self.maybe_compact()
+
+    def maybe_compact(self) -> bool:
+        """Compact once pending changes exceed COMPACTION_RATIO of the index."""
+        base_docs = self.reader.n_docs if self.reader is not None else 0
+        pending = len(self.deleted) + len(self.doc_lengths)
+        if pending > COMPACTION_RATIO * base_docs:
+            self.compact()
+            return True
+        return False
+
+    def compact(self) -> None:
+        """Fold added documents in and drop tombstoned ones."""
+        if self.reader is not None:
+            doc_ids = self.reader.doc_ids.tolist()
+            lengths = self.reader.doc_lengths.tolist()
+            all_rows = self.reader.all_rows().tolist()
+            all_tfs = self.reader.tfs.tolist()
+            offsets = self.reader.tf_offsets.tolist()
+            for term_id in range(self.reader.n_terms):
+                term = self.reader.terms[term_id]
+                for pos in range(offsets[term_id], offsets[term_id + 1]):
+                    doc_id = doc_ids[all_rows[pos]]
+                    if doc_id in self.deleted:
+                        continue
+                    self.index[term].add(doc_id)
+                    self.term_frequencies[doc_id][term] = all_tfs[pos]
+            for doc_id, length in zip(doc_ids, lengths):
+                if doc_id not in self.deleted:
+                    self.doc_lengths[doc_id] = length
+        self.deleted = set()
+        self._live_stats = None
+        if not self._shared_documents and self._documents is not None:
+            if self._documents.deleted_rows:
+                self._documents.compact()
+        self.__freeze()
+
+    def __live_postings(self, token: str) -> tuple[np.ndarray, np.ndarray]:
+        """Sorted doc ids and term frequencies of live documents with `token`."""
+        doc_ids = np.zeros(0, dtype=np.int64)
+        tfs = np.zeros(0, dtype=np.int64)
+        term_id = self.reader.term_id(token) if self.reader is not None else None
+        if term_id is not None:
+            doc_ids = self.reader.doc_ids[self.reader.rows(term_id)]
+            tfs = self.reader.tfs[self.reader.posting_slice(term_id)].astype(np.int64)
+            if self.deleted:
+                keep = ~np.isin(doc_ids, list(self.deleted))
+                doc_ids, tfs = doc_ids[keep], tfs[keep]
+
+        added = self.index.get(token)
+        if added:
+            added_ids = sorted(added)
+            doc_ids = np.concatenate([doc_ids, np.array(added_ids, dtype=np.int64)])
+            tfs = np.concatenate(
+                [
+                    tfs,
+                    np.array(
+                        [self.term_frequencies[d][token] for d in added_ids],
+                        dtype=np.int64,
+                    ),
+                ]
+            )
+            order = np.argsort(doc_ids, kind="stable")
+            doc_ids, tfs = doc_ids[order], tfs[order]
+        return doc_ids, tfs
+
+    def __live_stats(self) -> tuple[int, float]:
+        """Live document count and average document length."""
+        if self._live_stats is None:
+            doc_count = 0
+            total_length = 0
+            if self.reader is not None:
+                doc_count = self.reader.n_docs - len(self.deleted)
+                total_length = self.reader.total_doc_length
+                for doc_id in self.deleted:
+                    total_length -= int(
+                        self.reader.doc_lengths[self.reader.row_of(doc_id)]
+                    )
+            doc_count += len(self.doc_lengths)
+            total_length += sum(self.doc_lengths.values())
+            avg_doc_length = total_length / doc_count if doc_count else 0.0
+            self._live_stats = (doc_count, avg_doc_length)
+        return self._live_stats
+
+    def __doc_lengths_of(self, doc_ids: np.ndarray) -> np.ndarray:
+        lengths = np.zeros(len(doc_ids), dtype=np.int64)
+        for i, doc_id in enumerate(doc_ids.tolist()):
+            if doc_id in self.doc_lengths:
+                lengths[i] = self.doc_lengths[doc_id]
+            elif self.reader is not None and doc_id not in self.deleted:
+                row = self.reader.row_of(doc_id)
+                if row is not None:
+                    lengths[i] = self.reader.doc_lengths[row]
+        return lengths
+
     def get_tf(self, doc_id: int, term: str) -> int:
-        tokens = tokenize_text(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        return self.term_frequencies[doc_id][token]
+        doc_ids, tfs = self.__live_postings(token)
+        pos = int(np.searchsorted(doc_ids, doc_id))
+        if pos == len(doc_ids) or doc_ids[pos] != doc_id:
+            return 0
+        return int(tfs[pos])
+
+    def __get_doc_freq(self, token: str) -> int:
+        doc_ids, _ = self.__live_postings(token)
+        return len(doc_ids)
 
     def get_idf(self, term: str) -> float:
-        tokens = tokenize_text(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index[token])
+        doc_count, _ = self.__live_stats()
+        term_doc_count = self.__get_doc_freq(token)
         return math.log((doc_count + 1) / (term_doc_count + 1))
 
     def get_bm25_idf(self, term: str) -> float:
-        tokens = tokenize_text(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index.get(token, []))
+        doc_count, _ = self.__live_stats()
+        term_doc_count = self.__get_doc_freq(token)
         return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
 
     def get_bm25_tf(
         self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
     ) -> float:
         tf = self.get_tf(doc_id, term)
-        doc_length = self.doc_lengths.get(doc_id, 0)
-        avg_doc_length = self.__get_avg_doc_length()
+        doc_length = int(self.__doc_lengths_of(np.array([doc_id]))[0])
+        _, avg_doc_length = self.__live_stats()
         if avg_doc_length > 0:
             length_norm = 1 - b + b * (doc_length / avg_doc_length)
         else:
@@ -110,55 +506,397 @@ class InvertedIndex:
         idf = self.get_idf(term)
         return tf * idf
 
-    def __get_avg_doc_length(self) -> float:
-        if not self.doc_lengths or len(self.doc_lengths) == 0:
-            return 0.0
-        total_length = 0
-        for length in self.doc_lengths.values():
-            total_length += length
-        return total_length / len(self.doc_lengths)
-
     def bm25(self, doc_id: int, term: str) -> float:
         tf_component = self.get_bm25_tf(doc_id, term)
         idf_component = self.get_bm25_idf(term)
         return tf_component * idf_component
 
-    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-        query_tokens = tokenize_text(query)
-
-        scores = {}
-        for doc_id in self.docmap:
-            score = 0.0
-            for token in query_tokens:
-                score += self.bm25(doc_id, token)
-            scores[doc_id] = score
-
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-
-        results = []
-        for doc_id, score in sorted_docs[:limit]:
-            doc = self.docmap[doc_id]
-            formatted_result = format_search_result(
-                doc_id=doc["id"],
-                title=doc["title"],
-                document=doc["description"],
-                score=score,
+    def bm25_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ) -> list[SearchHit]:
+        tokens = self.tokenizer.tokenize(query)
+        if self.is_dirty:
+            doc_ids, scores = self.__live_top_k(tokens, limit, k1, b)
+            doc_ids, scores = pad_with_unmatched(
+                self.__live_doc_ids(), doc_ids, scores, limit
+            )
+            documents = self.documents
+        else:
+            with self.__pinned(k1, b) as (impacts, documents):
+                doc_ids, scores = impacts.top_k(tokens, limit)
+                doc_ids, scores = pad_with_unmatched(
+                    impacts.doc_ids, doc_ids, scores, limit
+                )
+
+        hits = []
+        for doc_id, score in zip(doc_ids.tolist(), scores.tolist()):
+            row = documents.row_of(doc_id)
+            # an index saved out of step with the catalog can name documents
+            # the store no longer has
+            if row is not None:
+                hits.append(SearchHit(documents, row, score))
+        return hits
+
+    def __live_doc_ids(self) -> np.ndarray:
+        doc_ids = np.zeros(0, dtype=np.int64)
+        if self.reader is not None:
+            doc_ids = self.reader.doc_ids
+            if self.deleted:
+                doc_ids = doc_ids[~np.isin(doc_ids, list(self.deleted))]
+        if self.doc_lengths:
+            added = np.fromiter(self.doc_lengths, dtype=np.int64)
+            doc_ids = np.sort(np.concatenate([doc_ids, added]))
+        return doc_ids
+
+    def __live_top_k(
+        self, tokens: list[str], limit: int, k1: float, b: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Score with live statistics while uncompacted changes are pending."""
+        doc_count, avg_doc_length = self.__live_stats()
+        matched_ids = []
+        matched_weights = []
+        for token in tokens:
+            doc_ids, tfs = self.__live_postings(token)
+            if not len(doc_ids):
+                continue
+            idf = bm25_idf(np.array([len(doc_ids)], dtype=np.float64), doc_count)
+            matched_ids.append(doc_ids)
+            matched_weights.append(
+                bm25_weights(
+                    np.repeat(idf, len(doc_ids)),
+                    tfs,
+                    self.__doc_lengths_of(doc_ids),
+                    avg_doc_length,
+                    k1,
+                    b,
+                )
+            )
+        if not matched_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        doc_ids, inverse = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_weights))
+        return select_top_k(doc_ids, scores, limit)
+
+    def bm25_scores(
+        self, query: str, k1: float = BM25_K1, b: float = BM25_B
+    ) -> dict[int, float]:
+        """Score documents term-at-a-time by walking each query term's postings.
+
+        Only documents containing at least one query token get a score, and
+        IDF / average document length are computed once per query rather than
+        once per (document, token) pair. This is the reference path; searches
+        go through the precomputed `ImpactIndex`.
+        """
+        doc_count, avg_doc_length = self.__live_stats()
+
+        scores: dict[int, float] = defaultdict(float)
+        for token in self.tokenizer.tokenize(query):
+            doc_ids, tfs = self.__live_postings(token)
+            if not len(doc_ids):
+                continue
+            term_doc_count = len(doc_ids)
+            idf = math.log(
+                (doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1
+            )
+            lengths = self.__doc_lengths_of(doc_ids)
+            for doc_id, tf, doc_length in zip(
+                doc_ids.tolist(), tfs.tolist(), lengths.tolist()
+            ):
+                if avg_doc_length > 0:
+                    length_norm = 1 - b + b * (doc_length / avg_doc_length)
+                else:
+                    length_norm = 1
+                scores[doc_id] += idf * (tf * (k1 + 1)) / (tf + k1 * length_norm)
+
+        return dict(scores)
+
+
+def stale_index_error(path: str, reason: str) -> ValueError:
+    return ValueError(
+        f"{path} is stale: {reason}. "
+        "Run `keyword_search_cli.py build` to rebuild it."
+    )
+
+
+def bm25_idf(doc_freqs: np.ndarray, doc_count: int) -> np.ndarray:
+    return np.log((doc_count - doc_freqs + 0.5) / (doc_freqs + 0.5) + 1)
+
+
+def bm25_weights(
+    idf: np.ndarray,
+    tfs: np.ndarray,
+    doc_lengths: np.ndarray,
+    avg_doc_length: float,
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> np.ndarray:
+    """BM25 weight of each posting given its term's IDF and its document."""
+    tfs = np.asarray(tfs, dtype=np.float64)
+    if avg_doc_length > 0:
+        length_norm = 1 - b + b * (np.asarray(doc_lengths) / avg_doc_length)
+    else:
+        length_norm = np.ones(len(tfs), dtype=np.float64)
+    return idf * (tfs * (k1 + 1)) / (tfs + k1 * length_norm)
+
+
+def pad_with_unmatched(
+    live_ids: np.ndarray, doc_ids: np.ndarray, scores: np.ndarray, limit: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fill a short result list up to `limit` with zero-score documents of
+    the sorted `live_ids`, in doc id order, as scoring every document did.
+
+    The hybrid legs rely on this: a deep BM25 list keeps its zero-score
+    tail as candidates, and min-max normalization keeps 0 as the floor
+    rather than mapping the weakest real match to it.
+    """
+    needed = limit - len(doc_ids)
+    if needed <= 0:
+        return doc_ids, scores
+    live = live_ids[: needed + len(doc_ids)]
+    padding = live[~np.isin(live, doc_ids)][:needed]
+    return (
+        np.concatenate([doc_ids, padding]),
+        np.concatenate([scores, np.zeros(len(padding))]),
+    )
+
+
+def select_top_k(
+    doc_ids: np.ndarray, scores: np.ndarray, limit: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Best `limit` non-zero scores as (doc_ids, scores), ties by doc id."""
+    candidates = np.flatnonzero(scores)
+    if 0 < limit < len(candidates):
+        candidate_scores = scores[candidates]
+        kth = np.partition(candidate_scores, len(candidates) - limit)[
+            len(candidates) - limit
+        ]
+        candidates = candidates[candidate_scores >= kth]
+    order = np.lexsort((doc_ids[candidates], -scores[candidates]))
+    top = candidates[order[:limit]]
+    return doc_ids[top], scores[top]
+
+
+def bm25_impacts(
+    term_rows: list[np.ndarray],
+    term_tfs: list[np.ndarray],
+    doc_lengths: np.ndarray,
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> tuple[np.ndarray, np.ndarray]:
+    """BM25 weight of every posting, plus the maximum weight of each term."""
+    counts = np.array([len(rows) for rows in term_rows], dtype=np.int64)
+    if not term_rows or counts.sum() == 0:
+        return np.zeros(0, dtype=np.float64), np.zeros(len(term_rows), np.float64)
+    rows = np.concatenate(term_rows)
+    tfs = np.concatenate(term_tfs).astype(np.float64)
+
+    lengths = np.asarray(doc_lengths, dtype=np.float64)
+    doc_count = len(lengths)
+    avg_doc_length = float(lengths.sum() / doc_count) if doc_count else 0.0
+    idf = bm25_idf(counts.astype(np.float64), doc_count)
+    weights = bm25_weights(
+        np.repeat(idf, counts), tfs, lengths[rows], avg_doc_length, k1, b
+    )
+
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    max_weights = np.zeros(len(term_rows), dtype=np.float64)
+    nonempty = counts > 0
+    max_weights[nonempty] = np.maximum.reduceat(weights, starts[nonempty])
+    return weights, max_weights
+
+
+class ImpactIndex:
+    """Per-term BM25 weights for a fixed k1/b over an `IndexReader`.
+
+    Weights for the k1/b the index was built with are read straight from the
+    index file; other parameters are recomputed for every posting at once.
+    Scoring a query is a scatter-add of a few weight arrays into a dense
+    score vector.
+    """
+
+    def __init__(
+        self, reader: IndexReader, k1: float | None = None, b: float | None = None
+    ) -> None:
+        self.reader = reader
+        self.k1 = reader.k1 if k1 is None else k1
+        self.b = reader.b if b is None else b
+        self.doc_ids = reader.doc_ids
+        if self.k1 == reader.k1 and self.b == reader.b:
+            self.weights = reader.impacts
+        else:
+            all_rows = reader.all_rows()
+            counts = np.diff(reader.tf_offsets).astype(np.int64)
+            splits = np.cumsum(counts)[:-1]
+            self.weights, _ = bm25_impacts(
+                np.split(all_rows, splits),
+                np.split(reader.tfs, splits),
+                reader.doc_lengths,
+                self.k1,
+                self.b,
+            )
+
+    def matches(self, k1: float, b: float) -> bool:
+        return self.k1 == k1 and self.b == b
+
+    def postings(self, token: str) -> tuple[np.ndarray, np.ndarray]:
+        term_id = self.reader.term_id(token)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64), self.weights[:0]
+        return (
+            self.reader.rows(term_id),
+            self.weights[self.reader.posting_slice(term_id)],
+        )
+
+    def scores(self, tokens: list[str]) -> np.ndarray:
+        scores = np.zeros(len(self.doc_ids), dtype=np.float64)
+        for token in tokens:
+            rows, weights = self.postings(token)
+            scores[rows] += weights
+        return scores
+
+    def top_k(self, tokens: list[str], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """Return (doc_ids, scores) of the best `limit` matches, ties by doc id."""
+        return select_top_k(self.doc_ids, self.scores(tokens), limit)
+
+
+class SpilledRuns:
+    """Build-time postings flushed to sorted run files in `directory`.
+
+    Each run holds every term of the documents spilled into it, in term
+    order; `merge` combines the runs into one index, merging at most
+    INDEX_MERGE_FAN_IN at a time so the number of open files stays bounded.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.paths: list[str] = []
+        self.doc_ids = array("q")
+        self.doc_lengths = array("q")
+        self._next = 0
+
+    def _new_path(self) -> str:
+        self._next += 1
+        return os.path.join(self.directory, f"run-{self._next}.bin")
+
+    def spill(
+        self,
+        index: dict[str, set[int]],
+        term_frequencies: dict[int, Counter],
+        doc_lengths: dict[int, int],
+    ) -> None:
+        path = self._new_path()
+        with open(path, "wb") as f:
+            write_run(
+                f,
+                (
+                    (term, doc_ids, [term_frequencies[d][term] for d in doc_ids])
+                    for term in sorted(index)
+                    for doc_ids in [sorted(index[term])]
+                ),
+            )
+        self.paths.append(path)
+        self.doc_ids.extend(doc_lengths)
+        self.doc_lengths.extend(doc_lengths.values())
+
+    def _postings(
+        self, paths: list[str]
+    ) -> Iterator[tuple[str, np.ndarray, np.ndarray]]:
+        """(term, doc_ids, tfs) over several runs, each term once."""
+        records = heapq.merge(*(iter_run(path) for path in paths), key=lambda r: r[0])
+        for term, group in groupby(records, key=lambda r: r[0]):
+            group = list(group)
+            yield (
+                term,
+                np.concatenate([doc_ids for _, doc_ids, _ in group]),
+                np.concatenate([tfs for _, _, tfs in group]),
             )
-            results.append(formatted_result)
 
-        return results
+    def merge(
+        self,
+        f,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        fingerprint: bytes = NO_FINGERPRINT,
+    ) -> None:
+        """Write the index of every spilled document to `f`, recording the
+        `fingerprint` of the catalog they came from."""
+        while len(self.paths) > INDEX_MERGE_FAN_IN:
+            merged = []
+            for i in range(0, len(self.paths), INDEX_MERGE_FAN_IN):
+                group = self.paths[i : i + INDEX_MERGE_FAN_IN]
+                path = self._new_path()
+                with open(path, "wb") as out:
+                    write_run(out, self._postings(group))
+                for done in group:
+                    os.remove(done)
+                merged.append(path)
+            self.paths = merged
+
+        doc_ids = np.frombuffer(self.doc_ids, dtype=np.int64)
+        order = np.argsort(doc_ids, kind="stable")
+        doc_ids = doc_ids[order]
+        if len(doc_ids) and (np.diff(doc_ids) == 0).any():
+            raise ValueError("catalog contains duplicate movie ids")
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int64)[order]
+        writer = IndexWriter(f, doc_ids, doc_lengths, k1, b, fingerprint=fingerprint)
+
+        # impacts need only per-document lengths, so they are computed for
+        # a bounded batch of terms at a time
+        batch: list[tuple[str, np.ndarray, np.ndarray]] = []
+        batch_postings = 0
+
+        def flush() -> None:
+            impacts, max_impacts = bm25_impacts(
+                [rows for _, rows, _ in batch],
+                [tfs for _, _, tfs in batch],
+                doc_lengths,
+                k1,
+                b,
+            )
+            start = 0
+            for (term, rows, tfs), max_impact in zip(batch, max_impacts):
+                end = start + len(rows)
+                writer.add(term, rows, tfs, impacts[start:end], max_impact)
+                start = end
+            batch.clear()
+
+        for term, term_doc_ids, tfs in self._postings(self.paths):
+            rows = np.searchsorted(doc_ids, term_doc_ids)
+            by_row = np.argsort(rows, kind="stable")
+            batch.append((term, rows[by_row], tfs[by_row]))
+            batch_postings += len(rows)
+            if batch_postings >= INDEX_SPILL_POSTINGS:
+                flush()
+                batch_postings = 0
+        flush()
+        writer.close()
+
+
+def build_segment(
+    movies: list[dict],
+) -> tuple[dict[str, set[int]], dict[int, Counter], dict[int, int]]:
+    """Index one shard of movies in a worker process."""
+    idx = InvertedIndex()
+    idx.add_movies(movies)
+    return dict(idx.index), dict(idx.term_frequencies), idx.doc_lengths
 
 
-def build_command() -> None:
+def build_command(workers: int = 1, catalog_path: str | None = None) -> None:
     idx = InvertedIndex()
-    idx.build()
+    idx.build(workers, catalog_path)
     idx.save()
 
 
-def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-    idx = InvertedIndex()
+def search_command(
+    query: str, limit: int = DEFAULT_SEARCH_LIMIT, catalog_path: str | None = None
+) -> list[dict]:
+    idx = InvertedIndex(documents=load_doc_store(catalog_path))
     idx.load()
-    query_tokens = tokenize_text(query)
+    query_tokens = idx.tokenizer.tokenize(query)
     seen, results = set(), []
     for query_token in query_tokens:
         matching_doc_ids = idx.get_documents(query_token)
@@ -166,7 +904,9 @@ def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
             if doc_id in seen:
                 continue
             seen.add(doc_id)
-            doc = idx.docmap[doc_id]
+            doc = idx.documents.get(doc_id)
+            if doc is None:
+                continue
             results.append(doc)
             if len(results) >= limit:
                 return results
@@ -174,29 +914,59 @@ def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
     return results
 
 
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+STEM_CACHE_SIZE = 100_000
+
+
 def preprocess_text(text: str) -> str:
     text = text.lower()
-    text = text.translate(str.maketrans("", "", string.punctuation))
+    text = text.translate(PUNCTUATION_TABLE)
     return text
 
 
+class Tokenizer:
+    """Lowercase, strip punctuation, drop stopwords and Porter-stem.
+
+    Holds the stopword set and stemmer for its whole lifetime, and memoizes
+    stems since the vocabulary is far smaller than the number of tokens.
+    """
+
+    def __init__(
+        self,
+        stopwords: frozenset[str] | None = None,
+        stem_cache_size: int = STEM_CACHE_SIZE,
+    ) -> None:
+        if stopwords is None:
+            stopwords = frozenset(load_stopwords())
+        self.stopwords = stopwords
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+    def tokenize(self, text: str) -> list[str]:
+        stop_words = self.stopwords
+        stem = self.stem
+        return [
+            stem(word)
+            for word in preprocess_text(text).split()
+            if word not in stop_words
+        ]
+
+    def tokenize_many(self, texts: Iterable[str]) -> list[list[str]]:
+        return [self.tokenize(text) for text in texts]
+
+
+_default_tokenizer: Tokenizer | None = None
+
+
+def get_tokenizer() -> Tokenizer:
+    global _default_tokenizer
+    if _default_tokenizer is None:
+        _default_tokenizer = Tokenizer()
+    return _default_tokenizer
+
+
 def tokenize_text(text: str) -> list[str]:
-    text = preprocess_text(text)
-    tokens = text.split()
-    valid_tokens = []
-    for token in tokens:
-        if token:
-            valid_tokens.append(token)
-    stop_words = load_stopwords()
-    filtered_words = []
-    for word in valid_tokens:
-        if word not in stop_words:
-            filtered_words.append(word)
-    stemmer = PorterStemmer()
-    stemmed_words = []
-    for word in filtered_words:
-        stemmed_words.append(stemmer.stem(word))
-    return stemmed_words
+    return get_tokenizer().tokenize(text)
 
 
 def tf_command(doc_id: int, term: str) -> int:
@@ -231,7 +1001,9 @@ def tfidf_command(doc_id: int, term: str) -> float:
     return idx.get_tf_idf(doc_id, term)
 
 
-def bm25search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-    idx = InvertedIndex()
+def bm25search_command(
+    query: str, limit: int = DEFAULT_SEARCH_LIMIT, catalog_path: str | None = None
+) -> list[dict]:
+    idx = InvertedIndex(documents=load_doc_store(catalog_path))
     idx.load()
-    return idx.bm25_search(query, limit)
+    return hits_to_dicts(idx.bm25_search(query, limit))
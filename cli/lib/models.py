@@ -0,0 +1,27 @@
+from functools import lru_cache
+
+# torch, sentence-transformers and the Gemini SDK are imported on first use,
+# so commands that never touch a model (BM25 search, --server forwarding)
+# start without paying for them. Each model or client is built once per
+# process and shared by every caller.
+
+
+@lru_cache(maxsize=None)
+def get_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_genai_client(api_key: str | None):
+    from google import genai
+
+    return genai.Client(api_key=api_key)
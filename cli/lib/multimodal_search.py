@@ -1,10 +1,25 @@
+import numpy as np
 from PIL import Image
-from sentence_transformers import SentenceTransformer, util
+
+from .doc_store import as_doc_store
+from .embedding_cache import EmbeddingCache
+from .embedding_store import (
+    load_embeddings_file,
+    normalize_embeddings,
+    save_embeddings_file,
+)
+from .models import get_sentence_transformer
+from .quantization import load_or_build_quantized
+from .search_utils import CLIP_TEXT_EMBEDDINGS_PATH
+from .semantic_search import quantized_shortlist, top_k_indices
+
+IMAGE_SEARCH_LIMIT = 5
 
 class MultimodalSearch:
     # Move documents to the first position
-    def __init__(self, documents, model_name="clip-ViT-B-32"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, documents, model_name="clip-ViT-B-32", quantization=None):
+        self.model_name = model_name
+        self.embedding_cache = EmbeddingCache(model_name)
         self.documents = documents
         
         self.texts = [
@@ -12,12 +27,44 @@ class MultimodalSearch:
             for doc in self.documents
         ]
         
+        self.text_embeddings = self.load_or_create_text_embeddings()
+
+        # first-pass scan over int8/PQ codes, re-scoring candidates against
+        # the memory-mapped float embeddings
+        self.quantized = None
+        if quantization is not None:
+            self.quantized = load_or_build_quantized(
+                CLIP_TEXT_EMBEDDINGS_PATH,
+                self.text_embeddings,
+                quantization,
+                self.texts_fingerprint(),
+            )
+
+    @property
+    def model(self):
+        return get_sentence_transformer(self.model_name)
+
+    def texts_fingerprint(self) -> str:
+        # identifies the catalog behind the saved text embeddings and codes
+        return as_doc_store(self.documents).fingerprint.hex()
+
+    def load_or_create_text_embeddings(self):
+        # re-embed when the catalog was edited, even if its size is unchanged
+        fingerprint = self.texts_fingerprint()
+        embeddings = load_embeddings_file(
+            CLIP_TEXT_EMBEDDINGS_PATH, self.model_name, fingerprint
+        )
+        if embeddings is not None and len(embeddings) == len(self.texts):
+            return embeddings
+
         print(f"Encoding {len(self.texts)} movie descriptions...")
-        self.text_embeddings = self.model.encode(
-            self.texts, 
-            show_progress_bar=True, 
-            convert_to_tensor=True
+        embeddings = normalize_embeddings(
+            self.embedding_cache.encode(self.texts, show_progress_bar=True)
+        )
+        save_embeddings_file(
+            CLIP_TEXT_EMBEDDINGS_PATH, embeddings, self.model_name, fingerprint
         )
+        return load_embeddings_file(CLIP_TEXT_EMBEDDINGS_PATH, self.model_name)
 
     def embed_image(self, image_path: str):
         """
@@ -29,24 +76,30 @@ class MultimodalSearch:
         return embedding
 
     def search_with_image(self, image_path: str):
-        image_embedding = self.model.encode(
-            [Image.open(image_path)], 
-            convert_to_tensor=True
-        )[0]
-        
-        similarities = util.cos_sim(image_embedding, self.text_embeddings)[0]
+        image_embedding = normalize_embeddings(
+            self.model.encode([Image.open(image_path)])[0]
+        )
+
+        if self.quantized is not None:
+            rows = quantized_shortlist(
+                self.quantized, image_embedding, None, IMAGE_SEARCH_LIMIT
+            )
+            similarities = self.text_embeddings[rows] @ image_embedding
+        else:
+            rows = np.arange(len(self.text_embeddings))
+            similarities = self.text_embeddings @ image_embedding
         
         results = []
-        for i, score in enumerate(similarities):
+        for i in top_k_indices(similarities, IMAGE_SEARCH_LIMIT):
+            doc = self.documents[int(rows[i])]
             results.append({
-                "id": self.documents[i].get("id"),
-                "title": self.documents[i].get("title"),
-                "description": self.documents[i].get("description"),
-                "score": score.item()
+                "id": doc.get("id"),
+                "title": doc.get("title"),
+                "description": doc.get("description"),
+                "score": float(similarities[i])
             })
         
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:5]
+        return results
 
 def verify_image_embedding(image_path: str):
     """
@@ -57,11 +110,11 @@ def verify_image_embedding(image_path: str):
     
     print(f"Embedding shape: {embedding.shape[0]} dimensions")
 
-def image_search_command(image_path: str):
-    # This assumes you have a helper to load your movie dataset
-    # For this example, we'll assume 'load_movies()' exists or you provide a list
-    from lib.search_utils import load_movies # Placeholder for your data loading logic
-    movies = load_movies() 
-    
-    search_engine = MultimodalSearch(movies)
+def image_search_command(image_path: str, quantization=None, search_engine=None):
+    # a long-lived caller (the search server) passes its own warm engine
+    if search_engine is None:
+        from .doc_store import load_doc_store
+
+        movies = load_doc_store()
+        search_engine = MultimodalSearch(movies, quantization=quantization)
     return search_engine.search_with_image(image_path)
\ No newline at end of file
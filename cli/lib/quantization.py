@@ -0,0 +1,237 @@
+import os
+
+import numpy as np
+
+from .search_utils import (
+    PQ_KMEANS_ITERATIONS,
+    PQ_SUBVECTOR_DIM,
+    PQ_TRAIN_SAMPLE,
+    QUANTIZATION_METHODS,
+    QUANTIZED_RESCORE_FACTOR,
+    QUANTIZED_SCAN_BLOCK,
+)
+
+QUANTIZED_FORMAT_VERSION = 1
+
+
+def quantized_path(embeddings_path: str, method: str) -> str:
+    """Where the codes for an embeddings file are stored."""
+    return f"{os.path.splitext(embeddings_path)[0]}_{method}.npz"
+
+
+def kmeans(
+    vectors: np.ndarray, n_clusters: int, n_iter: int, seed: int = 0
+) -> np.ndarray:
+    """Euclidean k-means (Lloyd's algorithm); returns the centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignment = nearest_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = counts == 0
+        counts[empty] = 1
+        updated = sums / counts[:, None]
+        updated[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        if np.array_equal(updated, centroids):
+            break
+        centroids = updated
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 does not change the argmin
+    distances = (centroids**2).sum(axis=1) - 2 * (vectors @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+
+class ScalarQuantizer:
+    """int8 codes with a per-dimension scale: 4x smaller than float32."""
+
+    method = "int8"
+    state_keys = ("scale",)
+
+    def __init__(self, scale: np.ndarray) -> None:
+        self.scale = scale
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "ScalarQuantizer":
+        scale = np.abs(vectors).max(axis=0) / 127
+        scale[scale == 0] = 1.0
+        return cls(scale.astype(np.float32))
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint(vectors / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # fold the scale into the query so the codes are only upcast once
+        return codes.astype(np.float32) @ (query * self.scale).astype(np.float32)
+
+
+class ProductQuantizer:
+    """One byte per PQ_SUBVECTOR_DIM dimensions, 16x smaller than float32.
+
+    Each subvector is replaced by the nearest of 256 centroids learned for
+    its subspace; a query scores every code with one lookup table per
+    subspace.
+    """
+
+    method = "pq"
+    state_keys = ("codebooks",)
+
+    def __init__(self, codebooks: np.ndarray) -> None:
+        self.codebooks = codebooks
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "ProductQuantizer":
+        n, dim = vectors.shape
+        if dim % PQ_SUBVECTOR_DIM:
+            raise ValueError(
+                f"embedding dimension {dim} is not a multiple of {PQ_SUBVECTOR_DIM}"
+            )
+        rng = np.random.default_rng(0)
+        if n > PQ_TRAIN_SAMPLE:
+            vectors = vectors[rng.choice(n, PQ_TRAIN_SAMPLE, replace=False)]
+        n_centroids = min(256, len(vectors))
+        subvectors = cls._split(vectors, dim // PQ_SUBVECTOR_DIM)
+        codebooks = np.stack(
+            [
+                kmeans(subvectors[:, m], n_centroids, PQ_KMEANS_ITERATIONS)
+                for m in range(subvectors.shape[1])
+            ]
+        )
+        return cls(codebooks.astype(np.float32))
+
+    @staticmethod
+    def _split(vectors: np.ndarray, n_subvectors: int) -> np.ndarray:
+        return vectors.reshape(len(vectors), n_subvectors, -1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subvectors = self._split(vectors, len(self.codebooks))
+        codes = np.empty((len(vectors), len(self.codebooks)), dtype=np.uint8)
+        for m, codebook in enumerate(self.codebooks):
+            codes[:, m] = nearest_centroids(subvectors[:, m], codebook)
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        subqueries = query.reshape(len(self.codebooks), -1)
+        lookup = np.einsum("mkd,md->mk", self.codebooks, subqueries)
+        return lookup[np.arange(len(self.codebooks)), codes].sum(axis=1)
+
+
+QUANTIZERS = {
+    quantizer.method: quantizer for quantizer in (ScalarQuantizer, ProductQuantizer)
+}
+
+
+class QuantizedEmbeddings:
+    """Compressed codes for an embedding matrix, used for a first-pass scan.
+
+    Scores are approximate; callers keep a generous candidate pool and
+    re-score it against the float embeddings. `fingerprint` is that of the
+    embeddings the codes were saved for, None for unsaved codes.
+    """
+
+    def __init__(self, quantizer, codes: np.ndarray) -> None:
+        self.quantizer = quantizer
+        self.codes = codes
+        self.fingerprint: str | None = None
+
+    @property
+    def method(self) -> str:
+        return self.quantizer.method
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, method: str) -> "QuantizedEmbeddings":
+        if method not in QUANTIZATION_METHODS:
+            raise ValueError(f"unknown quantization method: {method}")
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        quantizer = QUANTIZERS[method].train(embeddings)
+        return cls(quantizer, quantizer.encode(embeddings))
+
+    def scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """Approximate scores of `rows` (default: every row) for a query."""
+        codes = self.codes if rows is None else self.codes[rows]
+        # scan in blocks so the upcast codes never need a full float copy
+        return np.concatenate(
+            [
+                self.quantizer.scores(codes[i : i + QUANTIZED_SCAN_BLOCK], query)
+                for i in range(0, len(codes), QUANTIZED_SCAN_BLOCK)
+            ]
+            or [np.zeros(0, dtype=np.float32)]
+        )
+
+    def add(self, embeddings: np.ndarray) -> "QuantizedEmbeddings":
+        """Codes with rows appended, encoded with the existing quantizer."""
+        codes = self.quantizer.encode(np.asarray(embeddings, dtype=np.float32))
+        return QuantizedEmbeddings(self.quantizer, np.concatenate([self.codes, codes]))
+
+    def keep_rows(self, rows) -> "QuantizedEmbeddings":
+        return QuantizedEmbeddings(self.quantizer, self.codes[rows])
+
+    def save(self, path: str, fingerprint: str | None = None) -> None:
+        """Write the codes, recording the `fingerprint` of the embeddings
+        they encode."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            version=QUANTIZED_FORMAT_VERSION,
+            method=self.method,
+            codes=self.codes,
+            fingerprint=fingerprint or "",
+            **{key: getattr(self.quantizer, key) for key in self.quantizer.state_keys},
+        )
+        os.replace(tmp_path, path)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedEmbeddings":
+        with np.load(path) as data:
+            if int(data["version"]) != QUANTIZED_FORMAT_VERSION:
+                raise ValueError(f"unsupported quantized embeddings format: {path}")
+            quantizer_cls = QUANTIZERS[str(data["method"])]
+            quantizer = quantizer_cls(
+                **{key: data[key] for key in quantizer_cls.state_keys}
+            )
+            quantized = cls(quantizer, data["codes"])
+            if "fingerprint" in data:
+                quantized.fingerprint = str(data["fingerprint"]) or None
+            return quantized
+
+
+def load_or_build_quantized(
+    embeddings_path: str,
+    embeddings: np.ndarray,
+    method: str,
+    fingerprint: str | None = None,
+) -> QuantizedEmbeddings:
+    """Codes for `embeddings`, loaded if saved for every row and, given a
+    `fingerprint`, for these embeddings, else rebuilt."""
+    path = quantized_path(embeddings_path, method)
+    if os.path.exists(path):
+        quantized = QuantizedEmbeddings.load(path)
+        if (
+            quantized.n_rows == len(embeddings)
+            and quantized.method == method
+            and (fingerprint is None or quantized.fingerprint == fingerprint)
+        ):
+            return quantized
+    quantized = QuantizedEmbeddings.build(embeddings, method)
+    quantized.save(path, fingerprint)
+    return quantized
+
+
+def rescore_pool(limit: int) -> int:
+    """Candidates kept from the approximate scan for exact re-scoring."""
+    return limit * QUANTIZED_RESCORE_FACTOR
@@ -2,11 +2,11 @@ import os
 from typing import Optional
 
 from dotenv import load_dotenv
-from google import genai
+
+from .models import get_genai_client
 
 load_dotenv()
 api_key = os.getenv("gemini_api_key")
-client = genai.Client(api_key=api_key)
 model = "gemini-2.0-flash"
 
 
@@ -20,7 +20,9 @@ Query: "{query}"
 If no errors, return the original query.
 Corrected:"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = get_genai_client(api_key).models.generate_content(
+        model=model, contents=prompt
+    )
     corrected = (response.text or "").strip().strip('"')
     return corrected if corrected else query
 
@@ -45,7 +47,9 @@ Examples:
 
 Rewritten query:"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = get_genai_client(api_key).models.generate_content(
+        model=model, contents=prompt
+    )
     rewritten = (response.text or "").strip().strip('"')
     return rewritten if rewritten else query
 
@@ -66,7 +70,9 @@ Examples:
 Query: "{query}"
 """
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = get_genai_client(api_key).models.generate_content(
+        model=model, contents=prompt
+    )
     expanded_terms = (response.text or "").strip().strip('"')
 
     return f"{query} {expanded_terms}"
@@ -3,14 +3,13 @@ import os
 from time import sleep
 
 from dotenv import load_dotenv
-from google import genai
-from sentence_transformers import CrossEncoder
+
+from .models import get_cross_encoder, get_genai_client
 
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
 model = "gemini-2.0-flash"
-cross_encoder = CrossEncoder("cross-encoder/ms-marco-TinyBERT-L2-v2")
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-TinyBERT-L2-v2"
 
 
 def llm_rerank_individual(
@@ -34,7 +33,9 @@ Give me ONLY the number in your response, no other text or explanation.
 
 Score:"""
 
-        response = client.models.generate_content(model=model, contents=prompt)
+        response = get_genai_client(api_key).models.generate_content(
+            model=model, contents=prompt
+        )
         score_text = (response.text or "").strip()
         score = int(score_text)
         scored_docs.append({**doc, "individual_score": score})
@@ -71,7 +72,9 @@ def llm_rerank_batch(query: str, documents: list[dict], limit: int = 5) -> list[
             [75, 12, 34, 2, 1]
                 """
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = get_genai_client(api_key).models.generate_content(
+        model=model, contents=prompt
+    )
     ranking_text = (response.text or "").strip()
 
     parsed_ids = json.loads(ranking_text)
@@ -92,7 +95,7 @@ def cross_encoder_rerank(
     for doc in documents:
         pairs.append([query, f"{doc.get('title', '')} - {doc.get('document', '')}"])
 
-    scores = cross_encoder.predict(pairs)
+    scores = get_cross_encoder(CROSS_ENCODER_MODEL).predict(pairs)
 
     for doc, score in zip(documents, scores):
         doc["crossencoder_score"] = float(score)
@@ -138,7 +141,9 @@ def evaluate(query, results):
 
             Return ONLY a valid JSON list of integers. Example: [3, 0, 2, 1]"""
     
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = get_genai_client(api_key).models.generate_content(
+        model=model, contents=prompt
+    )
     # Clean Markdown if present
     clean_text = response.text.replace("```json", "").replace("```", "").strip()
     
@@ -0,0 +1,35 @@
+import json
+import urllib.error
+import urllib.request
+
+from .search_utils import SEARCH_SERVER_URL
+
+
+def request_search(
+    command: str, payload: dict, server_url: str = SEARCH_SERVER_URL
+) -> dict:
+    """Run `command` on a search server and return its JSON response.
+
+    Only the standard library is imported here, so forwarding a query does not
+    pay for loading models or indexes in the calling process.
+    """
+    request = urllib.request.Request(
+        f"{server_url.rstrip('/')}/{command}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            error = json.load(e).get("error", e.reason)
+        except ValueError:
+            error = e.reason
+        raise ValueError(f"search server error ({e.code}): {error}") from e
+    except urllib.error.URLError as e:
+        raise ConnectionError(
+            f"no search server at {server_url} ({e.reason}); "
+            "start one with search_server_cli.py serve"
+        ) from e
@@ -0,0 +1,280 @@
+import json
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from .doc_store import load_doc_store
+from .hybrid_search import HybridSearch, rrf_search_command, weighted_search_command
+from .models import get_cross_encoder
+from .quantization import load_or_build_quantized
+from .reranking import CROSS_ENCODER_MODEL
+from .search_utils import (
+    CHUNK_ANN_INDEX_PATH,
+    CHUNK_EMBEDDINGS_PATH,
+    CLIP_TEXT_EMBEDDINGS_PATH,
+    DEFAULT_ALPHA,
+    DEFAULT_CHUNK_AGGREGATION,
+    DEFAULT_SEARCH_LIMIT,
+    MOVIE_ANN_INDEX_PATH,
+    MOVIE_EMBEDDINGS_PATH,
+    RRF_K,
+    SEARCH_SERVER_HOST,
+    SEARCH_SERVER_PORT,
+)
+from .semantic_search import (
+    load_or_build_ann_index,
+    search_chunked_command,
+    semantic_search_command,
+)
+
+
+class SearchService:
+    """Searchers kept warm across requests.
+
+    Every component is built on first use and then reused, so only the first
+    request pays for loading models, embeddings and the BM25 index. The
+    chunked searcher inside `HybridSearch` also serves plain semantic and
+    chunked requests; per-request ANN and quantization options are applied by
+    pointing it at indexes that are loaded once and cached.
+    """
+
+    def __init__(self) -> None:
+        self.movies = load_doc_store()
+        self._hybrid: HybridSearch | None = None
+        self._multimodal = None
+        self._movie_embeddings_loaded = False
+        self._loaded: dict[tuple, object] = {}
+
+    @property
+    def hybrid(self) -> HybridSearch:
+        if self._hybrid is None:
+            self._hybrid = HybridSearch(self.movies)
+        return self._hybrid
+
+    @property
+    def semantic(self):
+        return self.hybrid.semantic_search
+
+    @property
+    def multimodal(self):
+        if self._multimodal is None:
+            from .multimodal_search import MultimodalSearch
+
+            self._multimodal = MultimodalSearch(self.movies)
+        return self._multimodal
+
+    def warm(self, multimodal: bool = False) -> None:
+        """Load the searchers and the models behind them, including the
+        cross-encoder used by --rerank-method cross_encoder."""
+        self.hybrid
+        self.semantic.model
+        get_cross_encoder(CROSS_ENCODER_MODEL)
+        if multimodal:
+            self.multimodal.model
+
+    def _cached(self, key: tuple, load):
+        if key not in self._loaded:
+            self._loaded[key] = load()
+        return self._loaded[key]
+
+    def _configure(self, nprobe=None, quantization=None) -> None:
+        """Apply a request's ANN and quantization options to the searcher."""
+        searcher = self.semantic
+        # load everything before swapping it in: a hybrid leg that missed its
+        # deadline may still be searching, and must not see the options
+        # cleared half way
+        ann_index = chunk_ann_index = quantized = chunk_quantized = None
+        if nprobe is not None:
+            chunk_ann_index = self._cached(
+                ("ann", CHUNK_ANN_INDEX_PATH, searcher.chunks_fingerprint()),
+                lambda: load_or_build_ann_index(
+                    CHUNK_ANN_INDEX_PATH,
+                    searcher.chunk_embeddings,
+                    fingerprint=searcher.chunks_fingerprint(),
+                ),
+            )
+            if self._movie_embeddings_loaded:
+                ann_index = self._cached(
+                    ("ann", MOVIE_ANN_INDEX_PATH, searcher.documents_fingerprint()),
+                    lambda: load_or_build_ann_index(
+                        MOVIE_ANN_INDEX_PATH,
+                        searcher.embeddings,
+                        fingerprint=searcher.documents_fingerprint(),
+                    ),
+                )
+        if quantization is not None:
+            chunk_quantized = self._quantized(
+                CHUNK_EMBEDDINGS_PATH,
+                searcher.chunk_embeddings,
+                quantization,
+                searcher.chunks_fingerprint(),
+            )
+            if self._movie_embeddings_loaded:
+                quantized = self._quantized(
+                    MOVIE_EMBEDDINGS_PATH,
+                    searcher.embeddings,
+                    quantization,
+                    searcher.documents_fingerprint(),
+                )
+        searcher.ann_index, searcher.chunk_ann_index = ann_index, chunk_ann_index
+        searcher.quantized, searcher.chunk_quantized = quantized, chunk_quantized
+
+    def _quantized(
+        self, embeddings_path: str, embeddings, method: str, fingerprint: str
+    ):
+        return self._cached(
+            # keyed on the fingerprint too, so re-embedded data gets new codes
+            ("quantized", embeddings_path, method, fingerprint),
+            lambda: load_or_build_quantized(
+                embeddings_path, embeddings, method, fingerprint
+            ),
+        )
+
+    def rrf_search(
+        self,
+        query: str,
+        k: int = RRF_K,
+        enhance: str | None = None,
+        rerank_method: str | None = None,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        timeouts: dict | None = None,
+    ) -> dict:
+        self._configure()
+        return rrf_search_command(
+            query, k, enhance, rerank_method, limit, timeouts, searcher=self.hybrid
+        )
+
+    def weighted_search(
+        self,
+        query: str,
+        alpha: float = DEFAULT_ALPHA,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        timeouts: dict | None = None,
+    ) -> dict:
+        self._configure()
+        return weighted_search_command(
+            query, alpha, limit, timeouts, searcher=self.hybrid
+        )
+
+    def search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        nprobe: int | None = None,
+        quantization: str | None = None,
+    ) -> dict:
+        if not self._movie_embeddings_loaded:
+            self.semantic.load_or_create_embeddings(self.movies)
+            self._movie_embeddings_loaded = True
+        self._configure(nprobe, quantization)
+        return semantic_search_command(
+            query, limit, nprobe, quantization, searcher=self.semantic
+        )
+
+    def search_chunked(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+        nprobe: int | None = None,
+        quantization: str | None = None,
+    ) -> dict:
+        self._configure(nprobe, quantization)
+        return search_chunked_command(
+            query, limit, aggregation, nprobe, quantization, searcher=self.semantic
+        )
+
+    def image_search(self, image_path: str, quantization: str | None = None) -> dict:
+        from .multimodal_search import image_search_command
+
+        engine = self.multimodal
+        engine.quantized = None
+        if quantization is not None:
+            engine.quantized = self._quantized(
+                CLIP_TEXT_EMBEDDINGS_PATH,
+                engine.text_embeddings,
+                quantization,
+                engine.texts_fingerprint(),
+            )
+        results = image_search_command(image_path, search_engine=engine)
+        return {"image_path": image_path, "results": results}
+
+    def handle(self, command: str, payload: dict) -> dict:
+        handlers = {
+            "rrf_search": self.rrf_search,
+            "weighted_search": self.weighted_search,
+            "search": self.search,
+            "search_chunked": self.search_chunked,
+            "image_search": self.image_search,
+        }
+        if command not in handlers:
+            raise ValueError(f"unknown command: {command}")
+        return handlers[command](**payload)
+
+
+def json_default(value):
+    # numpy scalars that end up in results
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    service: SearchService
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body, default=json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"not found: {self.path}"})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            result = self.service.handle(self.path.strip("/"), payload)
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except TimeoutError as e:
+            self._send(504, {"error": str(e)})
+            return
+        except Exception as e:
+            # answer instead of dropping the connection, and keep the
+            # traceback in the server log
+            traceback.print_exc()
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send(200, result)
+
+
+def serve(
+    host: str = SEARCH_SERVER_HOST,
+    port: int = SEARCH_SERVER_PORT,
+    multimodal: bool = False,
+) -> None:
+    """Serve search requests until interrupted.
+
+    Requests are handled one at a time: the searchers are not thread-safe,
+    and each query is already a batched numpy scan.
+    """
+    service = SearchService()
+    print("Loading searchers...")
+    service.warm(multimodal)
+
+    handler = type("Handler", (SearchRequestHandler,), {"service": service})
+    server = HTTPServer((host, port), handler)
+    print(f"Search server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
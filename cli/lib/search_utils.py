@@ -1,20 +1,44 @@
 import json
 import os
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .doc_store import DocStore
 
 DEFAULT_ALPHA = 0.5
 RRF_K = 60
 SEARCH_MULTIPLIER = 5
+HYBRID_LEGS = ("bm25", "semantic")
+INITIAL_DEPTH_MULTIPLIER = 10
+DEPTH_GROWTH = 4
+MAX_DEPTH_MULTIPLIER = 500
 
 DEFAULT_SEARCH_LIMIT = 5
+QUERY_BATCH_SIZE = 256
+QUERY_CACHE_SIZE = 1024
+# a persisted query cache is also written after this many new entries or
+# seconds since its last save, not only at exit
+QUERY_CACHE_FLUSH_ENTRIES = 32
+QUERY_CACHE_FLUSH_SECONDS = 60.0
 DOCUMENT_PREVIEW_LENGTH = 100
 SCORE_PRECISION = 3
 
 BM25_K1 = 1.5
 BM25_B = 0.75
+BUILD_SHARDS_PER_WORKER = 4
+COMPACTION_RATIO = 0.1
+INDEX_SPILL_POSTINGS = 1 << 20
+INDEX_MERGE_FAN_IN = 64
+INGEST_BATCH_SIZE = 256
+INGEST_QUEUE_SIZE = 4
+JSON_READ_CHUNK = 1 << 16
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "movies.json")
+CATALOG_HELP = (
+    'Catalog to load: a {"movies": [...]} .json or a .jsonl file with one movie '
+    "per line (default: data/movies.json)"
+)
 STOPWORDS_PATH = os.path.join(PROJECT_ROOT, "data", "stopwords.txt")
 GOLDEN_DATASET_PATH = os.path.join(PROJECT_ROOT, "data", "golden_dataset.json")
 
@@ -23,16 +47,35 @@ CACHE_DIR = os.path.join(PROJECT_ROOT, "cache")
 DEFAULT_CHUNK_SIZE = 200
 DEFAULT_CHUNK_OVERLAP = 1
 DEFAULT_SEMANTIC_CHUNK_SIZE = 4
+CHUNK_AGGREGATIONS = ("max", "top2_mean", "softmax_sum")
+DEFAULT_CHUNK_AGGREGATION = "max"
+CHUNK_SOFTMAX_TEMPERATURE = 0.05
 
-MOVIE_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "movie_embeddings.npy")
-CHUNK_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "chunk_embeddings.npy")
-CHUNK_METADATA_PATH = os.path.join(CACHE_DIR, "chunk_metadata.json")
+ANN_NPROBE = 8
+ANN_KMEANS_ITERATIONS = 20
+ANN_KMEANS_SAMPLE = 50_000
 
+IMPORT_TIME_BUDGET_MS = 1000
 
-def load_movies() -> list[dict]:
-    with open(DATA_PATH, "r") as f:
-        data = json.load(f)
-    return data["movies"]
+SEARCH_SERVER_HOST = "127.0.0.1"
+SEARCH_SERVER_PORT = 8765
+SEARCH_SERVER_URL = f"http://{SEARCH_SERVER_HOST}:{SEARCH_SERVER_PORT}"
+
+QUANTIZATION_METHODS = ("int8", "pq")
+QUANTIZED_RESCORE_FACTOR = 10
+QUANTIZED_SCAN_BLOCK = 65_536
+PQ_SUBVECTOR_DIM = 4
+PQ_KMEANS_ITERATIONS = 15
+PQ_TRAIN_SAMPLE = 20_000
+
+MOVIE_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "movie_embeddings.npy")
+CHUNK_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "chunk_embeddings.npy")
+CHUNK_METADATA_PATH = os.path.join(CACHE_DIR, "chunk_metadata.npy")
+MOVIE_ANN_INDEX_PATH = os.path.join(CACHE_DIR, "movie_ann_index.npz")
+CHUNK_ANN_INDEX_PATH = os.path.join(CACHE_DIR, "chunk_ann_index.npz")
+CLIP_TEXT_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "clip_text_embeddings.npy")
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embedding_cache")
+DOC_STORE_PATH = os.path.join(CACHE_DIR, "doc_store.bin")
 
 
 def load_stopwords() -> list[str]:
@@ -64,6 +107,67 @@ def format_search_result(
     }
 
 
+class SearchHit:
+    """A scored document whose result dict is only built when it is rendered.
+
+    Holds the row of the document in its `DocStore` rather than copies of
+    its title and description, so the candidates that fusion and ranking
+    throw away cost one small object each. `preview` truncates the displayed
+    document and `passage` is a (start, end) span of the description
+    reported as metadata; `to_dict` gives the `format_search_result` shape.
+    """
+
+    __slots__ = ("docs", "row", "score", "metadata", "preview", "passage")
+
+    def __init__(
+        self,
+        docs: "DocStore",
+        row: int,
+        score: float,
+        metadata: dict | None = None,
+        preview: int | None = None,
+        passage: tuple[int, int] | None = None,
+    ) -> None:
+        self.docs = docs
+        self.row = row
+        self.score = score
+        self.metadata = metadata
+        self.preview = preview
+        self.passage = passage
+
+    @property
+    def id(self) -> int:
+        return self.docs.doc_id(self.row)
+
+    @property
+    def title(self) -> str:
+        return self.docs.title(self.row)
+
+    @property
+    def document(self) -> str:
+        return self.docs.description(self.row)[: self.preview]
+
+    def to_dict(self) -> dict[str, Any]:
+        metadata = dict(self.metadata or {})
+        if self.passage is not None:
+            start, end = self.passage
+            metadata["passage"] = self.docs.description(self.row)[start:end]
+        return format_search_result(
+            doc_id=self.id,
+            title=self.title,
+            document=self.document,
+            score=self.score,
+            **metadata,
+        )
+
+    def __repr__(self) -> str:
+        return f"SearchHit(id={self.id!r}, score={self.score:.{SCORE_PRECISION}f})"
+
+
+def hits_to_dicts(hits: list[SearchHit]) -> list[dict[str, Any]]:
+    return [hit.to_dict() for hit in hits]
+
+
 def load_golden_dataset() -> dict:
     with open(GOLDEN_DATASET_PATH, "r") as f:
         return json.load(f)
@@ -1,63 +1,332 @@
-import json
+import hashlib
 import os
 import re
+from collections.abc import Iterator
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
+from .ann_index import IVFIndex
+from .doc_store import DocStore, as_doc_store, load_doc_store
+from .embedding_cache import EmbeddingCache, get_query_cache
+from .embedding_store import (
+    append_array_rows,
+    commit_array_rows,
+    commit_embeddings_file,
+    load_embeddings_file,
+    normalize_embeddings,
+    save_array,
+    save_embeddings_file,
+    save_embeddings_stream,
+)
+from .models import get_sentence_transformer
+from .quantization import (
+    QuantizedEmbeddings,
+    load_or_build_quantized,
+    quantized_path,
+    rescore_pool,
+)
 from .search_utils import (
+    ANN_NPROBE,
+    CHUNK_ANN_INDEX_PATH,
     CHUNK_EMBEDDINGS_PATH,
     CHUNK_METADATA_PATH,
+    COMPACTION_RATIO,
+    CHUNK_AGGREGATIONS,
+    CHUNK_SOFTMAX_TEMPERATURE,
+    DEFAULT_CHUNK_AGGREGATION,
     DEFAULT_CHUNK_OVERLAP,
     DEFAULT_CHUNK_SIZE,
     DEFAULT_SEARCH_LIMIT,
     DEFAULT_SEMANTIC_CHUNK_SIZE,
     DOCUMENT_PREVIEW_LENGTH,
+    MOVIE_ANN_INDEX_PATH,
     MOVIE_EMBEDDINGS_PATH,
-    format_search_result,
-    load_movies,
+    INGEST_BATCH_SIZE,
+    QUERY_BATCH_SIZE,
+    SearchHit,
+    hits_to_dicts,
 )
+from .streaming import batched, prefetched
 
 
 class SemanticSearch:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="all-MiniLM-L6-v2", persist_query_cache=False):
+        self.model_name = model_name
+        self.embedding_cache = EmbeddingCache(model_name)
+        # repeated and reformulated queries skip the encoder
+        self.query_cache = get_query_cache(model_name, persist=persist_query_cache)
         self.embeddings = None
-        self.documents = None
-        self.document_map = {}
+        self.ann_index: IVFIndex | None = None
+        self.quantized: QuantizedEmbeddings | None = None
+        self.documents: DocStore | None = None
+        # saved .npy path -> file the in-memory array maps, rows appended
+        # since the last save included; arrays held in memory are absent
+        self._row_files: dict[str, str] = {}
+
+    @property
+    def deleted_rows(self) -> set[int]:
+        """Tombstoned rows, kept in the document store until compaction."""
+        if self.documents is None:
+            return set()
+        return self.documents.deleted_rows
+
+    @property
+    def model(self):
+        # only needed on a cache miss: the embedding and query caches load
+        # it themselves, so searches served from saved embeddings and cached
+        # queries never import torch
+        return get_sentence_transformer(self.model_name)
 
     def generate_embedding(self, text):
         if not text or not text.strip():
             raise ValueError("cannot generate embedding for empty text")
-        return self.model.encode([text])[0]
+        return self.query_cache.encode([text])[0]
+
+    def generate_embeddings(self, texts: list[str]) -> np.ndarray:
+        """Embed several texts in one batched forward pass."""
+        for text in texts:
+            if not text or not text.strip():
+                raise ValueError("cannot generate embedding for empty text")
+        return self.query_cache.encode(list(texts))
+
+    def _set_documents(self, documents) -> None:
+        self.documents = as_doc_store(documents)
+
+    def documents_fingerprint(self) -> str:
+        """Identifies the texts behind the movie embeddings; saved in their
+        manifest so an edited catalog is re-embedded even at the same size."""
+        return self.documents.fingerprint.hex()
+
+    def _encode_batches(self, text_batches) -> Iterator[np.ndarray]:
+        """Encode batches of texts as a background thread prepares the next
+        ones."""
+        for texts in prefetched(text_batches):
+            if texts:
+                yield normalize_embeddings(self.embedding_cache.encode(texts))
 
     def build_embeddings(self, documents):
-        self.documents = documents
-        self.document_map = {}
-        movie_strings = []
-        for doc in documents:
-            self.document_map[doc["id"]] = doc
-            movie_strings.append(f"{doc['title']}: {doc['description']}")
-        self.embeddings = self.model.encode(movie_strings, show_progress_bar=True)
-
-        os.makedirs(os.path.dirname(MOVIE_EMBEDDINGS_PATH), exist_ok=True)
-        np.save(MOVIE_EMBEDDINGS_PATH, self.embeddings)
+        """Embed the catalog in INGEST_BATCH_SIZE batches, streaming the rows
+        to disk, and memory-map the result."""
+        self._set_documents(documents)
+        text_batches = (
+            [movie_text(doc) for doc in batch]
+            for batch in batched(self.documents, INGEST_BATCH_SIZE)
+        )
+        save_embeddings_stream(
+            MOVIE_EMBEDDINGS_PATH,
+            self._encode_batches(text_batches),
+            self.model_name,
+            self.documents_fingerprint(),
+        )
+        self._forget_rows(MOVIE_EMBEDDINGS_PATH)
+        self.embeddings = load_embeddings_file(MOVIE_EMBEDDINGS_PATH, self.model_name)
+        self._row_files[MOVIE_EMBEDDINGS_PATH] = MOVIE_EMBEDDINGS_PATH
         return self.embeddings
 
-    def load_or_create_embeddings(self, documents):
-        self.documents = documents
-        self.document_map = {}
-        for doc in documents:
-            self.document_map[doc["id"]] = doc
+    def save_embeddings(self) -> None:
+        fingerprint = self.documents_fingerprint()
+        self.embeddings = self._save_embedding_rows(
+            MOVIE_EMBEDDINGS_PATH, self.embeddings, fingerprint
+        )
+        if self.ann_index is not None:
+            self.ann_index.save(MOVIE_ANN_INDEX_PATH, fingerprint)
+        if self.quantized is not None:
+            self.quantized.save(
+                quantized_path(MOVIE_EMBEDDINGS_PATH, self.quantized.method),
+                fingerprint,
+            )
 
-        if os.path.exists(MOVIE_EMBEDDINGS_PATH):
-            self.embeddings = np.load(MOVIE_EMBEDDINGS_PATH)
-            if len(self.embeddings) == len(documents):
-                return self.embeddings
+    def load_or_create_ann_index(self, n_lists: int | None = None) -> IVFIndex:
+        """Load the movie ANN index, rebuilding it if missing or stale."""
+        self.ann_index = load_or_build_ann_index(
+            MOVIE_ANN_INDEX_PATH, self.embeddings, n_lists, self.documents_fingerprint()
+        )
+        return self.ann_index
+
+    def load_or_create_quantized(self, method: str = "int8") -> QuantizedEmbeddings:
+        """Scan compressed codes first and re-score candidates in float.
+
+        The float matrix is memory-mapped, so only the re-scored rows are
+        paged in.
+        """
+        self.quantized = load_or_build_quantized(
+            MOVIE_EMBEDDINGS_PATH, self.embeddings, method, self.documents_fingerprint()
+        )
+        return self.quantized
+
+    def add_documents(self, documents: list[dict]) -> None:
+        """Append new documents and embed only them."""
+        self.documents = self.documents.writable()
+        self._embed_documents_from(self.documents.append(documents))
+
+    def update_document(self, document: dict) -> None:
+        self.delete_document(document["id"])
+        self.add_documents([document])
+
+    def delete_document(self, doc_id: int) -> None:
+        """Tombstone a document's row; rows are dropped on compaction."""
+        self.documents = self.documents.writable()
+        self.documents.delete(doc_id)
+        self.maybe_compact()
+
+    def live_rows(self) -> list[int]:
+        return self.documents.live_rows()
+
+    def maybe_compact(self) -> bool:
+        if len(self.deleted_rows) > COMPACTION_RATIO * len(self.documents):
+            self.compact()
+            return True
+        return False
+
+    def compact(self) -> None:
+        """Drop tombstoned rows from the documents and embedding matrices."""
+        if self.deleted_rows:
+            self._keep_rows(self.live_rows())
+
+    def _append_rows(
+        self, path: str, array: np.ndarray, new_rows: np.ndarray
+    ) -> np.ndarray:
+        """`array` followed by `new_rows`, written after it on disk and
+        mapped, so an append costs the new rows rather than a copy of all.
+
+        Rows of an array saved at `path` go to the end of that file, past
+        the row count its header records, so other processes keep loading
+        the saved rows. An array held in memory (after a compaction) is
+        first written to a working file next to `path`.
+        """
+        source = self._row_files.get(path)
+        if source is None:
+            source = f"{path}.work"
+            save_array(source, array)
+            self._row_files[path] = source
+        return append_array_rows(source, len(array), new_rows)
+
+    def _forget_rows(self, path: str) -> None:
+        """The array for `path` is now held in memory or was rebuilt."""
+        source = self._row_files.pop(path, None)
+        if source is not None and source != path:
+            os.remove(source)
+
+    def _save_rows(self, path: str, array: np.ndarray) -> np.ndarray:
+        """Save `array` at `path` and return it mapped from there."""
+        source = self._row_files.get(path)
+        if source is None:
+            save_array(path, array)
+        else:
+            commit_array_rows(path, len(array), source)
+        self._row_files[path] = path
+        return np.load(path, mmap_mode="r")
+
+    def _save_embedding_rows(
+        self, path: str, embeddings: np.ndarray, fingerprint: str
+    ) -> np.ndarray:
+        """`_save_rows` for an embedding matrix and its manifest."""
+        source = self._row_files.get(path)
+        if source is None:
+            save_embeddings_file(path, embeddings, self.model_name, fingerprint)
+        else:
+            commit_embeddings_file(
+                path, len(embeddings), self.model_name, fingerprint, source
+            )
+        self._row_files[path] = path
+        return load_embeddings_file(path, self.model_name)
+
+    def _embed_documents_from(self, start: int) -> None:
+        if self.embeddings is None:
+            return
+        new_embeddings = self.embedding_cache.encode(
+            [movie_text(doc) for doc in self.documents[start:]]
+        )
+        new_embeddings = normalize_embeddings(new_embeddings)
+        self.embeddings = self._append_rows(
+            MOVIE_EMBEDDINGS_PATH, self.embeddings, new_embeddings
+        )
+        if self.ann_index is not None:
+            self.ann_index = self.ann_index.add(new_embeddings)
+        if self.quantized is not None:
+            self.quantized = self.quantized.add(new_embeddings)
+
+    def _keep_rows(self, rows: list[int]) -> None:
+        self.documents.compact(rows)
+        if self.embeddings is not None:
+            self.embeddings = self.embeddings[rows]
+            self._forget_rows(MOVIE_EMBEDDINGS_PATH)
+        if self.ann_index is not None:
+            self.ann_index = self.ann_index.keep_rows(rows)
+        if self.quantized is not None:
+            self.quantized = self.quantized.keep_rows(rows)
 
-        return self.build_embeddings(documents)
+    def load_or_create_embeddings(self, documents):
+        self._set_documents(documents)
+
+        embeddings = load_embeddings_file(
+            MOVIE_EMBEDDINGS_PATH, self.model_name, self.documents_fingerprint()
+        )
+        if embeddings is not None and len(embeddings) == len(self.documents):
+            self.embeddings = embeddings
+            if isinstance(embeddings, np.memmap):
+                self._row_files[MOVIE_EMBEDDINGS_PATH] = MOVIE_EMBEDDINGS_PATH
+            return self.embeddings
+
+        return self.build_embeddings(self.documents)
+
+    def top_rows(
+        self, query_embedding: np.ndarray, limit: int, nprobe: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Rows of the `limit` best live documents and their cosine scores.
+
+        With `nprobe` and a loaded ANN index only the rows in the nprobe
+        closest lists are candidates; otherwise every row is. With quantized
+        codes loaded the candidates are narrowed on approximate scores before
+        the exact float scoring.
+        """
+        # read once: a server may point them elsewhere while a search that
+        # missed its deadline is still running
+        ann_index, quantized = self.ann_index, self.quantized
+        rows = None
+        if nprobe is not None and ann_index is not None:
+            rows = ann_index.candidates(query_embedding, nprobe)
+            if self.deleted_rows:
+                rows = rows[~np.isin(rows, list(self.deleted_rows))]
+
+        if quantized is not None:
+            deleted = None
+            if rows is None and self.deleted_rows:
+                deleted = list(self.deleted_rows)
+            rows = quantized_shortlist(quantized, query_embedding, rows, limit, deleted)
+
+        if rows is None:
+            scores = self.embeddings @ query_embedding
+            if self.deleted_rows:
+                scores[list(self.deleted_rows)] = -np.inf
+            top = top_k_indices(scores, limit, len(self.deleted_rows))
+            return top, scores[top]
+
+        scores = self.embeddings[rows] @ query_embedding
+        top = top_k_indices(scores, limit)
+        return rows[top], scores[top]
+
+    def top_rows_many(
+        self, query_embeddings: np.ndarray, limit: int, nprobe: int | None = None
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """`top_rows` for each query; exact scans share one matrix product."""
+        if self.quantized is not None or (
+            nprobe is not None and self.ann_index is not None
+        ):
+            # candidate sets differ per query
+            return [self.top_rows(q, limit, nprobe) for q in query_embeddings]
+
+        results = []
+        for block in query_blocks(query_embeddings):
+            all_scores = block @ self.embeddings.T
+            if self.deleted_rows:
+                all_scores[:, list(self.deleted_rows)] = -np.inf
+            for scores in all_scores:
+                top = top_k_indices(scores, limit, len(self.deleted_rows))
+                results.append((top, scores[top]))
+        return results
 
-    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+    def _check_loaded(self) -> None:
         if self.embeddings is None or self.embeddings.size == 0:
             raise ValueError(
                 "No embeddings loaded. Call `load_or_create_embeddings` first."
@@ -68,17 +337,36 @@ class SemanticSearch:
                 "No documents loaded. Call `load_or_create_embeddings` first."
             )
 
-        query_embedding = self.generate_embedding(query)
-
-        similarities = []
-        for i, doc_embedding in enumerate(self.embeddings):
-            similarity = cosine_similarity(query_embedding, doc_embedding)
-            similarities.append((similarity, self.documents[i]))
-
-        similarities.sort(key=lambda x: x[0], reverse=True)
-
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, nprobe=None):
+        self._check_loaded()
+        if nprobe is None and self.ann_index is not None:
+            nprobe = ANN_NPROBE
+        query_embedding = normalize_embeddings(self.generate_embedding(query))
+        rows, scores = self.top_rows(query_embedding, limit, nprobe)
+        return self._format_results(rows, scores)
+
+    def search_many(
+        self,
+        queries: list[str],
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        nprobe: int | None = None,
+    ) -> list[list[dict]]:
+        """`search` for several queries with one batched encode."""
+        self._check_loaded()
+        if not queries:
+            return []
+        if nprobe is None and self.ann_index is not None:
+            nprobe = ANN_NPROBE
+        query_embeddings = normalize_embeddings(self.generate_embeddings(queries))
+        return [
+            self._format_results(rows, scores)
+            for rows, scores in self.top_rows_many(query_embeddings, limit, nprobe)
+        ]
+
+    def _format_results(self, rows: np.ndarray, scores: np.ndarray) -> list[dict]:
         results = []
-        for score, doc in similarities[:limit]:
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            doc = self.documents[row]
             results.append(
                 {
                     "score": score,
@@ -90,6 +378,78 @@ class SemanticSearch:
         return results
 
 
+def load_or_build_ann_index(
+    path: str,
+    embeddings: np.ndarray,
+    n_lists: int | None = None,
+    fingerprint: str | None = None,
+) -> IVFIndex:
+    """Load the ANN index at `path` if it covers every row and, given a
+    `fingerprint`, was built for these embeddings, else rebuild it."""
+    if os.path.exists(path):
+        ann_index = IVFIndex.load(path)
+        if ann_index.n_rows == len(embeddings) and (
+            fingerprint is None or ann_index.fingerprint == fingerprint
+        ):
+            return ann_index
+    ann_index = IVFIndex.build(embeddings, n_lists)
+    ann_index.save(path, fingerprint)
+    return ann_index
+
+
+def quantized_shortlist(
+    quantized: QuantizedEmbeddings,
+    query_embedding: np.ndarray,
+    rows: np.ndarray | None,
+    limit: int,
+    excluded=None,
+) -> np.ndarray:
+    """Ascending rows with the best approximate scores, to re-score exactly.
+
+    `rows` are the candidates (None: every row) and `excluded` indexes the
+    candidates that must not be kept.
+    """
+    scores = quantized.scores(query_embedding, rows)
+    n_excluded = 0
+    if excluded is not None:
+        scores[excluded] = -np.inf
+        n_excluded = len(scores) - np.isfinite(scores).sum()
+    keep = np.sort(top_k_indices(scores, rescore_pool(limit), n_excluded))
+    return keep if rows is None else rows[keep]
+
+
+def query_blocks(query_embeddings: np.ndarray):
+    """Split a query batch so a score matrix holds at most QUERY_BATCH_SIZE rows."""
+    for start in range(0, len(query_embeddings), QUERY_BATCH_SIZE):
+        yield query_embeddings[start : start + QUERY_BATCH_SIZE]
+
+
+def movie_text(doc: dict) -> str:
+    return f"{doc['title']}: {doc['description']}"
+
+
+def top_k_indices(scores: np.ndarray, limit: int, excluded: int = 0) -> np.ndarray:
+    """Indices of the `limit` highest scores, best first, ties by index.
+
+    Ties are broken the same way at every `limit`, so a shorter result is
+    always a prefix of a longer one. `excluded` entries have been masked to
+    -inf and are never returned.
+    """
+    available = len(scores) - excluded
+    limit = min(limit, available)
+    if limit <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if limit < len(scores):
+        # keep every score tied with the limit-th best, not whichever of them
+        # the partition happened to put first
+        kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:limit]]
+
+
 def cosine_similarity(vec1, vec2):
     dot_product = np.dot(vec1, vec2)
     norm1 = np.linalg.norm(vec1)
@@ -115,14 +475,24 @@ def embed_text(text):
     print(f"Dimensions: {embedding.shape[0]}")
 
 
-def verify_embeddings():
+def verify_embeddings(catalog_path: str | None = None):
     search_instance = SemanticSearch()
-    documents = load_movies()
+    documents = load_doc_store(catalog_path)
     embeddings = search_instance.load_or_create_embeddings(documents)
     print(f"Number of docs:   {len(documents)}")
     print(
         f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions"
     )
+    print_embedding_cache_stats(search_instance.embedding_cache.stats())
+
+
+def print_embedding_cache_stats(stats: dict, label: str = "Embedding cache") -> None:
+    if stats["hits"] + stats["misses"] == 0:
+        return
+    print(
+        f"{label}: {stats['hits']} reused, {stats['misses']} encoded "
+        f"({stats['hit_rate']:.1%} hit rate)"
+    )
 
 
 def embed_query_text(query):
@@ -133,21 +503,28 @@ def embed_query_text(query):
     print(f"Shape: {embedding.shape}")
 
 
-def semantic_search(query, limit=DEFAULT_SEARCH_LIMIT):
-    search_instance = SemanticSearch()
-    documents = load_movies()
-    search_instance.load_or_create_embeddings(documents)
-
-    results = search_instance.search(query, limit)
-
-    print(f"Query: {query}")
-    print(f"Top {len(results)} results:")
-    print()
-
-    for i, result in enumerate(results, 1):
-        print(f"{i}. {result['title']} (score: {result['score']:.4f})")
-        print(f"   {result['description'][:100]}...")
-        print()
+def semantic_search_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    nprobe: int | None = None,
+    quantization: str | None = None,
+    searcher: SemanticSearch | None = None,
+) -> dict:
+    """Search movie embeddings; a passed-in `searcher` must already be loaded."""
+    if searcher is None:
+        searcher = SemanticSearch(persist_query_cache=True)
+        searcher.load_or_create_embeddings(load_doc_store())
+        if nprobe is not None:
+            searcher.load_or_create_ann_index()
+        if quantization is not None:
+            searcher.load_or_create_quantized(quantization)
+
+    results = searcher.search(query, limit, nprobe)
+    return {
+        "query": query,
+        "results": results,
+        "query_cache": searcher.query_cache.stats(),
+    }
 
 
 def fixed_size_chunking(
@@ -182,42 +559,58 @@ def chunk_text(
         print(f"{i + 1}. {chunk}")
 
 
-def semantic_chunk(text: str,max_chunk_size: int = DEFAULT_SEMANTIC_CHUNK_SIZE,overlap: int = DEFAULT_CHUNK_OVERLAP,) -> list[str]:
-    
-    text = text.strip()
-    if not text:
-        return []
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def sentence_spans(text: str) -> list[tuple[int, int]]:
+    """(start, end) offsets of each non-empty, stripped sentence in `text`."""
+    pieces = []
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        pieces.append((start, boundary.start()))
+        start = boundary.end()
+    pieces.append((start, len(text)))
 
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    spans = []
+    for start, end in pieces:
+        sentence = text[start:end]
+        if sentence.strip():
+            leading = len(sentence) - len(sentence.lstrip())
+            trailing = len(sentence) - len(sentence.rstrip())
+            spans.append((start + leading, end - trailing))
+    return spans
 
-    # 4. If only one "sentence" found and it doesn't end with punctuation
-    if len(sentences) == 1 and not re.search(r"[.!?]$", sentences[0]):
-        # Treat the whole text as one sentence
-        sentences = [sentences[0]]
-    
-    # 5. Strip whitespace from each sentence and filter out empty ones
-    sentences = [s.strip() for s in sentences if s.strip()]
 
+def semantic_chunk_with_spans(
+    text: str,
+    max_chunk_size: int = DEFAULT_SEMANTIC_CHUNK_SIZE,
+    overlap: int = DEFAULT_CHUNK_OVERLAP,
+) -> list[tuple[str, int, int]]:
+    """Sentence-window chunks with the character span each covers in `text`."""
+    sentences = sentence_spans(text)
     chunks = []
     i = 0
-    n_sentences = len(sentences)
-    
-    while i < n_sentences:
-        chunk_sentences = sentences[i : i + max_chunk_size]
-        
-        if chunks and len(chunk_sentences) <= overlap:
+    while i < len(sentences):
+        window = sentences[i : i + max_chunk_size]
+        if chunks and len(window) <= overlap:
             break
-            
-        # 6. Join sentences and only use chunks that still have content
-        chunk_text = " ".join(chunk_sentences).strip()
-        if chunk_text:
-            chunks.append(chunk_text)
-            
+
+        chunk_text = " ".join(text[start:end] for start, end in window)
+        chunks.append((chunk_text, window[0][0], window[-1][1]))
         i += max_chunk_size - overlap
-        
+
     return chunks
 
 
+def semantic_chunk(
+    text: str,
+    max_chunk_size: int = DEFAULT_SEMANTIC_CHUNK_SIZE,
+    overlap: int = DEFAULT_CHUNK_OVERLAP,
+) -> list[str]:
+    chunks = semantic_chunk_with_spans(text, max_chunk_size, overlap)
+    return [chunk for chunk, _, _ in chunks]
+
+
 def semantic_chunk_text(
     text: str,
     max_chunk_size: int = DEFAULT_SEMANTIC_CHUNK_SIZE,
@@ -229,121 +622,439 @@ def semantic_chunk_text(
         print(f"{i + 1}. {chunk}")
 
 
-class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2") -> None:
-        super().__init__(model_name)
-        self.chunk_embeddings = None
-        self.chunk_metadata = None
+def chunk_documents(
+    documents: list[dict], start_idx: int = 0
+) -> tuple[list[str], np.ndarray]:
+    """Semantically chunk each description.
+
+    Returns the chunk texts and a CHUNK_METADATA_DTYPE record per chunk: the
+    row of its movie (counting from start_idx), its position among that
+    movie's chunks and its character span in the description. Movie rows
+    are non-decreasing, so every movie's chunks form one contiguous segment.
+    """
+    all_chunks = []
+    chunk_counts = []
+    spans = []
+
+    for doc in documents:
+        chunks = semantic_chunk_with_spans(
+            doc.get("description", ""),
+            max_chunk_size=DEFAULT_SEMANTIC_CHUNK_SIZE,
+            overlap=DEFAULT_CHUNK_OVERLAP,
+        )
+        for chunk, start, end in chunks:
+            all_chunks.append(chunk)
+            spans.append((start, end))
+        chunk_counts.append(len(chunks))
+
+    counts = np.asarray(chunk_counts, dtype=np.int32)
+    metadata = np.zeros(len(all_chunks), dtype=CHUNK_METADATA_DTYPE)
+    metadata["movie_idx"] = np.repeat(
+        np.arange(start_idx, start_idx + len(documents), dtype=np.int32), counts
+    )
+    metadata["total_chunks"] = np.repeat(counts, counts)
+    first_chunk = np.repeat(np.cumsum(counts) - counts, counts)
+    metadata["chunk_idx"] = np.arange(len(all_chunks)) - first_chunk
+    if spans:
+        metadata["char_start"], metadata["char_end"] = np.asarray(spans).T
+    return all_chunks, metadata
+
+
+CHUNK_METADATA_DTYPE = np.dtype(
+    [
+        ("movie_idx", np.int32),
+        ("chunk_idx", np.int32),
+        ("total_chunks", np.int32),
+        ("char_start", np.int32),
+        ("char_end", np.int32),
+    ]
+)
 
-    def build_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
-        self.documents = documents
-        self.document_map = {}
-        for doc in documents:
-            self.document_map[doc["id"]] = doc
 
-        all_chunks = []
-        chunk_metadata = []
+def segment_starts(movie_idx: np.ndarray) -> np.ndarray:
+    """Start offset of each run of equal values in a sorted row array."""
+    if len(movie_idx) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, movie_idx[1:] != movie_idx[:-1]])
+
+
+def aggregate_chunk_scores(
+    scores: np.ndarray,
+    movie_idx: np.ndarray,
+    aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+    starts: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce chunk scores to one score per movie.
+
+    `movie_idx` must be sorted so each movie's chunks are contiguous;
+    `starts` are its `segment_starts` if already computed. Returns the movie
+    rows and their aggregated scores:
+
+    - "max": best chunk
+    - "top2_mean": mean of the two best chunks (the only chunk if just one)
+    - "softmax_sum": temperature-scaled log-sum-exp, a smooth max that also
+      rewards movies with several good chunks
+    """
+    if aggregation not in CHUNK_AGGREGATIONS:
+        raise ValueError(f"unknown chunk aggregation: {aggregation}")
+    if starts is None:
+        starts = segment_starts(movie_idx)
+    if len(starts) == 0:
+        return movie_idx[:0], scores[:0]
+    movies = movie_idx[starts]
+    best = np.maximum.reduceat(scores, starts)
+
+    if aggregation == "max":
+        return movies, best
+
+    counts = np.diff(np.r_[starts, len(scores)])
+    if aggregation == "top2_mean":
+        ranked = scores[np.lexsort((-scores, movie_idx))]
+        second = ranked[np.minimum(starts + 1, len(scores) - 1)]
+        second = np.where(counts > 1, second, best)
+        return movies, (best + second) / 2
+
+    t = CHUNK_SOFTMAX_TEMPERATURE
+    shifted = np.exp((scores - np.repeat(best, counts)) / t)
+    return movies, best + t * np.log(np.add.reduceat(shifted, starts))
 
-        for idx, doc in enumerate(documents):
-            text = doc.get("description", "")
-            if not text.strip():
-                continue
 
-            chunks = semantic_chunk(
-                text,
-                max_chunk_size=DEFAULT_SEMANTIC_CHUNK_SIZE,
-                overlap=DEFAULT_CHUNK_OVERLAP,
-            )
+class ChunkedSemanticSearch(SemanticSearch):
+    def __init__(
+        self, model_name: str = "all-MiniLM-L6-v2", persist_query_cache: bool = False
+    ) -> None:
+        super().__init__(model_name, persist_query_cache)
+        self.chunk_embeddings = None
+        self.chunk_metadata = None
+        self.chunk_ann_index: IVFIndex | None = None
+        self.chunk_quantized: QuantizedEmbeddings | None = None
+
+    def chunks_fingerprint(self) -> str:
+        """`documents_fingerprint` combined with the chunking parameters."""
+        params = f"{DEFAULT_SEMANTIC_CHUNK_SIZE}:{DEFAULT_CHUNK_OVERLAP}"
+        return hashlib.sha256(
+            self.documents.fingerprint + params.encode("utf-8")
+        ).hexdigest()
+
+    def build_chunk_embeddings(self, documents) -> np.ndarray:
+        """Chunk and embed the catalog in INGEST_BATCH_SIZE batches of movies;
+        chunking runs ahead of encoding on a bounded background queue."""
+        self._set_documents(documents)
+        metadata = []
+
+        def chunk_batches():
+            for start in range(0, len(self.documents), INGEST_BATCH_SIZE):
+                batch = self.documents[start : start + INGEST_BATCH_SIZE]
+                chunks, batch_metadata = chunk_documents(batch, start)
+                metadata.append(batch_metadata)
+                yield chunks
+
+        save_embeddings_stream(
+            CHUNK_EMBEDDINGS_PATH,
+            self._encode_batches(chunk_batches()),
+            self.model_name,
+            self.chunks_fingerprint(),
+        )
+        self.chunk_metadata = (
+            np.concatenate(metadata)
+            if metadata
+            else np.zeros(0, dtype=CHUNK_METADATA_DTYPE)
+        )
+        self._forget_rows(CHUNK_EMBEDDINGS_PATH)
+        self._forget_rows(CHUNK_METADATA_PATH)
+        self.chunk_metadata = self._save_rows(CHUNK_METADATA_PATH, self.chunk_metadata)
+        self.chunk_embeddings = load_embeddings_file(
+            CHUNK_EMBEDDINGS_PATH, self.model_name
+        )
+        self._row_files[CHUNK_EMBEDDINGS_PATH] = CHUNK_EMBEDDINGS_PATH
+        return self.chunk_embeddings
 
-            for i, chunk in enumerate(chunks):
-                all_chunks.append(chunk)
-                chunk_metadata.append(
-                    {"movie_idx": idx, "chunk_idx": i, "total_chunks": len(chunks)}
+    def save_chunk_embeddings(self) -> None:
+        fingerprint = self.chunks_fingerprint()
+        self.chunk_embeddings = self._save_embedding_rows(
+            CHUNK_EMBEDDINGS_PATH, self.chunk_embeddings, fingerprint
+        )
+        if self.chunk_ann_index is not None:
+            self.chunk_ann_index.save(CHUNK_ANN_INDEX_PATH, fingerprint)
+        if self.chunk_quantized is not None:
+            self.chunk_quantized.save(
+                quantized_path(CHUNK_EMBEDDINGS_PATH, self.chunk_quantized.method),
+                fingerprint,
+            )
+        self.chunk_metadata = self._save_rows(CHUNK_METADATA_PATH, self.chunk_metadata)
+
+    @property
+    def chunk_movie_idx(self) -> np.ndarray | None:
+        if self.chunk_metadata is None:
+            return None
+        return self.chunk_metadata["movie_idx"]
+
+    def _embed_documents_from(self, start: int) -> None:
+        super()._embed_documents_from(start)
+        if self.chunk_embeddings is None:
+            return
+        new_chunks, new_metadata = chunk_documents(self.documents[start:], start)
+        if not new_chunks:
+            return
+        new_embeddings = normalize_embeddings(self.embedding_cache.encode(new_chunks))
+        self.chunk_embeddings = self._append_rows(
+            CHUNK_EMBEDDINGS_PATH, self.chunk_embeddings, new_embeddings
+        )
+        if self.chunk_ann_index is not None:
+            self.chunk_ann_index = self.chunk_ann_index.add(new_embeddings)
+        if self.chunk_quantized is not None:
+            self.chunk_quantized = self.chunk_quantized.add(new_embeddings)
+        self.chunk_metadata = self._append_rows(
+            CHUNK_METADATA_PATH, self.chunk_metadata, new_metadata
+        )
+
+    def _keep_rows(self, rows: list[int]) -> None:
+        if self.chunk_embeddings is not None:
+            # rows are ascending, so remapped movie rows stay sorted
+            new_index = np.full(len(self.documents), -1, dtype=np.int32)
+            new_index[rows] = np.arange(len(rows), dtype=np.int32)
+            remapped = new_index[self.chunk_movie_idx]
+            keep = remapped >= 0
+            self.chunk_embeddings = self.chunk_embeddings[keep]
+            self.chunk_metadata = self.chunk_metadata[keep]
+            self.chunk_metadata["movie_idx"] = remapped[keep]
+            self._forget_rows(CHUNK_EMBEDDINGS_PATH)
+            self._forget_rows(CHUNK_METADATA_PATH)
+            kept_chunks = np.flatnonzero(keep)
+            if self.chunk_ann_index is not None:
+                self.chunk_ann_index = self.chunk_ann_index.keep_rows(kept_chunks)
+            if self.chunk_quantized is not None:
+                self.chunk_quantized = self.chunk_quantized.keep_rows(kept_chunks)
+        super()._keep_rows(rows)
+
+    def load_or_create_chunk_embeddings(self, documents) -> np.ndarray:
+        self._set_documents(documents)
+
+        chunk_embeddings = load_embeddings_file(
+            CHUNK_EMBEDDINGS_PATH, self.model_name, self.chunks_fingerprint()
+        )
+        if chunk_embeddings is not None and os.path.exists(CHUNK_METADATA_PATH):
+            chunk_metadata = np.load(CHUNK_METADATA_PATH, mmap_mode="r")
+            if chunk_metadata.dtype == CHUNK_METADATA_DTYPE and len(
+                chunk_metadata
+            ) == len(chunk_embeddings):
+                self.chunk_embeddings = chunk_embeddings
+                self.chunk_metadata = chunk_metadata
+                self._row_files[CHUNK_METADATA_PATH] = CHUNK_METADATA_PATH
+                if isinstance(chunk_embeddings, np.memmap):
+                    self._row_files[CHUNK_EMBEDDINGS_PATH] = CHUNK_EMBEDDINGS_PATH
+                return self.chunk_embeddings
+
+        return self.build_chunk_embeddings(self.documents)
+
+    def load_or_create_chunk_ann_index(self, n_lists: int | None = None) -> IVFIndex:
+        """Load the chunk ANN index, rebuilding it if missing or stale."""
+        self.chunk_ann_index = load_or_build_ann_index(
+            CHUNK_ANN_INDEX_PATH,
+            self.chunk_embeddings,
+            n_lists,
+            self.chunks_fingerprint(),
+        )
+        return self.chunk_ann_index
+
+    def load_or_create_chunk_quantized(
+        self, method: str = "int8"
+    ) -> QuantizedEmbeddings:
+        """Chunk counterpart of `load_or_create_quantized`."""
+        self.chunk_quantized = load_or_build_quantized(
+            CHUNK_EMBEDDINGS_PATH,
+            self.chunk_embeddings,
+            method,
+            self.chunks_fingerprint(),
+        )
+        return self.chunk_quantized
+
+    def top_movie_rows(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+        nprobe: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Rows of the `limit` best live movies by aggregated chunk score.
+
+        Also returns the row of each movie's best-scoring chunk.
+
+        With `nprobe` and a loaded chunk ANN index only chunks in the nprobe
+        closest lists are scored, so a movie is ranked on the chunks found.
+        Quantized codes shortlist movies by their best approximate chunks;
+        every candidate chunk of a shortlisted movie is then scored exactly,
+        so its aggregate is the one the float scan would give.
+        """
+        # read once, as in `top_rows`
+        ann_index, quantized = self.chunk_ann_index, self.chunk_quantized
+        rows = None
+        if nprobe is not None and ann_index is not None:
+            rows = ann_index.candidates(query_embedding, nprobe)
+        if quantized is not None:
+            deleted = None
+            if self.deleted_rows:
+                candidate_movies = (
+                    self.chunk_movie_idx if rows is None else self.chunk_movie_idx[rows]
                 )
-
-        self.chunk_embeddings = self.model.encode(all_chunks, show_progress_bar=True)
-        self.chunk_metadata = chunk_metadata
-
-        os.makedirs(os.path.dirname(CHUNK_EMBEDDINGS_PATH), exist_ok=True)
-        np.save(CHUNK_EMBEDDINGS_PATH, self.chunk_embeddings)
-        with open(CHUNK_METADATA_PATH, "w") as f:
-            json.dump(
-                {"chunks": chunk_metadata, "total_chunks": len(all_chunks)}, f, indent=2
+                deleted = np.isin(candidate_movies, list(self.deleted_rows))
+            shortlist = quantized_shortlist(
+                quantized, query_embedding, rows, limit, deleted
             )
-
-        return self.chunk_embeddings
-
-    def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
-        self.documents = documents
-        self.document_map = {}
-        for doc in documents:
-            self.document_map[doc["id"]] = doc
-
-        if os.path.exists(CHUNK_EMBEDDINGS_PATH) and os.path.exists(
-            CHUNK_METADATA_PATH
+            movies = np.unique(self.chunk_movie_idx[shortlist])
+            if rows is None:
+                rows = np.flatnonzero(np.isin(self.chunk_movie_idx, movies))
+            else:
+                rows = rows[np.isin(self.chunk_movie_idx[rows], movies)]
+
+        if rows is None:
+            chunk_scores = self.chunk_embeddings @ query_embedding
+        else:
+            chunk_scores = self.chunk_embeddings[rows] @ query_embedding
+        return self._top_movies(chunk_scores, rows, limit, aggregation)
+
+    def top_movie_rows_many(
+        self,
+        query_embeddings: np.ndarray,
+        limit: int,
+        aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+        nprobe: int | None = None,
+    ) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """`top_movie_rows` for each query; exact scans share one product."""
+        if self.chunk_quantized is not None or (
+            nprobe is not None and self.chunk_ann_index is not None
         ):
-            self.chunk_embeddings = np.load(CHUNK_EMBEDDINGS_PATH)
-            with open(CHUNK_METADATA_PATH, "r") as f:
-                data = json.load(f)
-                self.chunk_metadata = data["chunks"]
-            return self.chunk_embeddings
-
-        return self.build_chunk_embeddings(documents)
+            return [
+                self.top_movie_rows(q, limit, aggregation, nprobe)
+                for q in query_embeddings
+            ]
+        return [
+            self._top_movies(chunk_scores, None, limit, aggregation)
+            for block in query_blocks(query_embeddings)
+            for chunk_scores in block @ self.chunk_embeddings.T
+        ]
+
+    def _top_movies(
+        self,
+        chunk_scores: np.ndarray,
+        rows: np.ndarray | None,
+        limit: int,
+        aggregation: str,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Aggregate scores of the chunk `rows` (None: every chunk) per movie."""
+        # candidate rows are sorted, so movie segments stay contiguous
+        if rows is None:
+            chunk_movie_idx = self.chunk_movie_idx
+        else:
+            chunk_movie_idx = self.chunk_movie_idx[rows]
+        if self.deleted_rows:
+            live = ~np.isin(chunk_movie_idx, list(self.deleted_rows))
+            chunk_scores = chunk_scores[live]
+            chunk_movie_idx = chunk_movie_idx[live]
+            rows = np.flatnonzero(live) if rows is None else rows[live]
+
+        starts = segment_starts(chunk_movie_idx)
+        movie_indices, scores = aggregate_chunk_scores(
+            chunk_scores, chunk_movie_idx, aggregation, starts
+        )
+        top = top_k_indices(scores, limit)
+        ends = np.r_[starts[1:], len(chunk_scores)]
+        best_chunks = np.array(
+            [
+                starts[i] + int(np.argmax(chunk_scores[starts[i] : ends[i]]))
+                for i in top
+            ],
+            dtype=np.int64,
+        )
+        if rows is not None:
+            best_chunks = rows[best_chunks]
+        return movie_indices[top], scores[top], best_chunks
+
+    def search_chunks(
+        self,
+        query: str,
+        limit: int = 10,
+        aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+        nprobe: int | None = None,
+    ) -> list[SearchHit]:
+        self._check_chunks_loaded()
+        if nprobe is None and self.chunk_ann_index is not None:
+            nprobe = ANN_NPROBE
+        query_embedding = normalize_embeddings(self.generate_embedding(query))
+        return self._chunk_hits(
+            *self.top_movie_rows(query_embedding, limit, aggregation, nprobe)
+        )
+
+    def search_chunks_many(
+        self,
+        queries: list[str],
+        limit: int = 10,
+        aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+        nprobe: int | None = None,
+    ) -> list[list[SearchHit]]:
+        """`search_chunks` for several queries with one batched encode."""
+        self._check_chunks_loaded()
+        if not queries:
+            return []
+        if nprobe is None and self.chunk_ann_index is not None:
+            nprobe = ANN_NPROBE
+        query_embeddings = normalize_embeddings(self.generate_embeddings(queries))
+        return [
+            self._chunk_hits(*top)
+            for top in self.top_movie_rows_many(
+                query_embeddings, limit, aggregation, nprobe
+            )
+        ]
 
-    def search_chunks(self, query: str, limit: int = 10) -> list[dict]:
-        if self.chunk_embeddings is None or self.chunk_metadata is None:
+    def _check_chunks_loaded(self) -> None:
+        if self.chunk_embeddings is None or self.chunk_movie_idx is None:
             raise ValueError(
                 "No chunk embeddings loaded. Call load_or_create_chunk_embeddings first."
             )
 
-        query_embedding = self.generate_embedding(query)
-
-        chunk_scores = []
-        for i, chunk_embedding in enumerate(self.chunk_embeddings):
-            similarity = cosine_similarity(query_embedding, chunk_embedding)
-            chunk_scores.append(
-                {
-                    "chunk_idx": i,
-                    "movie_idx": self.chunk_metadata[i]["movie_idx"],
-                    "score": similarity,
-                }
-            )
-
-        movie_scores = {}
-        for chunk_score in chunk_scores:
-            movie_idx = chunk_score["movie_idx"]
-            if (
-                movie_idx not in movie_scores
-                or chunk_score["score"] > movie_scores[movie_idx]
-            ):
-                movie_scores[movie_idx] = chunk_score["score"]
-
-        sorted_movies = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)
-
-        results = []
-        for movie_idx, score in sorted_movies[:limit]:
-            doc = self.documents[movie_idx]
-            results.append(
-                format_search_result(
-                    doc_id=doc["id"],
-                    title=doc["title"],
-                    document=doc["description"][:DOCUMENT_PREVIEW_LENGTH],
-                    score=score,
+    def _chunk_hits(
+        self, movie_indices: np.ndarray, scores: np.ndarray, best_chunks: np.ndarray
+    ) -> list[SearchHit]:
+        hits = []
+        for movie_idx, score, chunk in zip(
+            movie_indices.tolist(), scores.tolist(), best_chunks.tolist()
+        ):
+            meta = self.chunk_metadata[chunk]
+            hits.append(
+                SearchHit(
+                    self.documents,
+                    movie_idx,
+                    score,
+                    {"chunk_idx": int(meta["chunk_idx"])},
+                    preview=DOCUMENT_PREVIEW_LENGTH,
+                    passage=(meta["char_start"], meta["char_end"]),
                 )
             )
-
-        return results
-
-
-def embed_chunks_command() -> np.ndarray:
-    movies = load_movies()
-    searcher = ChunkedSemanticSearch()
-    return searcher.load_or_create_chunk_embeddings(movies)
+        return hits
 
 
-def search_chunked_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
-    movies = load_movies()
+def embed_chunks_command(catalog_path: str | None = None) -> np.ndarray:
+    movies = load_doc_store(catalog_path)
     searcher = ChunkedSemanticSearch()
-    searcher.load_or_create_chunk_embeddings(movies)
-    results = searcher.search_chunks(query, limit)
-    return {"query": query, "results": results}
+    embeddings = searcher.load_or_create_chunk_embeddings(movies)
+    print_embedding_cache_stats(searcher.embedding_cache.stats())
+    return embeddings
+
+
+def search_chunked_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    aggregation: str = DEFAULT_CHUNK_AGGREGATION,
+    nprobe: int | None = None,
+    quantization: str | None = None,
+    searcher: ChunkedSemanticSearch | None = None,
+) -> dict:
+    if searcher is None:
+        searcher = ChunkedSemanticSearch(persist_query_cache=True)
+        searcher.load_or_create_chunk_embeddings(load_doc_store())
+        if nprobe is not None:
+            searcher.load_or_create_chunk_ann_index()
+        if quantization is not None:
+            searcher.load_or_create_chunk_quantized(quantization)
+    hits = searcher.search_chunks(query, limit, aggregation, nprobe)
+    return {"query": query, "results": hits_to_dicts(hits)}
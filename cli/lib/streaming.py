@@ -0,0 +1,221 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+from .search_utils import DATA_PATH, INGEST_QUEUE_SIZE, JSON_READ_CHUNK
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """A text file read in fixed-size chunks, with a sliding buffer that
+    `raw_decode` can parse values from."""
+
+    def __init__(self, f, chunk_size: int) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character without consuming it ("" at EOF)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} in catalog at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode one JSON value, reading more of the file until it is whole."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number can be cut off at the end of the buffer and still parse
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(
+    path: str, key: str, chunk_size: int = JSON_READ_CHUNK, others: dict | None = None
+) -> Iterator:
+    """Yield the elements of the array under `key` in a top-level JSON object.
+
+    Only one element and one read chunk are held in memory at a time; the
+    values of other keys are parsed and dropped, or collected into `others`
+    in file order (with `key` itself mapped to None to mark its place).
+    """
+    with open(path, "r") as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("{")
+        while reader.peek() != "}":
+            name = reader.value()
+            reader.expect(":")
+            if name != key:
+                value = reader.value()
+                if others is not None:
+                    others[name] = value
+            else:
+                if others is not None:
+                    others[name] = None
+                reader.expect("[")
+                while reader.peek() != "]":
+                    yield reader.value()
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                reader.pos += 1
+            if reader.peek() == ",":
+                reader.pos += 1
+
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_movies(path: str = DATA_PATH) -> Iterator[dict]:
+    """Stream catalog entries from a .jsonl file (one movie per line) or
+    from a `{"movies": [...]}` file, without loading the whole catalog."""
+    if path.endswith(".jsonl"):
+        return iter_jsonl(path)
+    return iter_json_array(path, "movies")
+
+
+def save_movies(movies: Iterable[dict], path: str = DATA_PATH) -> None:
+    """Write the catalog back to `path` in the format `iter_movies` reads,
+    one movie at a time.
+
+    A .json catalog keeps its other top-level keys and is laid out as
+    `json.dump(..., indent=2)` would; the file is replaced atomically.
+    """
+    tmp_path = f"{path}.tmp"
+    if path.endswith(".jsonl"):
+        with open(tmp_path, "w") as f:
+            for movie in movies:
+                f.write(json.dumps(movie) + "\n")
+        os.replace(tmp_path, path)
+        return
+
+    others = {"movies": None}
+    if os.path.exists(path):
+        others = {}
+        for _ in iter_json_array(path, "movies", others=others):
+            pass
+        others.setdefault("movies", None)
+    with open(tmp_path, "w") as f:
+        f.write("{")
+        for i, (name, value) in enumerate(others.items()):
+            f.write(("," if i else "") + f"\n  {json.dumps(name)}: ")
+            if name != "movies":
+                f.write(_indented(value))
+                continue
+            count = 0
+            for movie in movies:
+                f.write(("," if count else "[") + "\n    " + _indented(movie, 4))
+                count += 1
+            f.write("\n  ]" if count else "[]")
+        f.write("\n}")
+    os.replace(tmp_path, path)
+
+
+def _indented(value, depth: int = 2) -> str:
+    return json.dumps(value, indent=2).replace("\n", "\n" + " " * depth)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def prefetched(items: Iterable, maxsize: int = INGEST_QUEUE_SIZE) -> Iterator:
+    """Produce `items` on a background thread, at most `maxsize` ahead.
+
+    The bounded queue is the backpressure: the producer blocks while the
+    consumer is still busy with earlier items, so parsing, chunking or
+    tokenizing the next batch overlaps encoding of the current one without
+    the pipeline ever holding more than `maxsize` batches.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failed(e))
+            return
+        put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while (item := buffer.get()) is not _DONE:
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        # a consumer that stops early must not leave the producer blocked
+        stop.set()
+        producer.join()
+
+
+def bounded_map(executor, fn, items: Iterable, max_pending: int) -> Iterator:
+    """`executor.map` that submits at most `max_pending` items ahead of the
+    results consumed, instead of queueing the whole iterable up front."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
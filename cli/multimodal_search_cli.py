@@ -1,6 +1,9 @@
 import argparse
+import os
 import sys
 from lib.multimodal_search import verify_image_embedding, image_search_command
+from lib.search_client import request_search
+from lib.search_utils import QUANTIZATION_METHODS, SEARCH_SERVER_URL
 
 def main():
     parser = argparse.ArgumentParser(description="Multimodal Search CLI Tools")
@@ -11,6 +14,8 @@ def main():
 
     search_parser = subparsers.add_parser("image_search")
     search_parser.add_argument("image_path", type=str)
+    search_parser.add_argument("--quantization", choices=QUANTIZATION_METHODS, default=None)
+    search_parser.add_argument("--server", nargs="?", const=SEARCH_SERVER_URL, default=None, metavar="URL", help=f"Forward to a running search server (default URL: {SEARCH_SERVER_URL})")
 
     args = parser.parse_args()
 
@@ -18,7 +23,12 @@ def main():
         verify_image_embedding(args.image_path)
     
     elif args.command == "image_search":
-        results = image_search_command(args.image_path)
+        if args.server:
+            # the server opens the image itself, so send an absolute path
+            payload = {"image_path": os.path.abspath(args.image_path), "quantization": args.quantization}
+            results = request_search("image_search", payload, args.server)["results"]
+        else:
+            results = image_search_command(args.image_path, args.quantization)
         
         for i, res in enumerate(results, 1):
             truncated_score = int(res['score'] * 1000) / 1000
@@ -0,0 +1,36 @@
+import argparse
+
+from lib.search_server import serve
+from lib.search_utils import SEARCH_SERVER_HOST, SEARCH_SERVER_PORT
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search Server CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Keep the searchers loaded and answer --server requests"
+    )
+    serve_parser.add_argument(
+        "--host", type=str, default=SEARCH_SERVER_HOST, help="Address to bind"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=SEARCH_SERVER_PORT, help="Port to listen on"
+    )
+    serve_parser.add_argument(
+        "--multimodal",
+        action="store_true",
+        help="Load the CLIP model at startup instead of on the first image search",
+    )
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "serve":
+            serve(args.host, args.port, args.multimodal)
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
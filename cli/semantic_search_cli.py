@@ -2,17 +2,26 @@
 
 import argparse
 
+from lib.search_client import request_search
 from lib.semantic_search import (
     chunk_text,
     embed_chunks_command,
     embed_query_text,
     embed_text,
+    print_embedding_cache_stats,
     search_chunked_command,
     semantic_chunk_text,
-    semantic_search,
+    semantic_search_command,
     verify_embeddings,
     verify_model,
 )
+from lib.search_utils import (
+    CATALOG_HELP,
+    CHUNK_AGGREGATIONS,
+    DEFAULT_CHUNK_AGGREGATION,
+    QUANTIZATION_METHODS,
+    SEARCH_SERVER_URL,
+)
 
 
 def main() -> None:
@@ -26,9 +35,10 @@ def main() -> None:
     )
     single_embed_parser.add_argument("text", type=str, help="Text to embed")
 
-    subparsers.add_parser(
+    verify_embeddings_parser = subparsers.add_parser(
         "verify_embeddings", help="Verify embeddings for the movie dataset"
     )
+    verify_embeddings_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
 
     embed_query_parser = subparsers.add_parser(
         "embedquery", help="Generate an embedding for a search query"
@@ -42,6 +52,26 @@ def main() -> None:
     search_parser.add_argument(
         "--limit", type=int, default=5, help="Number of results to return"
     )
+    search_parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=None,
+        help="Search an IVF ANN index, scanning this many lists (default: exact)",
+    )
+    search_parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATION_METHODS,
+        default=None,
+        help="Scan compressed codes first, then re-score in float",
+    )
+    search_parser.add_argument(
+        "--server",
+        nargs="?",
+        const=SEARCH_SERVER_URL,
+        default=None,
+        metavar="URL",
+        help=f"Forward to a running search server (default URL: {SEARCH_SERVER_URL})",
+    )
 
     chunk_parser = subparsers.add_parser(
         "chunk", help="Split text into fixed-size chunks with optional overlap"
@@ -74,9 +104,10 @@ def main() -> None:
         help="Number of sentences to overlap between chunks",
     )
 
-    subparsers.add_parser(
+    embed_chunks_parser = subparsers.add_parser(
         "embed_chunks", help="Generate embeddings for chunked documents"
     )
+    embed_chunks_parser.add_argument("--catalog", type=str, help=CATALOG_HELP)
 
     search_chunked_parser = subparsers.add_parser(
         "search_chunked", help="Search using chunked embeddings"
@@ -85,6 +116,32 @@ def main() -> None:
     search_chunked_parser.add_argument(
         "--limit", type=int, default=5, help="Number of results to return"
     )
+    search_chunked_parser.add_argument(
+        "--aggregation",
+        choices=CHUNK_AGGREGATIONS,
+        default=DEFAULT_CHUNK_AGGREGATION,
+        help="How chunk scores combine into a movie score",
+    )
+    search_chunked_parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=None,
+        help="Search an IVF ANN index, scanning this many lists (default: exact)",
+    )
+    search_chunked_parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATION_METHODS,
+        default=None,
+        help="Scan compressed codes first, then re-score in float",
+    )
+    search_chunked_parser.add_argument(
+        "--server",
+        nargs="?",
+        const=SEARCH_SERVER_URL,
+        default=None,
+        metavar="URL",
+        help=f"Forward to a running search server (default URL: {SEARCH_SERVER_URL})",
+    )
 
     args = parser.parse_args()
 
@@ -94,25 +151,67 @@ def main() -> None:
         case "embed_text":
             embed_text(args.text)
         case "verify_embeddings":
-            verify_embeddings()
+            verify_embeddings(args.catalog)
         case "embedquery":
             embed_query_text(args.query)
         case "search":
-            semantic_search(args.query, args.limit)
+            if args.server:
+                result = request_search(
+                    "search",
+                    {
+                        "query": args.query,
+                        "limit": args.limit,
+                        "nprobe": args.nprobe,
+                        "quantization": args.quantization,
+                    },
+                    args.server,
+                )
+            else:
+                result = semantic_search_command(
+                    args.query, args.limit, args.nprobe, args.quantization
+                )
+            print(f"Query: {result['query']}")
+            print(f"Top {len(result['results'])} results:")
+            print()
+            for i, res in enumerate(result["results"], 1):
+                print(f"{i}. {res['title']} (score: {res['score']:.4f})")
+                print(f"   {res['description'][:100]}...")
+                print()
+            print_embedding_cache_stats(result["query_cache"], "Query cache")
         case "chunk":
             chunk_text(args.text, args.chunk_size, args.overlap)
         case "semantic_chunk":
             semantic_chunk_text(args.text, args.max_chunk_size, args.overlap)
         case "embed_chunks":
-            embeddings = embed_chunks_command()
+            embeddings = embed_chunks_command(args.catalog)
             print(f"Generated {len(embeddings)} chunked embeddings")
         case "search_chunked":
-            result = search_chunked_command(args.query, args.limit)
+            if args.server:
+                result = request_search(
+                    "search_chunked",
+                    {
+                        "query": args.query,
+                        "limit": args.limit,
+                        "aggregation": args.aggregation,
+                        "nprobe": args.nprobe,
+                        "quantization": args.quantization,
+                    },
+                    args.server,
+                )
+            else:
+                result = search_chunked_command(
+                    args.query,
+                    args.limit,
+                    args.aggregation,
+                    args.nprobe,
+                    args.quantization,
+                )
             print(f"Query: {result['query']}")
             print("Results:")
             for i, res in enumerate(result["results"], 1):
                 print(f"\n{i}. {res['title']} (score: {res['score']:.4f})")
                 print(f"   {res['document']}...")
+                print(f"   Passage: {res['metadata']['passage']}")
         case _:
             parser.print_help()
 
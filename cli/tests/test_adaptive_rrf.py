@@ -0,0 +1,59 @@
+"""Adaptive-depth RRF must return exactly what fusing the full legs does."""
+
+import numpy as np
+import pytest
+
+from lib.doc_store import DocStore
+from lib.hybrid_search import HybridSearch, fused_hits
+from lib.search_utils import HYBRID_LEGS, SearchHit
+
+N_DOCS = 1000
+LIMIT = 5
+K = 60
+
+
+class FixedLegs(HybridSearch):
+    """HybridSearch over precomputed leg rankings, cut at each depth."""
+
+    def __init__(self, docs: DocStore, rankings: dict[str, np.ndarray]) -> None:
+        self.documents = docs
+        self.rankings = rankings
+        self.degraded_legs = []
+        self.last_depth = {}
+        self.depth_stats = {"queries": 0, "rounds": 0, "total_depth": 0, "max_depth": 0}
+
+    def _retrieve(self, query, depth, timeouts=None):
+        return tuple(
+            [SearchHit(self.documents, int(row), 0.0) for row in rows[:depth]]
+            for rows in (self.rankings[name] for name in HYBRID_LEGS)
+        )
+
+
+def query_rankings(rng: np.random.Generator) -> dict[str, np.ndarray]:
+    # BM25 matches a subset of the catalog; semantic ranks all of it. The
+    # legs agree more or less, so some queries settle in the first round and
+    # others need every round, and mirrored ranks make fused scores tie.
+    base = rng.permutation(N_DOCS)
+    matched = base[: rng.integers(LIMIT, N_DOCS)]
+    swaps = rng.integers(0, rng.choice([4, 100, N_DOCS]), size=N_DOCS)
+    semantic = base[np.argsort(np.arange(N_DOCS) + swaps, kind="stable")]
+    bm25 = matched[np.argsort(np.arange(len(matched)) - swaps[: len(matched)])]
+    return {"bm25": bm25, "semantic": semantic}
+
+
+@pytest.fixture(scope="module")
+def docs() -> DocStore:
+    return DocStore.from_documents(
+        [{"id": i, "title": f"t{i}", "description": ""} for i in range(N_DOCS)]
+    )
+
+
+def test_adaptive_rrf_matches_full_depth(docs):
+    rng = np.random.default_rng(0)
+    for query in range(200):
+        search = FixedLegs(docs, query_rankings(rng))
+        fuse, _ = search._rrf_round(K, LIMIT)
+        legs = search._retrieve(query, N_DOCS)
+        full = fused_hits(fuse(legs), dict(zip(HYBRID_LEGS, legs)), LIMIT)
+        adaptive = search.rrf_search(str(query), K, LIMIT)
+        assert [hit.id for hit in adaptive] == [hit.id for hit in full], query
@@ -0,0 +1,58 @@
+import numpy as np
+
+from lib.embedding_store import (
+    append_array_rows,
+    commit_array_rows,
+    commit_embeddings_file,
+    read_manifest,
+    save_array,
+    save_embeddings_file,
+)
+
+
+def test_appended_rows_are_hidden_until_committed(tmp_path):
+    path = str(tmp_path / "rows.npy")
+    base = np.arange(12, dtype=np.float32).reshape(4, 3)
+    save_array(path, base)
+
+    extended = append_array_rows(path, 4, np.ones((2, 3), dtype=np.float32))
+    assert extended.shape == (6, 3)
+    assert np.array_equal(np.load(path), base)
+
+    commit_array_rows(path, 6)
+    assert np.array_equal(np.load(path), np.vstack([base, np.ones((2, 3))]))
+
+
+def test_uncommitted_rows_are_overwritten(tmp_path):
+    path = str(tmp_path / "rows.npy")
+    save_array(path, np.zeros((2, 2), dtype=np.float32))
+    append_array_rows(path, 2, np.ones((3, 2), dtype=np.float32))
+
+    extended = append_array_rows(path, 2, np.full((1, 2), 7, dtype=np.float32))
+    commit_array_rows(path, 3)
+    assert np.array_equal(extended, np.load(path))
+    assert np.load(path)[2].tolist() == [7, 7]
+
+
+def test_structured_rows_commit_from_working_file(tmp_path):
+    path = str(tmp_path / "meta.npy")
+    work = f"{path}.work"
+    dtype = np.dtype([("movie_idx", "<i4"), ("start", "<i4")])
+    save_array(path, np.zeros(1, dtype=dtype))
+    save_array(work, np.array([(5, 1)], dtype=dtype))
+
+    append_array_rows(work, 1, np.array([(6, 2)], dtype=dtype))
+    commit_array_rows(path, 2, work)
+    assert np.load(path)["movie_idx"].tolist() == [5, 6]
+    assert not (tmp_path / "meta.npy.work").exists()
+
+
+def test_commit_embeddings_updates_manifest(tmp_path):
+    path = str(tmp_path / "embeddings.npy")
+    save_embeddings_file(path, np.eye(3, dtype=np.float32), "model", "a")
+    append_array_rows(path, 3, np.eye(3, dtype=np.float32)[:1])
+    commit_embeddings_file(path, 4, "model", "b")
+
+    manifest = read_manifest(path)
+    assert (manifest["rows"], manifest["fingerprint"]) == (4, "b")
+    assert np.load(path).shape == (4, 3)
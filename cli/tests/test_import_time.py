@@ -0,0 +1,65 @@
+"""The keyword search path must start without the model and Gemini libraries.
+
+Each check runs in a fresh interpreter under `python -X importtime`, so
+modules imported by earlier tests cannot hide a regression.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+CLI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STOPWORDS_PATH = os.path.join(os.path.dirname(CLI_DIR), "data", "stopwords.txt")
+HEAVY_MODULES = ("torch", "sentence_transformers", "google.genai")
+
+BM25_SEARCH = """
+from lib.doc_store import DocStore
+from lib.keyword_search import InvertedIndex
+
+docs = DocStore.from_documents([
+    {"id": 1, "title": "Space Adventure", "description": "A crew explores space."},
+    {"id": 2, "title": "Love Story", "description": "Two people fall in love."},
+])
+idx = InvertedIndex(documents=docs)
+idx.add_movies(list(docs))
+idx.compact()
+hits = idx.bm25_search("space", 2)
+assert hits[0].to_dict()["id"] == 1, hits
+"""
+
+
+def imported_modules(*args: str) -> set[str]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=CLI_DIR,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            modules.add(line.rsplit("|", 1)[-1].strip())
+    return modules
+
+
+def heavy_imports(modules: set[str]) -> list[str]:
+    return sorted(
+        module
+        for module in modules
+        for heavy in HEAVY_MODULES
+        if module == heavy or module.startswith(f"{heavy}.")
+    )
+
+
+def test_keyword_cli_import_skips_models():
+    assert heavy_imports(imported_modules("-c", "import keyword_search_cli")) == []
+
+
+@pytest.mark.skipif(
+    not os.path.exists(STOPWORDS_PATH), reason="data/stopwords.txt is missing"
+)
+def test_bm25_search_skips_models():
+    assert heavy_imports(imported_modules("-c", BM25_SEARCH)) == []
@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+
+from lib import embedding_cache
+from lib.embedding_cache import QueryEmbeddingCache
+from lib.search_utils import QUERY_CACHE_FLUSH_ENTRIES
+
+
+class FakeModel:
+    def encode(self, texts):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_persisted_cache_flushes_after_new_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        embedding_cache, "get_sentence_transformer", lambda name: FakeModel()
+    )
+    cache = QueryEmbeddingCache("model", persist=True, cache_dir=str(tmp_path))
+    queries = [f"query {i}" for i in range(QUERY_CACHE_FLUSH_ENTRIES)]
+
+    cache.encode(queries[:-1])
+    assert not os.path.exists(cache.path)
+
+    cache.encode(queries[-1:])
+    with np.load(cache.path) as data:
+        assert sorted(data["keys"].tolist()) == sorted(queries)
+    assert [p for p in os.listdir(tmp_path) if "tmp" in p] == []
+
+    reloaded = QueryEmbeddingCache("model", persist=True, cache_dir=str(tmp_path))
+    assert np.array_equal(reloaded.encode(queries), cache.encode(queries))
+    assert reloaded.misses == 0
@@ -0,0 +1,21 @@
+import numpy as np
+
+from lib.semantic_search import top_k_indices
+
+
+def test_ties_are_broken_by_index():
+    scores = np.array([0.5, 0.9, 0.5, 0.9, 0.1, 0.5])
+    assert top_k_indices(scores, 4).tolist() == [1, 3, 0, 2]
+
+
+def test_shorter_result_is_prefix_of_longer():
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 20, size=2000).astype(np.float64)
+    full = top_k_indices(scores, len(scores))
+    for limit in (1, 5, 37, 200, 800, 1999):
+        assert top_k_indices(scores, limit).tolist() == full[:limit].tolist()
+
+
+def test_excluded_entries_are_never_returned():
+    scores = np.array([0.3, -np.inf, 0.3, -np.inf, 0.7])
+    assert top_k_indices(scores, 5, excluded=2).tolist() == [4, 0, 2]